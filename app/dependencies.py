@@ -1,60 +1,54 @@
-import json
-from pathlib import Path
 from typing import Optional
 import logging
+import weakref
 
 from pipelines.retrieval.search import Retriever
+from pipelines.rag.answer import RAGPipeline, get_pipeline
 from utils.logging import log_event, setup_logger
-
-DATASET_METADATA = Path("data/versions/dataset_manifest.json")
-INDEX_METADATA = Path("data/indexes/index_manifest.json")
+from utils.metadata import identity, DATASET_MANIFEST_PATH
 
 # Initialize a specific logger for this module to avoid circular imports
 dep_logger = setup_logger(name="dependencies", log_dir="./logs", level=logging.INFO)
 
 class AppState:
     retriever: Optional[Retriever] = None
-    dataset_hash: str = "unknown"
-    
+    pipeline: Optional[RAGPipeline] = None
+    # The retriever `pipeline` was built for; pipeline.retriever is only a weakref.proxy of it
+    pipeline_retriever: Optional[weakref.ref] = None
+    # Overrides the manifest hash when startup fell back (dev / emergency)
+    fallback_hash: Optional[str] = None
+
 state = AppState()
 
 def load_state():
     try:
-        if not DATASET_METADATA.exists():
-             log_event(dep_logger, logging.WARNING, "Dataset manifest not found", path=str(DATASET_METADATA))
+        snapshot = identity.refresh()
+
+        if not DATASET_MANIFEST_PATH.exists():
+             log_event(dep_logger, logging.WARNING, "Dataset manifest not found", path=str(DATASET_MANIFEST_PATH))
              # Fallback for dev
              state.retriever = Retriever()
-             state.dataset_hash = "dev_mode"
+             state.fallback_hash = "dev_mode"
              return
 
-        with DATASET_METADATA.open("r", encoding="utf-8") as f:
-            dataset_metadata = json.load(f)
-            
-        dataset_hash = dataset_metadata.get("dataset_hash", "unknown_hash")
-        
-        # Check index manifest if it exists
-        if INDEX_METADATA.exists():
-            with INDEX_METADATA.open("r", encoding="utf-8") as f:
-                index_metadata = json.load(f)
-            
-            idx_hash = index_metadata.get("dataset_hash")
-            if idx_hash and idx_hash != dataset_hash:
-                log_event(dep_logger, logging.WARNING, "Hash Mismatch", 
-                          dataset_hash=dataset_hash, index_hash=idx_hash)
-        else:
-             log_event(dep_logger, logging.WARNING, "Index manifest not found", path=str(INDEX_METADATA))
+        # Check index manifest lineage if it exists
+        if snapshot.index_hash == "unknown":
+             log_event(dep_logger, logging.WARNING, "Index manifest not found", path=str(identity.index_manifest))
+        elif snapshot.index_dataset_hash and snapshot.index_dataset_hash != snapshot.dataset_hash:
+            log_event(dep_logger, logging.WARNING, "Hash Mismatch",
+                      dataset_hash=snapshot.dataset_hash, index_hash=snapshot.index_dataset_hash)
 
         # Initialize Retriever
         retriever = Retriever()
-        
+
         state.retriever = retriever
-        state.dataset_hash = dataset_hash
-        
+        state.fallback_hash = None
+
     except Exception as e:
         log_event(dep_logger, logging.ERROR, "State Load Failed", error=str(e))
         # Emergency Fallback
         state.retriever = Retriever()
-        state.dataset_hash = "emergency_fallback"
+        state.fallback_hash = "emergency_fallback"
 
 def get_retriever() -> Retriever:
     if state.retriever is None:
@@ -62,5 +56,16 @@ def get_retriever() -> Retriever:
         load_state()
     return state.retriever
 
+def get_rag_pipeline() -> RAGPipeline:
+    # Shared with answer(retriever=...) callers in the same process
+    retriever = get_retriever()
+    if state.pipeline is None or state.pipeline_retriever is None or state.pipeline_retriever() is not retriever:
+        state.pipeline = get_pipeline(retriever)
+        state.pipeline_retriever = weakref.ref(retriever)
+    return state.pipeline
+
 def get_dataset_hash() -> str:
-    return state.dataset_hash
\ No newline at end of file
+    if state.fallback_hash:
+        return state.fallback_hash
+    # Served from the identity snapshot, refreshed only when the manifest changes
+    return identity.get().dataset_hash
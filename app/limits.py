@@ -0,0 +1,35 @@
+import threading
+
+
+class ConcurrencyLimiter:
+    """
+    Non-blocking admission control: at most `limit` requests hold a slot,
+    the rest are rejected immediately instead of queueing without bound.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, int(limit))
+        self.in_flight = 0
+        self._lock = threading.Lock()
+        self.counters = {"admitted": 0, "rejected": 0, "deadline_exceeded": 0}
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.in_flight >= self.limit:
+                self.counters["rejected"] += 1
+                return False
+            self.in_flight += 1
+            self.counters["admitted"] += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+
+    def record_timeout(self):
+        with self._lock:
+            self.counters["deadline_exceeded"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.counters, "in_flight": self.in_flight, "limit": self.limit}
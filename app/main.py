@@ -1,13 +1,18 @@
+import json
 import time
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import Depends, FastAPI, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import HTMLResponse, StreamingResponse
 from pathlib import Path
-from app.dependencies import get_dataset_hash, get_retriever, load_state
+from app.dependencies import get_dataset_hash, get_rag_pipeline, get_retriever, load_state, state
 from app.schemas import Citation, QueryRequest, QueryResponse, QueryMetrics, AnswerSentence
-from pipelines.rag.answer import answer 
 from app.metrics import RequestMetrics
+from app.limits import ConcurrencyLimiter
+from pipelines.rag.answer import load_serving_config
+from utils.mlflow_queue import get_run_log_queue
 from utils.logging import log_event, logging, setup_logger
 
 server_logger = setup_logger(
@@ -16,6 +21,10 @@ server_logger = setup_logger(
     level = logging.INFO
 )
 
+serving_config = load_serving_config()
+# Bounds concurrent LLM generations; requests over the limit get a fast 429
+llm_limiter = ConcurrencyLimiter(serving_config["max_concurrent_llm"])
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -24,12 +33,18 @@ async def lifespan(app: FastAPI):
     log_event(server_logger, logging.INFO, "Server Setup Initiated")
     try:
         load_state()
+        # Build the pipeline (LLM client, checkers) once, before the first request
+        get_rag_pipeline()
         log_event(server_logger, logging.INFO, "Server State Loaded Successfully")
     except Exception as e:
         log_event(server_logger, logging.CRITICAL, "Startup Error", error = str(e))
     yield
     
     log_event(server_logger, logging.INFO, "Server Shutdown Initiated")
+    # Flush buffered MLflow runs before the process exits
+    get_run_log_queue().close()
+    if state.pipeline is not None:
+        state.pipeline.close()
 
 app = FastAPI(
     title="Scholarly Research Assistant",
@@ -39,73 +54,53 @@ app = FastAPI(
 )
 
 @app.post("/query", response_model=QueryResponse)
-def query(
+async def query(
     req: QueryRequest,
-    retriever=Depends(get_retriever),
+    pipeline=Depends(get_rag_pipeline),
     dataset_hash: str = Depends(get_dataset_hash)
     
 ):
     start_time = time.time()
     metrics_tracker = RequestMetrics()
     
+    if not llm_limiter.try_acquire():
+        log_event(server_logger, logging.WARNING, "Query Rejected", reason="concurrency_limit", in_flight=llm_limiter.in_flight)
+        raise HTTPException(status_code=429, detail="Too many concurrent queries, retry shortly", headers={"Retry-After": "1"})
+    
+    deadline = min(req.timeout_sec or serving_config["deadline_sec"], serving_config["deadline_sec"])
     try:
-        result = answer(
-            query=req.query,
-            top_k=req.top_k,
-            mode=req.mode,
-            retriever=retriever,
-            eval_mode = req.eval_mode, 
-            relevant_papers = req.relevant_papers
+        # The LLM call is awaited; retrieval and verification run on the pipeline's executor
+        result = await asyncio.wait_for(
+            pipeline.aanswer(
+                query=req.query,
+                top_k=req.top_k,
+                mode=req.mode,
+                eval_mode = req.eval_mode, 
+                relevant_papers = req.relevant_papers,
+                nprobe = req.nprobe,
+                ef_search = req.ef_search
+            ),
+            timeout=deadline
         )
-        
-        total_time = metrics_tracker.total_time()
-        
-        ans_text = result.get("answer")
-        raw_citations = result.get("citations", [])
-        raw_sentences = result.get("answer_sentences", [])
-        
-        # Convert dictionary citations to Pydantic models
-        formatted_citations = [Citation(**c) for c in raw_citations]
-        
-        # Convert dictionary sentences to Pydantic models
-        formatted_sentences = [AnswerSentence(**s) for s in raw_sentences]
-        
-        duration = time.time() - start_time
-        
+    except asyncio.TimeoutError:
+        llm_limiter.record_timeout()
+        log_event(server_logger, logging.WARNING, "Query Deadline Exceeded", deadline=deadline)
+        raise HTTPException(status_code=503, detail=f"Query exceeded its {deadline:.0f}s deadline", headers={"Retry-After": "5"})
+    except Exception as e:
+        import traceback
         log_event(
-                    server_logger,
-                    logging.INFO,
-                    "Query Processed",
-                    duration=duration,
-                    citation_count=len(formatted_citations),
-                    has_answer=ans_text is not None,
-                )
-        
-        # Extract metrics
-        res_metrics = result.get("metrics", {})
-        
-        queryMetrics = QueryMetrics(
-            refused = res_metrics.get("refusal_triggered", 0.0) > 0.5,
-            refusal_reason = res_metrics.get("refusal_reason"),
-            confidence_score = res_metrics.get("confidence_score", 0.0),
-            total_latency = total_time, 
-            retrieval_latency = res_metrics.get("retrieval_latency", 0.0),
-            llm_latency = res_metrics.get("llm_latency", 0.0), 
-            retrieved_chunks = res_metrics.get("retrieved_chunks", 0),
-            truncated = res_metrics.get("truncated", False), 
-            dropped_sentences = res_metrics.get("unaligned_sentences", 0)
-        )
-
-        return QueryResponse(
-            query=req.query,
-            answer=ans_text,
-            answer_sentences=formatted_sentences,
-            citations=formatted_citations,
-            dataset_hash=dataset_hash,
-            index_hash=result.get("index_hash"),
-            run_id=result.get("run_id"),
-            metrics = queryMetrics
+            server_logger,
+            logging.ERROR,
+            "Query Execution Failed",
+            error=str(e),
+            traceback=traceback.format_exc(),
         )
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        llm_limiter.release()
+    
+    try:
+        return build_query_response(req, result, metrics_tracker.total_time(), dataset_hash, start_time)
 
     except Exception as e:
         import traceback
@@ -118,6 +113,150 @@ def query(
             traceback=traceback.format_exc(),
         )
         raise HTTPException(status_code=500, detail=str(e))
+
+def build_query_response(req: QueryRequest, result: dict, total_time: float, dataset_hash: str, start_time: float) -> QueryResponse:
+    """
+    Converts a pipeline result dict into the /query response model.
+    """
+    ans_text = result.get("answer")
+    raw_citations = result.get("citations", [])
+    raw_sentences = result.get("answer_sentences", [])
+    
+    # Convert dictionary citations to Pydantic models
+    formatted_citations = [Citation(**c) for c in raw_citations]
+    
+    # Convert dictionary sentences to Pydantic models
+    formatted_sentences = [AnswerSentence(**s) for s in raw_sentences]
+    
+    duration = time.time() - start_time
+    
+    log_event(
+                server_logger,
+                logging.INFO,
+                "Query Processed",
+                duration=duration,
+                citation_count=len(formatted_citations),
+                has_answer=ans_text is not None,
+            )
+    
+    # Extract metrics
+    res_metrics = result.get("metrics", {})
+    
+    queryMetrics = QueryMetrics(
+        refused = res_metrics.get("refusal_triggered", 0.0) > 0.5,
+        refusal_reason = res_metrics.get("refusal_reason"),
+        confidence_score = res_metrics.get("confidence_score", 0.0),
+        total_latency = total_time, 
+        retrieval_latency = res_metrics.get("retrieval_latency", 0.0),
+        llm_latency = res_metrics.get("llm_latency", 0.0), 
+        retrieved_chunks = res_metrics.get("retrieved_chunks", 0),
+        truncated = res_metrics.get("truncated", False), 
+        dropped_sentences = res_metrics.get("unaligned_sentences", 0),
+        cache_hit = res_metrics.get("cache_hit", False)
+    )
+
+    return QueryResponse(
+        query=req.query,
+        answer=ans_text,
+        answer_sentences=formatted_sentences,
+        citations=formatted_citations,
+        dataset_hash=dataset_hash,
+        index_hash=result.get("index_hash"),
+        log_record_id=result.get("log_record_id"),
+        cached_log_record_id=result.get("cached_log_record_id"),
+        metrics = queryMetrics
+    )
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data))}\n\n"
+
+@app.post("/query/stream")
+async def query_stream(
+    req: QueryRequest,
+    pipeline=Depends(get_rag_pipeline),
+    dataset_hash: str = Depends(get_dataset_hash)
+):
+    """
+    Server-sent events: retrieved, token, sentence (verified, with its
+    citations), retract (discard what was streamed so far), then a final
+    done (QueryResponse) or refusal, or error.
+    The concurrency slot is taken inside the stream, so it is held exactly
+    as long as the generator runs; with no free slot the stream is a single
+    error event with status 429.
+    """
+    start_time = time.time()
+    metrics_tracker = RequestMetrics()
+    deadline = min(req.timeout_sec or serving_config["deadline_sec"], serving_config["deadline_sec"])
+    
+    async def event_source():
+        if not llm_limiter.try_acquire():
+            log_event(server_logger, logging.WARNING, "Query Rejected", reason="concurrency_limit", in_flight=llm_limiter.in_flight, stream=True)
+            yield sse_event("error", {"status": 429, "detail": "Too many concurrent queries, retry shortly", "retry_after": 1})
+            return
+        
+        events = pipeline.astream(
+            query=req.query,
+            top_k=req.top_k,
+            mode=req.mode,
+            relevant_papers = req.relevant_papers,
+            confidence_threshold = 0.0,
+            nprobe = req.nprobe,
+            ef_search = req.ef_search
+        )
+        expires = time.monotonic() + deadline
+        try:
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(events.__anext__(), timeout=max(expires - time.monotonic(), 0.001))
+                except StopAsyncIteration:
+                    break
+                if event in ("done", "refusal"):
+                    data = build_query_response(req, data, metrics_tracker.total_time(), dataset_hash, start_time)
+                yield sse_event(event, data)
+        except asyncio.TimeoutError:
+            llm_limiter.record_timeout()
+            log_event(server_logger, logging.WARNING, "Query Deadline Exceeded", deadline=deadline, stream=True)
+            yield sse_event("error", {"status": 503, "detail": f"Query exceeded its {deadline:.0f}s deadline"})
+        except Exception as e:
+            import traceback
+            log_event(server_logger, logging.ERROR, "Query Stream Failed", error=str(e), traceback=traceback.format_exc())
+            yield sse_event("error", {"status": 500, "detail": str(e)})
+        finally:
+            await events.aclose()
+            llm_limiter.release()
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+        
+@app.get("/metrics/cache")
+def cache_metrics(retriever=Depends(get_retriever), pipeline=Depends(get_rag_pipeline)):
+    """
+    Hit / miss / eviction counters of the retrieval caches and the semantic
+    answer cache.
+    """
+    stats = retriever.cache_stats()
+    if pipeline.answer_cache is not None:
+        stats["answer_cache"] = pipeline.answer_cache.stats()
+    return stats
+        
+@app.get("/metrics/serving")
+def serving_metrics():
+    """
+    Admission counters of /query: in-flight, admitted, rejected (429) and
+    deadline-exceeded (503) requests.
+    """
+    return llm_limiter.stats()
+
+@app.get("/metrics/logging")
+def logging_metrics():
+    """
+    Queue depth and submitted / logged / sampled / shed / failed counters
+    of the background MLflow writer.
+    """
+    return get_run_log_queue().stats()
         
 UI_DIR = Path(__file__).parent / "ui"
 
@@ -1,12 +1,18 @@
 from typing import List, Optional, Literal
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 class QueryRequest(BaseModel):
     query: str
-    top_k: int = 10
+    # Honored per request by the shared retriever (no restart or reload needed)
+    top_k: int = Field(10, ge=1, le=100)
+    # Optional ANN search-time knobs (ignored by engines they don't apply to)
+    nprobe: Optional[int] = Field(None, ge=1, le=4096)
+    ef_search: Optional[int] = Field(None, ge=1, le=4096)
     mode: Literal["strict", "exploratory"] = "strict"
     eval_mode: bool = False
     relevant_papers: Optional[List[str]] = None
+    # Per-request deadline; capped by serving.deadline_sec
+    timeout_sec: Optional[float] = Field(None, gt=0, le=600)
 
 class Citation(BaseModel):
     citation_id: int
@@ -30,6 +36,8 @@ class QueryMetrics(BaseModel):
     retrieved_chunks: int = 0
     truncated: bool = False
     dropped_sentences: int = 0
+    # Served from the semantic answer cache
+    cache_hit: bool = False
 
 class QueryResponse(BaseModel):
     query: str
@@ -38,5 +46,8 @@ class QueryResponse(BaseModel):
     citations: List[Citation] = []
     dataset_hash: str
     index_hash: Optional[str] = None
-    run_id: Optional[str] = None
+    # Id of the query's MLflow run record (its log_record_id tag); the run itself is written in the background
+    log_record_id: Optional[str] = None
+    # Answer-cache hits log no run: the record of the run that produced the answer
+    cached_log_record_id: Optional[str] = None
     metrics: QueryMetrics
\ No newline at end of file
@@ -1,3 +1,34 @@
+function parseSSE(chunk) {
+  // One "event: x\ndata: {...}" block
+  let event = "message";
+  let data = "";
+  for (const line of chunk.split("\n")) {
+    if (line.startsWith("event:")) event = line.slice(6).trim();
+    else if (line.startsWith("data:")) data += line.slice(5).trim();
+  }
+  return { event, data: data ? JSON.parse(data) : null };
+}
+
+function renderFinal(responseBox, answerDiv, data, refused) {
+  const isTruncated = data.metrics && data.metrics.truncated;
+
+  if (refused) {
+    responseBox.className = "refusal";
+    responseBox.innerText = data.answer ?? (data.metrics && data.metrics.refusal_reason) ?? "Answer Refused (Unknown Reason).";
+    return;
+  }
+
+  responseBox.className = "success";
+  answerDiv.innerText = data.answer ?? "No Answer found.";
+
+  if (isTruncated) {
+    const warningDiv = document.createElement("div");
+    warningDiv.className = "trunction-warning";
+    warningDiv.innerText = `[WARNING] Answer Truncated due to weak evidence. (${data.metrics.dropped_sentences}) sentences dropped`;
+    responseBox.appendChild(warningDiv);
+  }
+}
+
 async function submitQuery() {
   const queryField = document.getElementById("query");
   const responseBox = document.getElementById("output");
@@ -5,16 +36,16 @@ async function submitQuery() {
 
   const queryValue = queryField.value.trim();
   if (!queryValue) return;
-  responseBox.innerText = "Thinking....";
-  
+
   submitBtn.disabled = true;
   submitBtn.innerText = "Processing...";
   responseBox.className = "";
-  responseBox.innerText = "Thinking...";
-  
+  responseBox.innerText = "Retrieving...";
+
   try {
-    const res = await fetch("/query", {
-      method: "POST", 
+    // Verified sentences are shown as they arrive (server-sent events)
+    const res = await fetch("/query/stream", {
+      method: "POST",
       headers: { "Content-Type": "application/json" },
       body: JSON.stringify({
         query: queryValue,
@@ -22,31 +53,49 @@ async function submitQuery() {
         mode: "strict"
       })
     });
-  
-    const data = await res.json();
-    
-    const isRefusal = (data.metrics && data.metrics.refused_count == 1) ||
-                      (data.answer && data.answer.includes("Refusal Triggered")) ||
-                      (data.answer && data.answer.includes("Answer Refused"));
-    
-    const isTruncated = data.metrics && data.metrics.truncated;
-    
-    responseBox.innerHTML = "";
-    
-    if (isRefusal) {
-      responseBox.className = "refusal";
-      responseBox.innerText = data.answer ?? "Answer Refused (Unknown Reason).";
-    } else {
-      responseBox.className = "success";
-      
-      const answerText = document.createTextNode(data.answer ?? "No Answer found.");
-      responseBox.appendChild(answerText);
-      
-      if (isTruncated) {
-        const warningDiv = document.createElement("div");
-        warningDiv.className = "trunction-warning";
-        warningDiv.innerText = `[WARNING] Answer Truncated due to weak evidence. (${data.metrics.dropped_sentences}) sentences dropped`;
-        responseBox.appendChild(warningDiv);
+
+    if (!res.ok) {
+      const err = await res.json().catch(() => ({}));
+      throw new Error(err.detail ?? `HTTP ${res.status}`);
+    }
+
+    const answerDiv = document.createElement("div");
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    let finished = false;
+
+    while (!finished) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const { event, data } = parseSSE(buffer.slice(0, boundary));
+        buffer = buffer.slice(boundary + 2);
+
+        if (event === "retrieved") {
+          responseBox.innerText = "Thinking...";
+        } else if (event === "sentence") {
+          if (!answerDiv.parentNode) {
+            responseBox.innerHTML = "";
+            responseBox.appendChild(answerDiv);
+          }
+          answerDiv.innerText += (answerDiv.innerText ? " " : "") + data.text;
+        } else if (event === "retract") {
+          // The server withdrew what it streamed (retry or refusal)
+          answerDiv.innerText = "";
+          responseBox.innerHTML = "";
+          responseBox.innerText = "Thinking...";
+        } else if (event === "done" || event === "refusal") {
+          responseBox.innerHTML = "";
+          responseBox.appendChild(answerDiv);
+          renderFinal(responseBox, answerDiv, data, event === "refusal");
+          finished = true;
+        } else if (event === "error") {
+          throw new Error(data.detail);
+        }
       }
     }
   } catch(err) {
@@ -1,13 +1,17 @@
 import pandas as pd
 import numpy as np
 import os
-from pipelines.rag.answer import answer 
+from typing import Optional
+from evaluation.result_store import ResultStore, get_result_store
 
-def evaluate_citation(queries):
+def evaluate_citation(queries, store: Optional[ResultStore] = None):
     """
     Runs RAG generation and evaluates citation quality + refusal correctness.
+    Answers already in the result store for the current index / prompt /
+    model are reused; new ones are recorded as they are produced.
     Returns schema-compliant metrics + artifact path.
     """
+    store = store or get_result_store()
     results = []
     
     citation_precisions = []
@@ -22,9 +26,8 @@ def evaluate_citation(queries):
         should_refuse = q.get("should_refuse", False)
         
         # Run RAG
-        response = answer(
-            query=query_text, 
-            eval_mode=True, 
+        response, _ = store.answer(
+            query_text, 
             relevant_papers=relevant_papers
         )
         
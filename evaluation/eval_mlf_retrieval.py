@@ -17,13 +17,14 @@ def evaluate_retrieval(queries, retriever_type="dense", k=10):
     
     print(f"Evaluating {len(queries)} queries...")
     
-    for q in queries:
+    # Search (one batched encode + FAISS call for the whole set)
+    batch_results = retriever.search_batch([q["query"] for q in queries], k=k)
+    
+    for q, search_res in zip(queries, batch_results):
         query_text = q["query"]
         # Convert to list for compatibility
         relevant_ids = list(set(q["relevant_papers"]))
         
-        # Search
-        search_res = retriever.search(query_text)
         retrieved_items = search_res["results"]
         retrieved_ids = [r["paper_id"] for r in retrieved_items]
         
@@ -50,11 +50,10 @@ def evaluate_retrieval():
     
     print(f"Starting Evaluation (k={top_k})...")
     
-    for q in queries:
-        if not q.get("relevant_papers"):
-            continue
-            
-        result = retriever.search(q["query"])
+    queries = [q for q in queries if q.get("relevant_papers")]
+    batch_results = retriever.search_batch([q["query"] for q in queries], k=top_k)
+    
+    for q, result in zip(queries, batch_results):
         retrieved = result["results"]
         
         p = precision_at_k(retrieved, q["relevant_papers"], top_k)
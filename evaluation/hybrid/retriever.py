@@ -20,9 +20,27 @@ class HybridRetriever:
         Returns:
             list: A list of normalized results.
         '''
-        dense_results = self.dense.search(query)
-        bm_25_results = self.bm25.search(query, k)
+        dense_results = self.dense.search(query, k=k)
+        return self._fuse(dense_results, self.bm25.search(query, k), k)
+    
+    def search_batch(self, queries, k=10):
+        '''
+        Hybrid search for many queries; the dense side runs as one batched call.
+        
+        Args:
+            queries (list): The search queries.
+            k (int): The number of results to return per query.
         
+        Returns:
+            list: One list of normalized results per query.
+        '''
+        dense_batch = self.dense.search_batch(queries, k=k)
+        return [
+            self._fuse(dense_results, self.bm25.search(query, k), k)
+            for query, dense_results in zip(queries, dense_batch)
+        ]
+    
+    def _fuse(self, dense_results, bm_25_results, k):
         dense = [normalize_result(r) for r in dense_results["results"]]
         bm_25 = [normalize_result(r) for r in bm_25_results]
         
@@ -18,9 +18,9 @@ def main():
     p_scores = []
     r_scores = []
     
-    for q in queries:
-        results = hybrid.search(q["query"], k=top_k)
-        
+    batch_results = hybrid.search_batch([q["query"] for q in queries], k=top_k)
+    
+    for q, results in zip(queries, batch_results):
         p = precision_at_k(results, q["relevant_papers"], k=top_k)
         r = recall_at_k(results, q["relevant_papers"], k=top_k)
         
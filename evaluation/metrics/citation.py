@@ -1,8 +1,8 @@
 import time
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from evaluation.hybrid.retriever import HybridRetriever
-from pipelines.rag.answer import answer
+from evaluation.result_store import ResultStore, get_result_store
 from pipelines.retrieval.search import Retriever
 
 
@@ -22,14 +22,14 @@ def extract_cited_papers(citations: List[str]) -> List[str]:
 
 
 def evaluate_citations(
-    queries: List[Dict], retriever: Retriever | HybridRetriever, cache: Dict, confidence_threshold: float = 0.0
+    queries: List[Dict], retriever: Retriever | HybridRetriever, store: Optional[ResultStore] = None, confidence_threshold: float = 0.0
 ) -> Dict:
     """
     Evaluates the citation performance of a given retriever.
     Args:
         queries: List of queries.
         retriever: Retriever to evaluate.
-        cache: Cache to store results.
+        store: Result store answers are reused from and recorded to.
     Returns:
         Evaluation metrics.
     """
@@ -37,32 +37,21 @@ def evaluate_citations(
     total = 0
     total_confidence = 0.0
     confidence_count = 0
+    store = store or get_result_store()
 
     for q in queries:
         if q["should_refuse"]:
             continue
 
-        cache_key = f"{q['id']}::strict"
-        
-        use_cache = False
-        if cache_key in cache:
-            cached_metrics = cache[cache_key].get("metrics", {})
-            if "confidence_score" in cached_metrics:
-                use_cache = True
-        
-        if use_cache:
-            out = cache[cache_key]
-        else:
-            print(f"Processing: {q['query']}")
-            out = answer(
-                q["query"], 
-                mode="strict", 
-                retriever=retriever,
-                eval_mode=True,
-                relevant_papers=q.get("relevant_papers", []),
-                confidence_threshold=confidence_threshold
-            )
-            cache[cache_key] = out
+        out, stored = store.answer(
+            q["query"], 
+            mode="strict", 
+            retriever=retriever,
+            relevant_papers=q.get("relevant_papers", []),
+            confidence_threshold=confidence_threshold
+        )
+        if not stored:
+            print(f"Processed: {q['query']}")
             time.sleep(3)
 
         if not out.get("citations"):
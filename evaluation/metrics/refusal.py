@@ -1,17 +1,17 @@
 import time
-from typing import Dict, List
+from typing import Dict, List, Optional
 
 from evaluation.hybrid.retriever import HybridRetriever
-from pipelines.rag.answer import answer
+from evaluation.result_store import ResultStore, get_result_store
 from pipelines.retrieval.search import Retriever
 
-def evaluate_refusals(queries: List[Dict], retriever: Retriever|HybridRetriever, cache: Dict, confidence_threshold: float = 0.0) -> Dict:
+def evaluate_refusals(queries: List[Dict], retriever: Retriever|HybridRetriever, store: Optional[ResultStore] = None, confidence_threshold: float = 0.0) -> Dict:
     '''
     Evaluates the refusal performance of a given retriever.
     Args:
         queries: List of queries.
         retriever: Retriever to evaluate.
-        cache: Cache to store results.
+        store: Result store answers are reused from and recorded to.
     Returns:
         Evaluation metrics.
     '''
@@ -19,31 +19,20 @@ def evaluate_refusals(queries: List[Dict], retriever: Retriever|HybridRetriever,
     total = 0
     confidence_refusal_count = 0
     per_query = {}
+    store = store or get_result_store()
 
     for q in queries:
         if not q["should_refuse"]:
             continue
 
-        cache_key = f"{q['id']}::strict"
-        
-        use_cache = False
-        if cache_key in cache:
-            cached_metrics = cache[cache_key].get("metrics", {})
-            if "confidence_score" in cached_metrics:
-                use_cache = True
-        
-        if use_cache:
-            out = cache[cache_key]
-        else:
-            out = answer(
+        out, stored = store.answer(
             q["query"],
             mode="strict",
             retriever=retriever,
-            eval_mode=True,
             relevant_papers=q.get("relevant_papers", []),
             confidence_threshold = confidence_threshold 
-            )
-            cache[cache_key] = out
+        )
+        if not stored:
             time.sleep(3)
         
         ans_text = out.get("answer", "") or ""
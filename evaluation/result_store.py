@@ -0,0 +1,222 @@
+"""
+Evaluation result store
+-----------------------
+Append-only SQLite store (WAL, so several eval processes can write at once)
+for the answer() results the evaluation scripts reuse between runs. Each
+result is committed as soon as it is produced, so a crash only loses the
+query in flight.
+
+Results are content-addressed: the key hashes the query together with
+everything that changes its answer (mode, index hash, prompt / guardrail
+version, model, query encoder and backend, thresholds, top_k, nprobe /
+ef_search and the other answer() knobs). A rebuilt index, a new prompt or
+another encoder backend therefore misses instead of reusing a stale answer.
+Rows are never updated; the newest row of a key wins. Refusals caused by
+generation failures (LLM.generate returns "" on any API error, ending in
+"Max Retries Failed") are not stored, so a rate-limited run is re-asked
+next time instead of recording false refusals for good; refresh=True
+regenerates and re-records a stored result.
+
+The old evaluation/cache/answers.json (35 "qid::mode" entries without an
+index hash, written by the pre-v2 guardrail) is not imported: no key could
+ever address those answers again. It stays in git history if needed.
+"""
+
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from pipelines.rag.answer import GEMINI_MODEL, get_pipeline
+from pipelines.retrieval.encoder import encoder_id
+from pipelines.retrieval.search import MODEL_NAME
+from utils.metadata import PROMPT_VERSION, GUARDRAIL_VERSION, get_identity
+
+STORE_PATH = Path("evaluation/cache/results.sqlite")
+
+# Refusal reasons that say nothing about the query (transient LLM failures)
+UNSTORED_REFUSAL_REASONS = {"Max Retries Failed"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    query TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    index_hash TEXT,
+    prompt_version TEXT NOT NULL,
+    guardrail_version TEXT NOT NULL,
+    model TEXT NOT NULL,
+    params TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_key ON results (key);
+"""
+
+def retriever_encoder(retriever) -> Optional[str]:
+    '''
+    Query encoder identity (model + backend) of a dense retriever, or of the
+    dense side of a hybrid one; None for retrievers without an encoder.
+    '''
+    dense = getattr(retriever, "dense", retriever)
+    backend = getattr(dense, "backend", None)
+    return encoder_id(MODEL_NAME, backend) if backend else None
+
+def result_key(
+    query: str,
+    mode: str,
+    index_hash: Optional[str],
+    params: Dict[str, Any],
+    prompt_version: str = PROMPT_VERSION,
+    guardrail_version: str = GUARDRAIL_VERSION,
+    model: str = GEMINI_MODEL
+) -> str:
+    '''
+    Content address of one answer() result.
+    Args:
+        query (str): The query text.
+        mode (str): Answer mode ("strict", "synthesis", ...).
+        index_hash (str): Index artifact hash the answer was retrieved from.
+        params (dict): Thresholds and other answer() knobs.
+        prompt_version (str): Prompt the answer was generated with.
+        guardrail_version (str): Refusal / verification rules applied.
+        model (str): Generating LLM.
+    Returns:
+        str: sha256 hex digest.
+    '''
+    payload = {
+        "query": query,
+        "mode": mode,
+        "index_hash": index_hash,
+        "prompt_version": prompt_version,
+        "guardrail_version": guardrail_version,
+        "model": model,
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResultStore:
+    """
+    Append-only, content-addressed store of evaluation answers. Safe to use
+    from several threads (one connection each) and several processes.
+    """
+
+    def __init__(self, path: Path = STORE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self.counters = {"hits": 0, "misses": 0, "writes": 0, "skipped": 0}
+        self._lock = threading.Lock()
+        self._connect().executescript(SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Writers wait for each other's short transactions instead of failing
+            conn = sqlite3.connect(str(self.path), timeout=30.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counters[key] += 1
+
+    def get(self, key: str) -> Optional[dict]:
+        row = self._connect().execute(
+            "SELECT result FROM results WHERE key = ? ORDER BY id DESC LIMIT 1", (key,)
+        ).fetchone()
+        self._count("hits" if row else "misses")
+        return json.loads(row[0]) if row else None
+
+    def put(self, key: str, result: dict, query: str, mode: str, index_hash: Optional[str], params: Dict[str, Any]):
+        '''
+        Appends one result and commits it immediately.
+        '''
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO results (key, query, mode, index_hash, prompt_version, guardrail_version, model, params, result, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    key, query, mode, index_hash, PROMPT_VERSION, GUARDRAIL_VERSION, GEMINI_MODEL,
+                    json.dumps(params, sort_keys=True, default=str), json.dumps(result, default=str), time.time()
+                )
+            )
+        self._count("writes")
+
+    def answer(
+        self,
+        query: str,
+        mode: str = "strict",
+        retriever = None,
+        relevant_papers: Optional[List[str]] = None,
+        confidence_threshold: float = 0.0,
+        top_k: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        refresh: bool = False
+    ):
+        '''
+        Stored eval-mode answer() result for this query and configuration,
+        generating (and recording) it on a miss or when refresh=True. top_k
+        defaults to the retriever's own top_k, like answer(). Refusals from
+        failed generation are returned but not recorded.
+        Returns:
+            (result dict, bool: True if it came from the store)
+        '''
+        pipeline = get_pipeline(retriever)
+        top_k = pipeline.resolve_top_k(top_k)
+        index_hash = get_identity().index_hash
+        params = {
+            "top_k": top_k,
+            "confidence_threshold": confidence_threshold,
+            "relevant_papers": sorted(relevant_papers or []),
+            "retriever": type(retriever).__name__ if retriever is not None else "default",
+            "encoder": retriever_encoder(pipeline.retriever),
+            "nprobe": nprobe,
+            "ef_search": ef_search,
+        }
+        key = result_key(query, mode, index_hash, params)
+        stored = None if refresh else self.get(key)
+        if stored is not None:
+            return stored, True
+
+        out = pipeline.answer(
+            query,
+            top_k=top_k,
+            mode=mode,
+            eval_mode=True,
+            relevant_papers=relevant_papers or [],
+            confidence_threshold=confidence_threshold,
+            nprobe=nprobe,
+            ef_search=ef_search
+        )
+        if (out.get("metrics") or {}).get("refusal_reason") in UNSTORED_REFUSAL_REASONS:
+            self._count("skipped")
+        else:
+            self.put(key, out, query, mode, out.get("index_hash", index_hash), params)
+        return out, False
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
+
+
+_result_store: Optional[ResultStore] = None
+_result_store_lock = threading.Lock()
+
+def get_result_store() -> ResultStore:
+    # One store object per process; processes share the file
+    global _result_store
+    if _result_store is None:
+        with _result_store_lock:
+            if _result_store is None:
+                _result_store = ResultStore()
+    return _result_store
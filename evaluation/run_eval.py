@@ -6,6 +6,7 @@ from pathlib import Path
 from evaluation.metrics.citation import evaluate_citations
 from evaluation.metrics.refusal import evaluate_refusals
 from evaluation.metrics.retrieval import evaluate_retrieval
+from evaluation.result_store import get_result_store
 from pipelines.retrieval.search import Retriever
 
 shared_retriever = Retriever(top_k=10)
@@ -13,19 +14,9 @@ shared_retriever = Retriever(top_k=10)
 RESULTS_DIR = Path("evaluation/results")
 RESULTS_DIR.mkdir(parents=True, exist_ok=True)
 
-CACHE_PATH = Path("evaluation/cache/answers.json")
-CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
-
 # Confidence threshold for evaluation runs
 CONFIDENCE_THRESHOLD = 0.30
 
-if CACHE_PATH.exists():
-    with CACHE_PATH.open("r", encoding="utf-8") as f:
-        ANSWER_CACHE = json.load(f)
-
-else:
-    ANSWER_CACHE = {}
-
 
 def main():
     with open("evaluation/queries.json", "r") as f:
@@ -38,49 +29,43 @@ def main():
             if key not in q:
                 raise KeyError(f"Missing {key} in query {i}")
 
-    try:
-        retrieval_metrics = evaluate_retrieval(
-            queries=queries, retriever=shared_retriever, k=10
-        )
-
-        citation_metrics = evaluate_citations(
-            queries=queries, 
-            retriever=shared_retriever, 
-            cache=ANSWER_CACHE,
-            confidence_threshold=CONFIDENCE_THRESHOLD
-        )
-        
-        refusal_metrics = evaluate_refusals(
-            queries=queries, 
-            retriever=shared_retriever, 
-            cache=ANSWER_CACHE,
-            confidence_threshold=CONFIDENCE_THRESHOLD
-        )
-
-        results = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "config": {
-                "confidence_threshold": CONFIDENCE_THRESHOLD
-            },
-            "retrieval": retrieval_metrics,
-            "citation": citation_metrics,
-            "refusal": refusal_metrics,
-        }
-
-        out_path = (
-            RESULTS_DIR
-            / f"eval_run_{datetime.now(timezone.utc).strftime('%Y%m%d')}.json"
-        )
-        with out_path.open("w", encoding="utf-8") as f:
-            json.dump(results, f, indent=2)
-
-    except Exception as e:
-        with CACHE_PATH.open("w", encoding="utf-8") as f:
-            json.dump(ANSWER_CACHE, f, indent=2)
-        raise e
-
-    with CACHE_PATH.open("w", encoding="utf-8") as f:
-        json.dump(ANSWER_CACHE, f, indent=2)
+    # Answers are recorded as they are produced (evaluation/result_store.py)
+    store = get_result_store()
+
+    retrieval_metrics = evaluate_retrieval(
+        queries=queries, retriever=shared_retriever, k=10
+    )
+
+    citation_metrics = evaluate_citations(
+        queries=queries, 
+        retriever=shared_retriever, 
+        store=store,
+        confidence_threshold=CONFIDENCE_THRESHOLD
+    )
+
+    refusal_metrics = evaluate_refusals(
+        queries=queries, 
+        retriever=shared_retriever, 
+        store=store,
+        confidence_threshold=CONFIDENCE_THRESHOLD
+    )
+
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "confidence_threshold": CONFIDENCE_THRESHOLD
+        },
+        "retrieval": retrieval_metrics,
+        "citation": citation_metrics,
+        "refusal": refusal_metrics,
+    }
+
+    out_path = (
+        RESULTS_DIR
+        / f"eval_run_{datetime.now(timezone.utc).strftime('%Y%m%d')}.json"
+    )
+    with out_path.open("w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
 
     print("Evaluation completed.")
     print("Citation Metrics:", json.dumps(results["citation"], indent=2))
@@ -1,9 +1,21 @@
 import re
 import numpy as np
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any, Optional, Tuple
 from sentence_transformers import SentenceTransformer
 from sentence_transformers.util.tensor import normalize_embeddings
 
+# Min cosine similarity between an answer sentence and its best evidence
+# vector, by evidence granularity. Chunk vectors (no sentence store, chunks
+# without stored sentences, vectors carried on the result or encoded from
+# the text) keep the 0.2 bar they were calibrated for. Stored sentence
+# vectors are scored as the max over the chunk's sentences, which rates a
+# supported claim well above its similarity to the whole-chunk vector while
+# unrelated sentences stay low, so their bar is higher. Changing either
+# changes which answers are refused: bump GUARDRAIL_VERSION and re-run the
+# evaluation (faithfulness / refusal metrics) with it.
+CHUNK_ATTRIBUTION_THRESHOLD = 0.2
+SENTENCE_ATTRIBUTION_THRESHOLD = 0.3
+
 def split_into_sentences(text: str) -> List[str]:
     """
     Splits text into atomic sentences using deterministic regex rules.
@@ -34,29 +46,69 @@ def split_into_sentences(text: str) -> List[str]:
     return [s.strip() for s in sentences if s.strip()]
     
 class Attributor:
-    def __init__(self, model:SentenceTransformer):
+    def __init__(self, model:SentenceTransformer, vector_source: Optional[Callable[[List[int]], Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]]] = None):
         self.model = model
+        # rows -> (stored normalized evidence vectors, owning evidence position,
+        # per evidence item: True if its vectors are sentence-level), e.g.
+        # Retriever.evidence_vectors; lets verify() skip encoding evidence at
+        # request time
+        self.vector_source = vector_source
+        
+    def _evidence_embeddings(self, evidence: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Evidence vectors, per vector the evidence item it belongs to, and per
+        item whether its vectors are sentence-level.
+        Priority: looked up by row_id, carried on the result ("vector"), or
+        (only as a fallback) encoded from the text.
+        """
+        rows = [e.get("row_id") for e in evidence]
+        if self.vector_source is not None and all(r is not None for r in rows):
+            found = self.vector_source(rows)
+            if found is not None:
+                return found
         
-    def verify(self, sentences: List[str], evidence: List[Dict[str, Any]], threshold: float = 0.25)->Dict[str, Any]:
+        chunk_level = np.zeros(len(evidence), dtype=bool)
+        if all(e.get("vector") is not None for e in evidence):
+            return np.vstack([e["vector"] for e in evidence]).astype(np.float32), np.arange(len(evidence)), chunk_level
+        
+        evidence_texts = [e.get("text", "") or "" for e in evidence]
+        return self.model.encode(evidence_texts, normalize_embeddings=True), np.arange(len(evidence)), chunk_level
+        
+    def verify(self, sentences: List[str], evidence: List[Dict[str, Any]], threshold: Optional[float] = None)->Dict[str, Any]:
+        '''
+        threshold overrides the per-granularity bars for every evidence item.
+        '''
         if not sentences or not evidence:
             return {"attribution_passed": False, "details": [], "reason": "Empty input"}
             
-        evidence_texts = [e.get("text", "") or "" for e in evidence]
-        
+        # Only the (short) answer sentences go through the model
         sent_embs = self.model.encode(sentences, normalize_embeddings=True)
-        ev_embs = self.model.encode(evidence_texts, normalize_embeddings=True)
+        ev_embs, owners, sentence_level = self._evidence_embeddings(evidence)
+        if threshold is None:
+            thresholds = np.where(sentence_level, SENTENCE_ATTRIBUTION_THRESHOLD, CHUNK_ATTRIBUTION_THRESHOLD)
+        else:
+            thresholds = np.full(len(evidence), threshold)
         
-        similarity_matrix = np.dot(sent_embs, ev_embs.T)
+        # One matmul against every evidence vector, then the best vector per
+        # evidence item (a chunk may contribute many sentences)
+        raw = np.dot(sent_embs, np.asarray(ev_embs).T)
+        similarity_matrix = np.full((len(sentences), len(evidence)), -1.0, dtype=np.float32)
+        for j in range(len(evidence)):
+            cols = owners == j
+            if cols.any():
+                similarity_matrix[:, j] = raw[:, cols].max(axis=1)
         
         results = []
         failures = []
         
         for i, sent in enumerate(sentences):
             scores = similarity_matrix[i]
-            best_idx = np.argmax(scores)
+            # Best item among those clearing their own bar, else the best overall
+            passing = scores >= thresholds
+            best_idx = np.argmax(np.where(passing, scores, -np.inf)) if passing.any() else np.argmax(scores)
             max_score = float(scores[best_idx])
             
-            supported = max_score >= threshold
+            supported = bool(passing[best_idx])
             
             record = {
                 "sentence": sent, 
@@ -69,7 +121,7 @@ class Attributor:
             results.append(record)
             
             if not supported:
-                failures.append(f"Sentence {i+1} unsupported (Max Score: {max_score:.2f} < {threshold})")
+                failures.append(f"Sentence {i+1} unsupported (Max Score: {max_score:.2f} < {thresholds[best_idx]})")
             
         return {
             "attribution_passed": len(failures) == 0, 
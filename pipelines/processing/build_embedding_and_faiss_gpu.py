@@ -1,40 +1,31 @@
-import json
 import logging
 from pathlib import Path
 
 import faiss
 import numpy as np
+from numpy.lib.format import open_memmap
 from sentence_transformers import SentenceTransformer
 
 from utils.logging import setup_logger, log_event
 from utils.helper_functions import normalize
 from scripts.write_index_manifest import write_index_manifest
+from pipelines.processing.build_embeddings_and_faiss import count_chunks, evidence_sentences, iter_chunk_batches, load_min_length, stream_batch_rows
+from pipelines.retrieval.meta_store import MetaStoreWriter
+from pipelines.retrieval.segments import replace_base
+from pipelines.retrieval.text_store import TextStoreWriter
+from pipelines.retrieval.sentence_store import SentenceStoreWriter, remove_sentence_store
+from pipelines.retrieval.hydrate import clean_pdf_artifacts
+from pipelines.retrieval.index_factory import load_index_config
 
 CHUNKS_DIR = Path("data/processed/chunks")
 OUT_DIR = Path("data/processed/faiss")
 INDEX_PATH = OUT_DIR / "index.faiss"
-META_PATH = OUT_DIR / "index_meta.json"
+META_DIR = OUT_DIR / "meta"
+VECTORS_PATH = OUT_DIR / "vectors.npy"
+VECTORS_TMP = OUT_DIR / "vectors.npy.tmp"
 
 MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
 
-def load_chunks():
-    texts = []
-    meta = []
-    for p in CHUNKS_DIR.glob("*.json"):
-        with p.open("r", encoding="utf-8") as f:
-            doc = json.load(f)
-        for sec in doc.get("sections", []):
-            for ch in sec.get("chunks", []):
-                texts.append(ch["text"])
-                meta.append({
-                    "chunk_id": ch["chunk_id"],
-                    "paper_id": doc["paper_id"], 
-                    "source": doc["source"], 
-                    "section": sec["section"],
-                    "order": ch["order"]
-                })
-    return texts, meta
-        
 def build():
     OUT_DIR.mkdir(parents=True, exist_ok=True)
     
@@ -50,8 +41,14 @@ def build():
         message="Starting embedding + FAISS Build (GPU Enabled)"
     )
     
-    texts, meta = load_chunks()
-    if not texts:
+    # Streamed like the CPU builder: chunk files are read lazily in batches
+    # and vectors land in an on-disk memmap instead of one in-memory matrix
+    paths = sorted(CHUNKS_DIR.glob("*.json")) if CHUNKS_DIR.exists() else []
+    min_length = load_min_length()
+    batch_rows = stream_batch_rows(load_index_config())
+    n_chunks, dropped = count_chunks(paths, min_length)
+    log_event(logger=logger, level=logging.INFO, message="Chunks Counted", chunks=n_chunks, chunks_dropped=dropped, batch_rows=batch_rows)
+    if not n_chunks:
         log_event(
             logger=logger,
             level=logging.WARNING, 
@@ -61,40 +58,70 @@ def build():
         
     model = SentenceTransformer(MODEL_NAME)
     
-    # Generate embeddings
-    emb = model.encode(
-        texts, 
-        batch_size=64, 
-        show_progress_bar=True, 
-        normalize_embeddings=False
-    )
-    
-    emb = normalize(np.asarray(emb).astype("float32"))
-    dim = emb.shape[1]
-    
     # --- GPU CONFIGURATION START ---
     # Initialize GPU resources
     res = faiss.StandardGpuResources()
+    gpu_index = None
     
-    # Create the CPU index structure
-    cpu_index = faiss.IndexFlatIP(dim)
-    
-    # Transfer index to GPU (Device 0)
-    gpu_index = faiss.index_cpu_to_gpu(res, 0, cpu_index)
-    
-    # Add vectors directly to GPU memory
-    gpu_index.add(emb)
+    sentence_cfg = load_index_config()["sentences"]
+    sentence_writer = SentenceStoreWriter(OUT_DIR) if sentence_cfg["enabled"] else None
+    meta_writer = MetaStoreWriter()
+    vectors = None
+    row = 0
+    with TextStoreWriter(OUT_DIR) as text_writer:
+        for texts, meta in iter_chunk_batches(paths, min_length, batch_rows):
+            # Generate embeddings
+            emb = model.encode(
+                texts, 
+                batch_size=64, 
+                show_progress_bar=False, 
+                normalize_embeddings=False
+            )
+            emb = normalize(np.asarray(emb).astype("float32"))
+            
+            if gpu_index is None:
+                # Create the CPU index structure and transfer it to GPU (Device 0)
+                gpu_index = faiss.index_cpu_to_gpu(res, 0, faiss.IndexFlatIP(emb.shape[1]))
+                vectors = open_memmap(VECTORS_TMP, mode="w+", dtype=np.float32, shape=(n_chunks, emb.shape[1]))
+            
+            # Add vectors directly to GPU memory
+            gpu_index.add(emb)
+            vectors[row:row + len(texts)] = emb
+            cleaned = [clean_pdf_artifacts(text) for text in texts]
+            for text, m in zip(cleaned, meta):
+                meta_writer.append(m["chunk_id"], m["paper_id"], m["source"], m["section"], m["order"], fingerprint=m.get("fingerprint"))
+                text_writer.append(text)
+            
+            if sentence_writer is not None:
+                # Per-sentence evidence vectors for attribution (see pipelines.retrieval.sentence_store)
+                per_text = [evidence_sentences(text, int(sentence_cfg["min_words"])) for text in cleaned]
+                flat = [s for sents in per_text for s in sents]
+                sent_emb = normalize(np.asarray(model.encode(flat, batch_size=128, show_progress_bar=False)).astype("float32")) if flat else None
+                start = 0
+                for sents in per_text:
+                    sentence_writer.append(sent_emb[start:start + len(sents)] if sents else np.zeros((0, emb.shape[1]), dtype=np.float32))
+                    start += len(sents)
+            row += len(texts)
+            log_event(logger=logger, level=logging.INFO, message="Batch Embedded", done=row, total=n_chunks)
+    if sentence_writer is not None:
+        sentence_writer.close()
+    else:
+        remove_sentence_store(OUT_DIR)
+    vectors.flush()
+    del vectors
+    replace_base(VECTORS_TMP, VECTORS_PATH, n_chunks)
+    dim = gpu_index.d
     
     # Transfer back to CPU for serialization (write_index does not support GPU indices directly)
     index_to_save = faiss.index_gpu_to_cpu(gpu_index)
     # --- GPU CONFIGURATION END ---
     
-    faiss.write_index(index_to_save, str(INDEX_PATH))
-    
-    with META_PATH.open("w", encoding="utf-8") as f:
-        json.dump(meta, f, indent=2)
+    # Meta before the index, the index before the manifest (same order as update_index)
+    meta_writer.write(META_DIR)
+    faiss.write_index(index_to_save, str(INDEX_PATH.with_suffix(".tmp")))
+    INDEX_PATH.with_suffix(".tmp").replace(INDEX_PATH)
     
-    write_index_manifest()
+    write_index_manifest(build_stats={"chunks_indexed": n_chunks, "chunks_dropped": dropped})
     
     log_event(
         logger=logger, 
@@ -1,69 +1,305 @@
 import json
+import time
 import logging
 import argparse
 from pathlib import Path
 
 import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
+from numpy.lib.format import open_memmap
 
 from utils.logging import setup_logger, log_event
-from utils.helper_functions import normalize
+from utils.helper_functions import normalize, load_yaml
 from scripts.write_index_manifest import write_index_manifest
+from pipelines.processing.embedding_cache import EMBEDDING_CACHE_DIR, EmbeddingCache
+from pipelines.processing.encoding import CorpusEncoder
+from pipelines.retrieval.encoder import encoder_id, load_encoder, resolve_backend
+from pipelines.retrieval.meta_store import MetaStoreWriter
+from pipelines.retrieval.segments import replace_base
+from pipelines.retrieval.text_store import TextStoreWriter
+from pipelines.retrieval.sentence_store import SentenceStoreWriter, remove_sentence_store
+from pipelines.postprocess.align import split_into_sentences
+from pipelines.retrieval.hydrate import clean_pdf_artifacts
+from pipelines.retrieval.index_factory import (
+    COMPRESSED_ENGINES,
+    add_vectors,
+    create_index,
+    estimate_index_bytes,
+    load_index_config,
+    measure_recall,
+)
 
 # REMOVED GLOBAL CONSTANTS for Paths
 MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
 
-def load_chunks(chunks_dir: Path):
-    texts = []
-    meta = []
+# Rough resident cost of one in-flight chunk during a streaming build: raw +
+# cleaned text, tokenizer output, cache lookup and output vector copies
+BYTES_PER_BATCH_ROW = 16 * 1024
+# Share of indexing.build.max_memory_mb given to in-flight batches; the rest is for the index
+BATCH_MEMORY_SHARE = 0.25
+
+def load_min_length(params_path: str = "params.yaml") -> int:
+    try:
+        return int(load_yaml(params_path)["processing"]["min_length"])
+    except (FileNotFoundError, KeyError, TypeError):
+        return 1
+
+def load_chunks(chunks_dir: Path, min_length: int = 1):
+    '''
+    Loads chunk texts + metadata, dropping empty chunks and chunks shorter than
+    min_length words (older chunk files contain many of them).
+    Returns:
+        texts, meta, number of chunks dropped.
+    '''
     # Ensure directory exists
     if not chunks_dir.exists():
-        return [], []
-        
-    for p in chunks_dir.glob("*.json"):
-        with p.open("r", encoding="utf-8") as f:
+        return [], [], 0
+    return load_chunk_files(sorted(chunks_dir.glob("*.json")), min_length)
+
+def load_chunk_files(paths: list, min_length: int = 1):
+    '''
+    load_chunks() over an explicit list of per-paper chunk files.
+    '''
+    texts = []
+    meta = []
+    dropped = 0
+    for text, m in iter_chunks(paths, min_length):
+        if m is None:
+            dropped += 1
+            continue
+        texts.append(text)
+        meta.append(m)
+    return texts, meta, dropped
+
+def iter_chunks(paths: list, min_length: int = 1):
+    '''
+    Lazily yields (text, meta) per chunk, one chunk file open at a time.
+    Chunks that fail the min_length filter are yielded as (text, None).
+    '''
+    for p in paths:
+        with Path(p).open("r", encoding="utf-8") as f:
             doc = json.load(f)
         for sec in doc.get("sections", []):
             for ch in sec.get("chunks", []):
-                texts.append(ch["text"])
-                meta.append({
+                text = ch.get("text") or ""
+                if len(text.split()) < max(1, min_length):
+                    yield text, None
+                    continue
+                yield text, {
                     "chunk_id": ch["chunk_id"],
                     "paper_id": doc["paper_id"], 
                     "source": doc["source"], 
                     "section": sec["section"],
-                    "order":ch["order"]
-                })
-    return texts, meta
+                    "order":ch["order"],
+                    "fingerprint": doc.get("fingerprint")
+                }
+
+def iter_chunk_batches(paths: list, min_length: int, batch_size: int):
+    '''
+    Groups iter_chunks() into (texts, meta) batches of at most batch_size.
+    '''
+    texts, meta = [], []
+    for text, m in iter_chunks(paths, min_length):
+        if m is None:
+            continue
+        texts.append(text)
+        meta.append(m)
+        if len(texts) == batch_size:
+            yield texts, meta
+            texts, meta = [], []
+    if texts:
+        yield texts, meta
+
+def count_chunks(paths: list, min_length: int = 1):
+    '''
+    First pass of a streaming build: sizes the on-disk vector matrix.
+    Returns:
+        Number of chunks kept, number dropped.
+    '''
+    kept = dropped = 0
+    for _, m in iter_chunks(paths, min_length):
+        if m is None:
+            dropped += 1
+        else:
+            kept += 1
+    return kept, dropped
+
+def stream_batch_rows(index_cfg: dict) -> int:
+    build_cfg = index_cfg["build"]
+    budget = int(float(build_cfg["max_memory_mb"]) * 2**20 * BATCH_MEMORY_SHARE)
+    return max(256, min(int(build_cfg["batch_size"]), budget // BYTES_PER_BATCH_ROW))
         
-def build(input_dir: Path, output_dir: Path):
+def evidence_sentences(text: str, min_words: int = 1) -> list:
+    '''
+    Sentences of a cleaned chunk that are stored as attribution evidence.
+    '''
+    return [s for s in split_into_sentences(text) if len(s.split()) >= min_words]
+
+def iter_sentence_vectors(texts: list, cache: EmbeddingCache, encoder, min_words: int, batch_size: int):
+    '''
+    Splits cleaned chunk texts into sentences and embeds them through the
+    cache, at most ~batch_size sentences at a time.
+    Yields:
+        (one [n_sentences, dim] array per text of the step, cache hits)
+    '''
+    per_text = [evidence_sentences(t, min_words) for t in texts]
+    start = 0
+    while start < len(per_text):
+        end, size = start, 0
+        while end < len(per_text) and (end == start or size + len(per_text[end]) <= batch_size):
+            size += len(per_text[end])
+            end += 1
+        flat = [s for sents in per_text[start:end] for s in sents]
+        emb, hits = cache.get_or_encode(flat, encoder) if flat else (np.zeros((0, 0), dtype=np.float32), 0)
+        out, offset = [], 0
+        for sents in per_text[start:end]:
+            out.append(emb[offset:offset + len(sents)])
+            offset += len(sents)
+        yield out, hits
+        start = end
+
+def lazy_encoder(batch_size: int = 64, show_progress_bar: bool = True, backend: str = None):
+    '''
+    Returns encode(texts) -> normalized float32 vectors. The model is only
+    loaded on the first call, so fully cached builds never load it.
+    '''
+    model = None
+    def encode(batch):
+        nonlocal model
+        if model is None:
+            model = load_encoder(backend, MODEL_NAME, role="build")
+        out = model.encode(batch, batch_size=batch_size, show_progress_bar=show_progress_bar, normalize_embeddings=False)
+        return normalize(np.asarray(out).astype("float32"))
+    return encode
+
+def build(input_dir: Path, output_dir: Path, cache_dir: Path = EMBEDDING_CACHE_DIR, workers: int = None):
+    '''
+    Streaming build: chunk files are read lazily in fixed-size batches, each
+    batch is embedded (through the cache) and appended to an on-disk
+    vectors.npy memmap, the meta store, the text store and (when enabled)
+    the per-sentence evidence store. The index is then
+    trained on a sample and filled block by block from the memmap, so peak
+    memory is bounded by indexing.build rather than by corpus size.
+    '''
     output_dir.mkdir(parents=True, exist_ok=True)
     index_path = output_dir / "index.faiss"
-    meta_path = output_dir / "index_meta.json"
+    meta_dir = output_dir / "meta"
+    vectors_path = output_dir / "vectors.npy"
+    # Written aside and swapped in, so a serving process's mapped vectors stay valid
+    vectors_tmp = vectors_path.with_name(vectors_path.name + ".tmp")
     
     logger = setup_logger(name="Embeddings_FAISS", log_dir="logs", level=logging.INFO)
     log_event(logger=logger, level=logging.INFO, message="Starting FAISS Build")
     
-    texts, meta = load_chunks(input_dir)
-    if not texts:
+    paths = sorted(input_dir.glob("*.json")) if input_dir.exists() else []
+    min_length = load_min_length()
+    index_cfg = load_index_config()
+    batch_rows = stream_batch_rows(index_cfg)
+    
+    n_chunks, dropped = count_chunks(paths, min_length)
+    log_event(logger=logger, level=logging.INFO, message="Chunks Counted", chunks=n_chunks, chunks_dropped=dropped, batch_rows=batch_rows)
+    if not n_chunks:
         log_event(logger=logger, level=logging.WARNING, message="No Text Chunks found!!")
         return 
         
-    model = SentenceTransformer(MODEL_NAME)
-    emb = model.encode(texts, batch_size=64, show_progress_bar=True, normalize_embeddings=False)
+    # Only chunks whose (model, normalized text) isn't cached yet get encoded,
+    # length-sorted across a pool of worker processes
+    backend = resolve_backend(role="build")
+    cache = EmbeddingCache(cache_dir, encoder_id(MODEL_NAME, backend))
+    sentence_cfg = index_cfg["sentences"]
+    meta_writer = MetaStoreWriter()
+    vectors = None
+    row = hits = n_sentences = sentence_hits = 0
+    t0 = time.perf_counter()
+    with CorpusEncoder(MODEL_NAME, workers=workers, backend=backend) as encoder, TextStoreWriter(output_dir) as text_writer:
+        sentence_writer = SentenceStoreWriter(output_dir) if sentence_cfg["enabled"] else None
+        for texts, meta in iter_chunk_batches(paths, min_length, batch_rows):
+            emb, batch_hits = cache.get_or_encode(texts, encoder)
+            if vectors is None:
+                vectors = open_memmap(vectors_tmp, mode="w+", dtype=np.float32, shape=(n_chunks, emb.shape[1]))
+            vectors[row:row + len(texts)] = emb
+            # Cleaned once at build time so hydration does no per-request regex work
+            cleaned = [clean_pdf_artifacts(text) for text in texts]
+            for text, m in zip(cleaned, meta):
+                meta_writer.append(m["chunk_id"], m["paper_id"], m["source"], m["section"], m["order"], fingerprint=m.get("fingerprint"))
+                text_writer.append(text)
+            if sentence_writer is not None:
+                for sentence_vectors, step_hits in iter_sentence_vectors(cleaned, cache, encoder, int(sentence_cfg["min_words"]), int(sentence_cfg["batch_size"])):
+                    for v in sentence_vectors:
+                        sentence_writer.append(v)
+                        n_sentences += len(v)
+                    sentence_hits += step_hits
+            row += len(texts)
+            hits += batch_hits
+            log_event(logger=logger, level=logging.INFO, message="Batch Embedded", done=row, total=n_chunks, cache_hits=batch_hits, sentences=n_sentences)
+        if sentence_writer is not None:
+            sentence_writer.close()
+        else:
+            remove_sentence_store(output_dir)
+    vectors.flush()
+    del vectors
+    replace_base(vectors_tmp, vectors_path, n_chunks)
+    embed_sec = time.perf_counter() - t0
+    throughput = {
+        "embed_sec": round(embed_sec, 3),
+        "chunks_per_sec": round(n_chunks / embed_sec, 2) if embed_sec else None,
+        "encoded_chunks_per_sec": encoder.chunks_per_sec,
+        "encode_workers": encoder.workers,
+        "encoder_backend": backend,
+    }
+    log_event(logger=logger, level=logging.INFO, message="Embeddings Assembled", chunks=n_chunks, cache_hits=hits, encoded=n_chunks - hits, sentences=n_sentences, sentence_cache_hits=sentence_hits, **throughput)
+    
+    # Stable ids make the index mutable in place (pipelines.processing.update_index)
+    meta_writer.write(meta_dir)
+    ids = np.asarray(meta_writer.ids, dtype=np.int64)
     
-    emb = normalize(np.asarray(emb).astype("float32"))
+    # Full-precision vectors stay on disk: training samples, index adds and the
+    # exact re-ranking of compressed hits all read them through the memmap
+    emb = np.load(vectors_path, mmap_mode="r")
     dim = emb.shape[1]
-    index = faiss.IndexFlatIP(dim)
-    index.add(emb)
+    index, index_params = create_index(emb, index_cfg, with_ids=True)
+    log_event(logger=logger, level=logging.INFO, message="Index Engine Selected", requested=index_cfg["index_type"], **index_params)
+    
+    index_bytes = estimate_index_bytes(index_params["engine"], n_chunks, dim, index_cfg)
+    if index_bytes > float(index_cfg["build"]["max_memory_mb"]) * 2**20:
+        log_event(
+            logger=logger, 
+            level=logging.WARNING, 
+            message="Index Exceeds Memory Cap", 
+            engine=index_params["engine"], 
+            index_mb=round(index_bytes / 2**20, 1), 
+            max_memory_mb=index_cfg["build"]["max_memory_mb"],
+            hint="use a compressed engine (sq8 / ivf_pq) for corpora larger than RAM"
+        )
+    add_vectors(index, emb, ids, block_size=batch_rows)
+    
+    if index_params["engine"] in COMPRESSED_ENGINES:
+        tolerance = float(index_cfg["compression"]["recall_tolerance"])
+        recall = measure_recall(index, emb, index_cfg, ids=ids)
+        index_params["recall_at_10"] = round(recall, 4)
+        index_params["recall_tolerance"] = tolerance
+        index_params["rerank"] = bool(index_cfg["compression"]["rerank"])
+        log_event(
+            logger=logger, 
+            level=logging.INFO if recall >= 1.0 - tolerance else logging.WARNING, 
+            message="Compressed Index Recall", 
+            recall_at_10=recall, 
+            tolerance=tolerance,
+            index_bytes=index_bytes,
+            exact_bytes=n_chunks * dim * 4
+        )
     
-    faiss.write_index(index, str(index_path))
-    with meta_path.open("w", encoding="utf-8") as f:
-        json.dump(meta, f, indent=2)
+    index_tmp = index_path.with_suffix(".tmp")
+    faiss.write_index(index, str(index_tmp))
+    index_tmp.replace(index_path)
     
     # Adjust manifest writer if needed, or assume it works in context
     try:
-        write_index_manifest()
+        write_index_manifest(
+            index_params=index_params, 
+            build_stats={"chunks_indexed": n_chunks, "chunks_dropped": dropped, "cache_hits": hits, "sentences_indexed": n_sentences, **throughput},
+            operation={"op": "build", "chunks": n_chunks}
+        )
     except:
         pass # Warning: Manifest writer might need update too if it hardcodes paths
     
@@ -73,7 +309,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--input_dir", type=Path, required=True, help="Input directory (chunks)")
     parser.add_argument("--output_dir", type=Path, required=True, help="Output directory (indexes)")
+    parser.add_argument("--cache_dir", type=Path, default=EMBEDDING_CACHE_DIR, help="Persistent embedding cache")
+    parser.add_argument("--workers", type=int, default=None, help="Encoder processes (default: params.yaml embedding.workers, 0 = auto)")
     
     args = parser.parse_args()
     
-    build(args.input_dir, args.output_dir)
\ No newline at end of file
+    build(args.input_dir, args.output_dir, cache_dir=args.cache_dir, workers=args.workers)
\ No newline at end of file
@@ -0,0 +1,140 @@
+import json
+import re
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+import numpy as np
+
+from utils.helper_functions import hash_text
+
+EMBEDDING_CACHE_DIR = Path("data/cache/embeddings")
+
+KEYS_FILE = "keys.txt"        # one key per line; line i <-> vector row i
+VECTORS_FILE = "vectors.f32"  # raw float32 rows, appended
+INFO_FILE = "cache_info.json"
+
+def normalize_cache_text(text: str) -> str:
+    return " ".join((text or "").split())
+
+def cache_key(model_name: str, text: str) -> str:
+    '''
+    Content address of one embedding: (model name, normalized chunk text).
+    '''
+    return hash_text(f"{model_name}\n{normalize_cache_text(text)}")
+
+
+class EmbeddingCache:
+    """
+    Persistent, append-only store of normalized embeddings keyed by
+    cache_key(). Vectors live in one raw float32 file that is memory-mapped
+    on read; keys are committed after their vectors, so a crash mid-append
+    only loses the uncommitted tail.
+    """
+
+    def __init__(self, cache_dir: Path, model_name: str):
+        self.model_name = model_name
+        self.dir = cache_dir / re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.keys_path = self.dir / KEYS_FILE
+        self.vectors_path = self.dir / VECTORS_FILE
+        self.info_path = self.dir / INFO_FILE
+
+        self.dim = None
+        if self.info_path.exists():
+            with self.info_path.open("r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+
+        keys = []
+        if self.keys_path.exists():
+            with self.keys_path.open("r", encoding="utf-8") as f:
+                keys = f.read().split()
+
+        # Only rows fully present in both files count
+        rows = len(keys)
+        if self.dim and self.vectors_path.exists():
+            rows = min(rows, self.vectors_path.stat().st_size // (4 * self.dim))
+        else:
+            rows = 0
+        self._lookup = {k: i for i, k in enumerate(keys[:rows])}
+        self._rows = rows
+        self._repair(rows)
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def _repair(self, rows: int):
+        # Truncate any torn tail left by an interrupted append
+        if self.dim and self.vectors_path.exists():
+            size = rows * 4 * self.dim
+            if self.vectors_path.stat().st_size != size:
+                with self.vectors_path.open("r+b") as f:
+                    f.truncate(size)
+        if self.keys_path.exists():
+            with self.keys_path.open("r", encoding="utf-8") as f:
+                keys = f.read().split()
+            if len(keys) != rows:
+                with self.keys_path.open("w", encoding="utf-8") as f:
+                    f.writelines(k + "\n" for k in keys[:rows])
+
+    def _vectors(self) -> np.ndarray:
+        if not self._rows:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+
+    def lookup(self, keys: List[str]) -> np.ndarray:
+        '''
+        Returns the cache row of every key, -1 for misses.
+        '''
+        return np.asarray([self._lookup.get(k, -1) for k in keys], dtype=np.int64)
+
+    def add(self, keys: List[str], vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+            with self.info_path.open("w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "dim": self.dim}, f)
+
+        new_keys, new_rows = [], []
+        for i, k in enumerate(keys):
+            if k not in self._lookup:
+                self._lookup[k] = self._rows + len(new_keys)
+                new_keys.append(k)
+                new_rows.append(i)
+        if not new_keys:
+            return
+
+        with self.vectors_path.open("ab") as f:
+            f.write(vectors[new_rows].tobytes())
+        with self.keys_path.open("a", encoding="utf-8") as f:
+            f.writelines(k + "\n" for k in new_keys)
+        self._rows += len(new_keys)
+
+    def get_or_encode(
+        self,
+        texts: List[str],
+        encode_fn: Callable[[List[str]], np.ndarray]
+    ) -> Tuple[np.ndarray, int]:
+        '''
+        Assembles embeddings for texts, encoding only cache misses.
+        Args:
+            texts (List[str]): Texts in output order.
+            encode_fn: Encodes a list of texts into normalized float32 vectors.
+        Returns:
+            Tuple[np.ndarray, int]: The (n, dim) matrix and the number of hits.
+        '''
+        keys = [cache_key(self.model_name, t) for t in texts]
+        rows = self.lookup(keys)
+        misses = np.flatnonzero(rows < 0)
+
+        if len(misses):
+            # Identical texts inside one build are encoded once
+            unique = {}
+            for i in misses:
+                unique.setdefault(keys[i], i)
+            miss_idx = list(unique.values())
+            encoded = np.asarray(encode_fn([texts[i] for i in miss_idx]), dtype=np.float32)
+            self.add([keys[i] for i in miss_idx], encoded)
+            rows = self.lookup(keys)
+
+        emb = np.asarray(self._vectors()[rows], dtype=np.float32)
+        return emb, len(texts) - len(misses)
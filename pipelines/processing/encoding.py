@@ -0,0 +1,192 @@
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from utils.logging import setup_logger, log_event
+from utils.helper_functions import normalize, load_yaml
+
+# Defaults for params.yaml -> embedding; only throughput knobs, the vectors don't change
+DEFAULT_ENCODING_CONFIG = {
+    "workers": 0,              # 0 = auto (one process per THREADS_PER_WORKER cores)
+    "max_batch_tokens": 16384, # padded tokens per batch (batch_size * longest input) ~ activation memory
+    "max_batch_size": 256,
+}
+
+# Intra-op threads per worker process when sizing the pool automatically
+THREADS_PER_WORKER = 4
+# SentenceTransformer's truncation length for all-mpnet-base-v2; longer inputs cost no more
+MAX_SEQ_LENGTH = 384
+
+_worker_model = None
+
+def load_encoding_config(params_path: str = "params.yaml") -> dict:
+    try:
+        params = load_yaml(params_path) or {}
+    except FileNotFoundError:
+        params = {}
+    return {**DEFAULT_ENCODING_CONFIG, **(params.get("embedding") or {})}
+
+def auto_workers() -> int:
+    return max(1, (os.cpu_count() or 1) // THREADS_PER_WORKER)
+
+def _init_worker(model_name: str, threads: int, backend: str = "torch"):
+    # One model per worker process, loaded once; threads split so workers don't oversubscribe cores
+    global _worker_model
+    import torch
+    from pipelines.retrieval.encoder import load_encoder
+    torch.set_num_threads(max(1, threads))
+    _worker_model = load_encoder(backend, model_name, device="cpu")
+
+def _encode_with(model, batch: Tuple[np.ndarray, List[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    positions, texts = batch
+    out = model.encode(texts, batch_size=len(texts), show_progress_bar=False, normalize_embeddings=False)
+    return positions, normalize(np.asarray(out).astype("float32"))
+
+def _encode_batch(batch: Tuple[np.ndarray, List[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    # Runs in a pool worker
+    return _encode_with(_worker_model, batch)
+
+def token_lengths(texts: List[str], tokenizer, max_seq_length: int) -> np.ndarray:
+    '''
+    Token count of every text, clipped to what the encoder actually reads.
+    '''
+    ids = tokenizer(texts, add_special_tokens=True, truncation=True, max_length=max_seq_length)["input_ids"]
+    return np.asarray([len(x) for x in ids], dtype=np.int64)
+
+def plan_batches(lengths: np.ndarray, max_batch_tokens: int, max_batch_size: int) -> List[np.ndarray]:
+    '''
+    Sorts inputs by length and packs them greedily so each batch's padded size
+    (batch_size * longest input) stays within max_batch_tokens.
+    Returns:
+        List[np.ndarray]: Original positions of the texts in each batch.
+    '''
+    order = np.argsort(-lengths, kind="stable")
+    batches, start = [], 0
+    while start < len(order):
+        longest = max(1, int(lengths[order[start]]))
+        size = max(1, min(max_batch_size, max_batch_tokens // longest))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+
+class CorpusEncoder:
+    """
+    Throughput-oriented bulk encoder for index builds. Texts are sorted by
+    token length for tight padding, packed into token-budgeted batches and
+    spread over a pool of worker processes; vectors come back in input order.
+    Call it like the encode_fn of EmbeddingCache.get_or_encode. The pool is
+    kept across calls (streaming builds call it once per batch); use it as a
+    context manager or close() it.
+
+    With one worker, or a call too small to split while no pool is running,
+    texts are encoded in-process by `model` (the caller's, if given, else
+    one loaded on first use), leaving the process's torch settings alone.
+    """
+
+    def __init__(
+        self, 
+        model_name: str, 
+        workers: Optional[int] = None, 
+        config: Optional[dict] = None, 
+        backend: str = "torch",
+        model = None
+    ):
+        self.model_name = model_name
+        self.backend = backend
+        self.model = model
+        self.config = config or load_encoding_config()
+        self.workers = int(workers or self.config["workers"] or auto_workers())
+        self.threads = max(1, (os.cpu_count() or 1) // self.workers)
+        self.logger = setup_logger(name="Embeddings_FAISS", log_dir="logs", level=logging.INFO)
+        self.last_stats = {}
+        self._tok = None
+        self._pool = None
+        self._total = {"encoded": 0, "encode_sec": 0.0}
+
+    def _tokenizer(self):
+        if self._tok is None:
+            from transformers import AutoTokenizer
+            self._tok = AutoTokenizer.from_pretrained(self.model_name)
+        return self._tok
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.model_name, self.threads, self.backend)
+            )
+        return self._pool
+
+    def _local_model(self):
+        if self.model is None:
+            from pipelines.retrieval.encoder import load_encoder
+            self.model = load_encoder(self.backend, self.model_name, device="cpu")
+        return self.model
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def chunks_per_sec(self) -> Optional[float]:
+        '''
+        Encoding throughput over every call so far.
+        '''
+        if not self._total["encode_sec"]:
+            return None
+        return round(self._total["encoded"] / self._total["encode_sec"], 2)
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        t0 = time.perf_counter()
+
+        lengths = token_lengths(texts, self._tokenizer(), max_seq_length=MAX_SEQ_LENGTH)
+        batches = plan_batches(lengths, int(self.config["max_batch_tokens"]), int(self.config["max_batch_size"]))
+        jobs = [(positions, [texts[i] for i in positions]) for positions in batches]
+
+        out = None
+        def place(positions: np.ndarray, vectors: np.ndarray):
+            nonlocal out
+            if out is None:
+                out = np.empty((len(texts), vectors.shape[1]), dtype=np.float32)
+            out[positions] = vectors
+
+        if self.workers <= 1 or (len(jobs) <= 1 and self._pool is None):
+            model = self._local_model()
+            for job in jobs:
+                place(*_encode_with(model, job))
+        else:
+            pool = self._get_pool()
+            futures = [pool.submit(_encode_batch, job) for job in jobs]
+            for fut in as_completed(futures):
+                place(*fut.result())
+
+        elapsed = time.perf_counter() - t0
+        self._total["encoded"] += len(texts)
+        self._total["encode_sec"] += elapsed
+        padded = sum(len(b) * int(lengths[b[0]]) for b in batches)
+        self.last_stats = {
+            "encoded": len(texts),
+            "workers": self.workers,
+            "threads_per_worker": self.threads,
+            "batches": len(batches),
+            "encode_sec": round(elapsed, 3),
+            "chunks_per_sec": round(len(texts) / elapsed, 2) if elapsed else None,
+            "padding_ratio": round(padded / max(1, int(lengths.sum())), 3),
+        }
+        log_event(logger=self.logger, level=logging.DEBUG, message="Encoding Throughput", **self.last_stats)
+        return out
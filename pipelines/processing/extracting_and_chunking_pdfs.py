@@ -1,12 +1,25 @@
+import os
 import json
+import time
 import hashlib
 import argparse
 from pathlib import Path
-from collections import defaultdict
+import re
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
 import pdfplumber
 import logging
 from utils.logging import setup_logger, log_event
-from utils.helper_functions import load_yaml # Added to read params
+from utils.helper_functions import load_yaml, hash_object # Added to read params
+
+# Bump whenever extraction/chunking logic changes so fingerprints invalidate
+CHUNKER_VERSION = "3"
+
+WORD_PATTERN = re.compile(r"\S+")
+
+PROGRESS_EVERY = 25
+REPORT_PATH = Path("logs/processing_report.json")
 
 # Global constants (can be moved to params if needed, but keeping simple for now)
 SECTION_HEADERS = [
@@ -25,42 +38,166 @@ def detect_section(line:str):
             return h
     return None
     
-def chunk_text(text: str, max_words: int):
-    words = text.split()
-    for i in range(0, len(text), max_words):
-        yield " ".join(words[i:i + max_words])
+def chunk_text(text: str, max_words: int, overlap: int = 0, min_length: int = 1):
+    '''
+    Streams word windows of max_words, each starting max_words - overlap words
+    after the previous one. Never yields empty chunks or chunks shorter than
+    min_length words; a section shorter than min_length yields nothing.
+    The words left after the last full window become their own chunk only
+    if they outnumber its overlap and it reaches min_length; otherwise they
+    are appended to the last full window (so no words are lost and no chunk
+    is mostly a repeat of the previous one), which then holds fewer than
+    max_words + max(overlap, min_length) words.
+    Args:
+        text (str): Section text.
+        max_words (int): Words per chunk.
+        overlap (int): Words shared by consecutive chunks.
+        min_length (int): Minimum words for a chunk to be emitted.
+    Yields:
+        str: Chunk text.
+    '''
+    if not 0 <= overlap < max_words:
+        raise ValueError(f"chunk_overlap must be in [0, {max_words}), got {overlap}")
+    step = max_words - overlap
+    window = deque()
+    fresh = 0  # words in the window not covered by an emitted chunk yet
+    held = None  # last full window, held back in case the tail is folded into it
+    
+    for match in WORD_PATTERN.finditer(text):
+        window.append(match.group())
+        fresh += 1
+        if len(window) == max_words:
+            if held is not None:
+                yield " ".join(held)
+            held = list(window)
+            for _ in range(step):
+                window.popleft()
+            fresh = 0
+    
+    if held is None:
+        # Section shorter than one window
+        if fresh and len(window) >= max(1, min_length):
+            yield " ".join(window)
+        return
+    if fresh > overlap and len(window) >= max(1, min_length):
+        yield " ".join(held)
+        yield " ".join(window)
+    else:
+        # A short tail would mostly repeat the overlap: extend the last window with its new words
+        yield " ".join(held + list(window)[len(window) - fresh:])
         
 def sha256_words(text: str)-> str:
     return "sha256: "+ hashlib.sha256(text.encode("utf-8")).hexdigest()
     
-def extract_and_chunk(pdf_dir: Path, meta_dir: Path, out_dir: Path):
-    # Load params to get chunk size
-    params = load_yaml("params.yaml")
-    chunk_size = params["processing"]["chunk_size"]
+def file_checksum(path: Path) -> str:
+    hasher = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            hasher.update(block)
+    return f"sha256: {hasher.hexdigest()}"
+
+def paper_fingerprint(pdf_checksum: str, chunk_params: dict) -> str:
+    '''
+    Identity of one paper's chunk output: the PDF checksum from its metadata
+    record, the chunking params and the chunker code version. An unchanged
+    fingerprint means the existing output can be reused as-is.
+    '''
+    return hash_object({
+        "pdf_checksum": pdf_checksum,
+        "chunk_params": chunk_params,
+        "chunker_version": CHUNKER_VERSION,
+    })
+
+def existing_fingerprint(out_path: Path):
+    if not out_path.exists():
+        return None
+    try:
+        with out_path.open("r", encoding="utf-8") as f:
+            return json.load(f).get("fingerprint")
+    except (OSError, ValueError):
+        return None
+
+def process_paper(task: dict) -> dict:
+    '''
+    Extracts, chunks and writes one paper. Runs inside pool workers, so it
+    only takes/returns plain dicts and reports errors instead of logging them.
+    '''
+    t0 = time.perf_counter()
+    paper_id = task["paper_id"]
+    chunk_params = task["chunk_params"]
     
-    logger = setup_logger(
-        name = "pdf_extraction_chunking",
-        level = logging.INFO, 
-        log_dir = "logs"
-    )
-    out_dir.mkdir(parents=True, exist_ok=True)
-    log_event(
-        logger = logger, 
-        level = logging.INFO, 
-        message = "Starting PDF extraction and chunking",
-        chunk_size = chunk_size
-    )
-    processed = 0
-    skipped = 0
-    failed = 0
+    sections = defaultdict(list)
+    current_section = "unknown"
+    
+    try:
+        with pdfplumber.open(task["pdf_path"]) as pdf:
+            for page in pdf.pages:
+                text = page.extract_text() or ""
+                for line in text.splitlines():
+                    sec = detect_section(line)
+                    if sec: 
+                        current_section = sec
+                        continue
+                    sections[current_section].append(line)
+                    
+    except Exception as e:
+        return {"paper_id": paper_id, "status": "failed", "error": str(e), "seconds": time.perf_counter() - t0}
+                
+    structured = {
+        "paper_id" : paper_id, 
+        "source": task["source"], 
+        "fingerprint": task["fingerprint"],
+        "sections" : []
+    }
     
+    num_chunks = 0
+    for sec, lines in sections.items():
+        joined = " ".join(lines)
+        chunks = []
+        # Use the dynamic chunk_size here
+        for idx, chunk in enumerate(chunk_text(
+            joined, 
+            max_words=chunk_params["chunk_size"], 
+            overlap=chunk_params["chunk_overlap"], 
+            min_length=chunk_params["min_length"]
+        )):
+            chunks.append({
+                "chunk_id": f"{paper_id}::sec::{sec}::chunk::{idx}",
+                "text": chunk,
+                "order": idx, 
+                "token_est": len(chunk.split()) 
+            })
+            
+        if not chunks:
+            continue
+        num_chunks += len(chunks)
+        structured["sections"].append({
+            "section": sec.lower(), 
+            "chunks": chunks
+        })
+    
+    # Write-then-rename so an interrupted run never leaves a truncated output behind
+    out_path = Path(task["out_path"])
+    tmp_path = out_path.with_suffix(".json.tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
+        json.dump(structured, f, indent=2)
+    tmp_path.replace(out_path)
+        
+    return {"paper_id": paper_id, "status": "processed", "chunks": num_chunks, "seconds": time.perf_counter() - t0}
+
+def plan_tasks(pdf_dir: Path, meta_dir: Path, out_dir: Path, chunk_params: dict):
+    '''
+    Builds one task per paper. Returns the tasks to run, the ids skipped as
+    unchanged, the ids with missing PDFs and the set of all expected ids.
+    '''
     # We iterate metadata files to drive processing
     # If metadata is missing, we fall back to PDF files directly
     if meta_dir.exists():
-        files = list(meta_dir.glob("*.json"))
+        files = sorted(meta_dir.glob("*.json"))
     else:
-        files = list(pdf_dir.glob("*.pdf"))
+        files = sorted(pdf_dir.glob("*.pdf"))
 
+    tasks, unchanged, missing, expected = [], [], [], set()
     for item_path in files:
         if meta_dir.exists():
             with item_path.open("r", encoding="utf-8") as f:
@@ -68,79 +205,148 @@ def extract_and_chunk(pdf_dir: Path, meta_dir: Path, out_dir: Path):
             paper_id = meta["paper_id"]
             pdf_path = pdf_dir / f"{paper_id}.pdf"
             source = meta.get("source", "unknown")
+            checksum = meta.get("checksum")
         else:
             # Fallback if no metadata (Direct PDF processing)
-            if item_path.suffix != ".pdf": continue
             paper_id = item_path.stem
             pdf_path = item_path
             source = "unknown"
+            checksum = None
 
-        out_path = out_dir / f"{paper_id}.json"
-        
+        expected.add(paper_id)
         if not pdf_path.exists():
-            # log_event(logger=logger, level=logging.WARNING, message="PDF Missing", paper_id=paper_id)
-            failed += 1
+            missing.append(paper_id)
             continue
 
-        # Force regenerate if chunk size changes? 
-        # DVC handles the stage invalidation, so we just overwrite if run.
-        # But we can check if we want to skip existing identical files.
-        # For now, let's write every time to ensure param update takes effect.
-        
-        sections = defaultdict(list)
-        current_section = "unknown"
-        
-        try:
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    text = page.extract_text() or ""
-                    for line in text.splitlines():
-                        sec = detect_section(line)
-                        if sec: 
-                            current_section = sec
-                            continue
-                        sections[current_section].append(line)
-                        
-        except Exception as e:
-            failed += 1
-            log_event(logger=logger, level=logging.ERROR, message="Extraction Failed", paper_id=paper_id, error=str(e))
+        out_path = out_dir / f"{paper_id}.json"
+        fingerprint = paper_fingerprint(checksum or file_checksum(pdf_path), chunk_params)
+        if existing_fingerprint(out_path) == fingerprint:
+            unchanged.append(paper_id)
             continue
-                    
-        structured = {
-            "paper_id" : paper_id, 
-            "source": source, 
-            "sections" : []
-        }
-        
-        for sec, lines in sections.items():
-            joined = " ".join(lines)
-            chunks = []
-            # Use the dynamic chunk_size here
-            for idx, chunk in enumerate(chunk_text(joined, max_words=chunk_size)):
-                chunks.append({
-                    "chunk_id": f"{paper_id}::sec::{sec}::chunk::{idx}",
-                    "text": chunk,
-                    "order": idx, 
-                    "token_est": len(chunk.split()) 
-                })
-                
-            structured["sections"].append({
-                "section": sec.lower(), 
-                "chunks": chunks
-            })
-        
-        with out_path.open("w", encoding="utf-8") as f:
-            json.dump(structured, f, indent=2)
+
+        tasks.append({
+            "paper_id": paper_id,
+            "pdf_path": str(pdf_path),
+            "out_path": str(out_path),
+            "source": source,
+            "fingerprint": fingerprint,
+            "chunk_params": chunk_params,
+        })
+    return tasks, unchanged, missing, expected
+    
+def extract_and_chunk(pdf_dir: Path, meta_dir: Path, out_dir: Path, workers: int = None):
+    # Load params to get chunk size
+    params = load_yaml("params.yaml")
+    chunk_params = {
+        "chunk_size": params["processing"]["chunk_size"],
+        "chunk_overlap": params["processing"]["chunk_overlap"],
+        "min_length": params["processing"]["min_length"],
+    }
+    workers = workers or os.cpu_count() or 1
+    
+    logger = setup_logger(
+        name = "pdf_extraction_chunking",
+        level = logging.INFO, 
+        log_dir = "logs"
+    )
+    out_dir.mkdir(parents=True, exist_ok=True)
+    log_event(
+        logger = logger, 
+        level = logging.INFO, 
+        message = "Starting PDF extraction and chunking",
+        workers = workers,
+        **chunk_params
+    )
+    t0 = time.perf_counter()
+    
+    # Papers whose fingerprint matches their existing output are skipped;
+    # DVC keeps the previous outputs around (persist: true) for this.
+    tasks, unchanged, missing, expected = plan_tasks(pdf_dir, meta_dir, out_dir, chunk_params)
+    
+    # Drop outputs for papers no longer in the corpus (never on an empty listing)
+    pruned = 0
+    for stale in out_dir.glob("*.json") if expected else []:
+        if stale.stem not in expected:
+            stale.unlink()
+            pruned += 1
+    
+    log_event(
+        logger = logger, 
+        level = logging.INFO, 
+        message = "Processing Plan", 
+        to_process = len(tasks), 
+        unchanged = len(unchanged), 
+        missing_pdf = len(missing), 
+        pruned = pruned
+    )
+    
+    processed = 0
+    failed = len(missing)
+    total_chunks = 0
+    durations = []
+    
+    def record(result: dict):
+        nonlocal processed, failed, total_chunks
+        done = processed + (failed - len(missing)) + 1
+        if result["status"] == "processed":
             processed += 1
+            total_chunks += result["chunks"]
+            durations.append((result["seconds"], result["paper_id"]))
+        else:
+            failed += 1
+            log_event(logger=logger, level=logging.ERROR, message="Extraction Failed", paper_id=result["paper_id"], error=result.get("error"))
+        
+        if done % PROGRESS_EVERY == 0 or done == len(tasks):
+            elapsed = time.perf_counter() - t0
+            log_event(
+                logger = logger, 
+                level = logging.INFO, 
+                message = "Progress", 
+                done = done, 
+                total = len(tasks), 
+                papers_per_sec = round(done / elapsed, 3) if elapsed else None
+            )
+    
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            record(process_paper(task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(process_paper, task) for task in tasks]
+            for fut in as_completed(futures):
+                record(fut.result())
+    
+    elapsed = time.perf_counter() - t0
+    report = {
+        "completed_at": datetime.now(timezone.utc).isoformat(),
+        "workers": workers,
+        "chunk_params": chunk_params,
+        "chunker_version": CHUNKER_VERSION,
+        "papers_total": len(expected),
+        "processed": processed,
+        "skipped_unchanged": len(unchanged),
+        "failed": failed,
+        "missing_pdf": len(missing),
+        "pruned": pruned,
+        "chunks_written": total_chunks,
+        "elapsed_sec": round(elapsed, 3),
+        "papers_per_sec": round(processed / elapsed, 3) if elapsed and processed else 0.0,
+        "avg_sec_per_paper": round(sum(d for d, _ in durations) / len(durations), 3) if durations else 0.0,
+        "slowest": [{"paper_id": pid, "seconds": round(d, 3)} for d, pid in sorted(durations, reverse=True)[:5]],
+    }
+    REPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with REPORT_PATH.open("w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
             
-    log_event(logger=logger, level=logging.INFO, message="Complete", processed=processed, skipped=skipped, failed=failed)
+    log_event(logger=logger, level=logging.INFO, message="Complete", processed=processed, skipped=len(unchanged), failed=failed, elapsed_sec=report["elapsed_sec"], report=str(REPORT_PATH))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--input_dir", type=Path, required=True, help="Path to raw PDFs")
     parser.add_argument("--output_dir", type=Path, required=True, help="Path to save chunks")
     parser.add_argument("--meta_dir", type=Path, default=Path("data/raw/metadata"), help="Path to metadata")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores, 1 = in-process)")
     
     args = parser.parse_args()
     
-    extract_and_chunk(args.input_dir, args.meta_dir, args.output_dir)
\ No newline at end of file
+    extract_and_chunk(args.input_dir, args.meta_dir, args.output_dir, workers=args.workers)
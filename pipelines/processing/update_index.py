@@ -0,0 +1,394 @@
+import os
+import json
+import shutil
+import logging
+import argparse
+from pathlib import Path
+from typing import List
+
+import faiss
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from utils.logging import setup_logger, log_event
+from scripts.write_index_manifest import write_index_manifest
+from pipelines.processing.build_embeddings_and_faiss import MODEL_NAME, iter_sentence_vectors, lazy_encoder, load_chunk_files, load_min_length
+from pipelines.processing.embedding_cache import EMBEDDING_CACHE_DIR, EmbeddingCache
+from pipelines.retrieval import meta_store, segments
+from pipelines.retrieval.meta_store import MetaStore, MetaStoreWriter
+from pipelines.retrieval.text_store import TEXT_BLOB, TEXT_OFFSETS, TextStore, TextStoreWriter
+from pipelines.retrieval.sentence_store import SENTENCE_OFFSETS, SENTENCE_VECTORS, SentenceStore, SentenceStoreWriter, remove_sentence_store
+from pipelines.retrieval.hydrate import clean_pdf_artifacts
+from pipelines.retrieval.encoder import encoder_id, resolve_backend
+from pipelines.retrieval.index_factory import build_index, has_id_map, load_index_config, supports_remove
+
+FAISS_DIR = Path("data/processed/faiss")
+CHUNKS_DIR = Path("data/processed/chunks")
+
+# Compact (re-train + drop tombstoned rows) once this share of stored rows is dead
+COMPACT_THRESHOLD = 0.25
+# Rows copied per step when rewriting vectors.npy
+COPY_BLOCK = 65536
+
+# compact() builds the new store here, then publishes it file by file
+COMPACT_DIR = ".compact"
+# Written once everything is staged; its presence means "roll forward"
+COMPACT_READY = "READY.json"
+# Publish order: row stores, then the meta store (tables before columns), then the index
+COMPACT_PUBLISH_ORDER = [
+    "vectors.npy", segments.segment_list_path(Path("vectors.npy")).name,
+    TEXT_BLOB, segments.segment_list_path(Path(TEXT_BLOB)).name, TEXT_OFFSETS,
+    SENTENCE_VECTORS, segments.segment_list_path(Path(SENTENCE_VECTORS)).name, SENTENCE_OFFSETS,
+    *[f"meta/{name}" for name in (
+        meta_store.PAPERS_TABLE, meta_store.SECTIONS_TABLE, meta_store.CHUNK_ID_OVERRIDES,
+        meta_store.PAPER_COLUMN, meta_store.SECTION_COLUMN, meta_store.ORDER_COLUMN,
+        meta_store.ID_COLUMN, meta_store.LIVE_COLUMN,
+    )],
+    "index.faiss",
+]
+
+
+class MutableIndex:
+    """
+    Applies paper-level upserts and deletes to a built index in place.
+
+    Storage rows (vectors.npy, meta columns, text and sentence stores) are append-only: a
+    deleted or replaced chunk is tombstoned in the meta store and removed
+    from FAISS by its stable id. HNSW can't remove ids, so its stale entries
+    are filtered at query time until compact() rebuilds the index.
+
+    No file a running Retriever has mapped is ever modified: new rows go to
+    delta segments (pipelines.retrieval.segments) and every other file is
+    replaced through a temp file, publishing row stores first, then the
+    meta store, the index and finally the manifest.
+    """
+
+    def __init__(self, faiss_dir: Path = FAISS_DIR, cache_dir: Path = EMBEDDING_CACHE_DIR):
+        self.dir = faiss_dir
+        self.index_path = faiss_dir / "index.faiss"
+        self.meta_dir = faiss_dir / "meta"
+        self.vectors_path = faiss_dir / "vectors.npy"
+        self.staging_dir = faiss_dir / COMPACT_DIR
+        self.logger = setup_logger(name="Index_Update", log_dir="logs", level=logging.INFO)
+
+        # A compaction that crashed while publishing is completed before anything is read
+        self._finish_compaction()
+        self.index = faiss.read_index(str(self.index_path))
+        self.meta = MetaStoreWriter.from_store(self.meta_dir)
+        # Rows the published meta store references; store rows past it are leftovers of a crashed save
+        self.committed_rows = len(self.meta)
+        # Must match the backend the index was built with (embedding.build_backend)
+        self.backend = resolve_backend(role="build")
+        self.cache = EmbeddingCache(cache_dir, encoder_id(MODEL_NAME, self.backend))
+        self.cfg = load_index_config()
+        self._new_vectors: List[np.ndarray] = []
+        self._new_texts: List[str] = []
+        self._new_sentences: List[np.ndarray] = []
+        # Tombstones or rows not yet saved; compact() reads the published stores
+        self._dirty = False
+        
+        # Only kept up to date when the build wrote one that matches the rows
+        sentences = SentenceStore.open(faiss_dir)
+        self.sentences = bool(self.cfg["sentences"]["enabled"]) and sentences is not None and len(sentences) == len(self.meta)
+        del sentences
+        self.stats = {"papers_added": 0, "papers_removed": 0, "chunks_added": 0, "chunks_removed": 0}
+
+        if not has_id_map(self.index):
+            # Indexes built before stable ids (or on GPU) are keyed by row; re-key once
+            log_event(logger=self.logger, level=logging.WARNING, message="Index Has No Stable Ids, Compacting First")
+            self.compact()
+
+    def dead_fraction(self) -> float:
+        return 1.0 - sum(self.meta.live) / max(1, len(self.meta))
+
+    def _remove_ids(self, ids: List[int]):
+        if ids and supports_remove(self.index):
+            self.index.remove_ids(np.asarray(ids, dtype=np.int64))
+
+    def remove_papers(self, paper_ids: List[str]) -> int:
+        '''
+        Tombstones every live chunk of the given papers.
+        Returns:
+            int: Number of chunks removed.
+        '''
+        rows = self.meta.live_rows_of_papers(paper_ids)
+        ids = self.meta.tombstone(rows)
+        self._remove_ids(ids)
+        self._dirty = self._dirty or bool(ids)
+        self.stats["chunks_removed"] += len(ids)
+        return len(ids)
+
+    def add_papers(self, chunk_files: List[Path], min_length: int = 1) -> int:
+        '''
+        Upserts papers from their chunk files: existing chunks of the same
+        papers are tombstoned, then the new chunks are embedded (through the
+        embedding cache) and added under their stable ids.
+        Returns:
+            int: Number of chunks added.
+        '''
+        texts, meta, _ = load_chunk_files(chunk_files, min_length)
+        paper_ids = sorted({Path(p).stem for p in chunk_files} | {m["paper_id"] for m in meta})
+        self.remove_papers(paper_ids)
+        self.stats["papers_added"] += len(paper_ids)
+        if not texts:
+            return 0
+
+        encoder = lazy_encoder(show_progress_bar=False, backend=self.backend)
+        emb, hits = self.cache.get_or_encode(texts, encoder)
+        cleaned = [clean_pdf_artifacts(t) for t in texts]
+        if self.sentences:
+            sentence_cfg = self.cfg["sentences"]
+            for vectors, _ in iter_sentence_vectors(cleaned, self.cache, encoder, int(sentence_cfg["min_words"]), int(sentence_cfg["batch_size"])):
+                self._new_sentences.extend(vectors)
+        ids = [
+            self.meta.append(m["chunk_id"], m["paper_id"], m["source"], m["section"], m["order"], fingerprint=m.get("fingerprint"))
+            for m in meta
+        ]
+        self.index.add_with_ids(emb, np.asarray(ids, dtype=np.int64))
+        self._dirty = True
+
+        self._new_vectors.append(emb)
+        self._new_texts.extend(cleaned)
+        self.stats["chunks_added"] += len(texts)
+        log_event(logger=self.logger, level=logging.INFO, message="Papers Upserted", papers=len(paper_ids), chunks=len(texts), cache_hits=hits)
+        return len(texts)
+
+    def sync(self, chunks_dir: Path = CHUNKS_DIR, min_length: int = 1):
+        '''
+        Brings the index in line with the chunk directory: papers that are new
+        or whose extraction fingerprint changed are upserted, papers whose
+        chunk file is gone are removed.
+        '''
+        indexed = self.meta.live_fingerprints()
+        changed, present = [], set()
+        for path in sorted(chunks_dir.glob("*.json")):
+            with path.open("r", encoding="utf-8") as f:
+                doc = json.load(f)
+            present.add(doc["paper_id"])
+            fingerprint = doc.get("fingerprint")
+            if doc["paper_id"] not in indexed or not fingerprint or indexed[doc["paper_id"]] != fingerprint:
+                changed.append(path)
+
+        gone = sorted(set(indexed) - present)
+        if gone:
+            self.remove_papers(gone)
+            self.stats["papers_removed"] += len(gone)
+        if changed:
+            self.add_papers(changed, min_length)
+        log_event(logger=self.logger, level=logging.INFO, message="Sync Planned", upserted=len(changed), removed=len(gone), unchanged=len(present) - len(changed))
+
+    def _append_vectors(self):
+        '''
+        Writes the pending rows as a new vectors.npy segment: O(new rows), and
+        the committed rows (mapped by running retrievers) are left untouched.
+        '''
+        new = np.concatenate(self._new_vectors)
+        base_rows, published = segments.read_segments(self.vectors_path)
+        if base_rows is None:
+            base_rows = int(np.load(self.vectors_path, mmap_mode="r").shape[0])
+        published = segments.trim_segments(base_rows, published, self.committed_rows)
+
+        def write(tmp_path: Path):
+            with tmp_path.open("wb") as f:
+                np.save(f, new)
+        published = segments.write_segment(self.vectors_path, published, write, len(new))
+        segments.publish_segments(self.vectors_path, base_rows, published)
+        segments.remove_stale_segments(self.vectors_path)
+        self._new_vectors = []
+
+    def _stage_vectors(self, rows: np.ndarray, out_path: Path):
+        '''
+        Copies the selected rows (base file and segments) into a new single
+        vectors file, block by block so peak memory stays bounded.
+        '''
+        old = segments.open_segmented(self.vectors_path, segments.load_npy_rows)
+        out = open_memmap(out_path, mode="w+", dtype=np.float32, shape=(len(rows), old.shape[1]))
+        for start in range(0, len(rows), COPY_BLOCK):
+            block = rows[start:start + COPY_BLOCK]
+            out[start:start + len(block)] = old[block]
+        out.flush()
+        del out, old
+        segments.publish_segments(out_path, len(rows), [])
+
+    def _write_index(self):
+        tmp_path = self.index_path.with_suffix(".tmp")
+        faiss.write_index(self.index, str(tmp_path))
+        tmp_path.replace(self.index_path)
+
+    def save(self, operation: dict):
+        '''
+        Persists pending changes. New rows go to fresh segments of the row
+        stores, published before the meta store that references them, then
+        the index, then the manifest. A save that crashes part way leaves
+        only unreferenced rows, which the next save drops.
+        '''
+        if self._new_vectors:
+            self._append_vectors()
+        if self._new_texts:
+            with TextStoreWriter(self.dir, append=True, rows=self.committed_rows) as writer:
+                for text in self._new_texts:
+                    writer.append(text)
+            self._new_texts = []
+        if self._new_sentences:
+            with SentenceStoreWriter(self.dir, append=True, rows=self.committed_rows) as writer:
+                for vectors in self._new_sentences:
+                    writer.append(vectors)
+            self._new_sentences = []
+        self.meta.write(self.meta_dir)
+        self.committed_rows = len(self.meta)
+        self._write_index()
+        self._write_manifest(operation)
+        self._dirty = False
+
+    def compact(self):
+        '''
+        Drops tombstoned rows from every store and rebuilds (re-trains) the
+        index over the live vectors, keeping each chunk's stable id. The new
+        store is staged completely in .compact/ and then published; if that
+        is interrupted, the next MutableIndex finishes it. Pending upserts
+        and removals are saved first.
+        '''
+        if self._dirty:
+            self.save({"op": "update", **self.stats})
+
+        old_meta = MetaStore(self.meta_dir)
+        live_rows = np.flatnonzero(np.asarray(old_meta.live))
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        self.staging_dir.mkdir(parents=True)
+
+        staged_vectors = self.staging_dir / self.vectors_path.name
+        self._stage_vectors(live_rows, staged_vectors)
+        texts = TextStore(self.dir)
+        with TextStoreWriter(self.staging_dir) as writer:
+            for row in live_rows:
+                writer.append(texts[row])
+        del texts
+        if self.sentences:
+            sentences = SentenceStore(self.dir)
+            with SentenceStoreWriter(self.staging_dir) as writer:
+                for row in live_rows:
+                    writer.append(sentences[row])
+            del sentences
+
+        writer = MetaStoreWriter()
+        for row in live_rows:
+            m = old_meta[row]
+            paper = old_meta.papers[int(old_meta.paper_idx[row])]
+            writer.append(m["chunk_id"], m["paper_id"], m["source"], m["section"], m["order"], fingerprint=paper.get("fingerprint"))
+        writer.write(self.staging_dir / "meta")
+        del old_meta
+
+        emb = np.load(staged_vectors, mmap_mode="r")
+        index, index_params = build_index(emb, self.cfg, ids=np.asarray(writer.ids, dtype=np.int64))
+        faiss.write_index(index, str(self.staging_dir / "index.faiss"))
+        del emb
+
+        segments.atomic_write_json(self.staging_dir / COMPACT_READY, {
+            "operation": {"op": "compact", "chunks": len(live_rows)},
+            "index_params": index_params,
+            "build_stats": {"chunks_indexed": len(live_rows), "rows_stored": len(live_rows), "tombstones": 0},
+            "sentences": bool(self.sentences),
+        })
+        self._finish_compaction()
+        self.index = index
+        self.meta = writer
+        self.committed_rows = len(writer)
+        log_event(logger=self.logger, level=logging.INFO, message="Index Compacted", chunks=len(live_rows), **index_params)
+
+    def _finish_compaction(self) -> bool:
+        '''
+        Publishes a fully staged compaction in COMPACT_PUBLISH_ORDER, then
+        drops the folded segments and writes the manifest. Idempotent, so it
+        can roll forward a compaction that crashed while publishing; a
+        staging dir without the READY marker is an incomplete one and is
+        discarded.
+        Returns:
+            bool: True if a staged compaction was published.
+        '''
+        ready = self.staging_dir / COMPACT_READY
+        if not ready.exists():
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            return False
+        with ready.open("r", encoding="utf-8") as f:
+            plan = json.load(f)
+
+        for name in COMPACT_PUBLISH_ORDER:
+            staged = self.staging_dir / name
+            if staged.exists():
+                (self.dir / name).parent.mkdir(parents=True, exist_ok=True)
+                os.replace(staged, self.dir / name)
+        for base in (self.vectors_path, self.dir / TEXT_BLOB, self.dir / SENTENCE_VECTORS):
+            segments.remove_stale_segments(base)
+        if not plan["sentences"]:
+            # Its rows belong to the pre-compaction layout
+            remove_sentence_store(self.dir)
+
+        self._write_manifest(plan["operation"], plan["index_params"], plan["build_stats"])
+        shutil.rmtree(self.staging_dir)
+        log_event(logger=self.logger, level=logging.INFO, message="Compaction Published", **plan["operation"])
+        return True
+
+    def _write_manifest(self, operation: dict, index_params: dict = None, build_stats: dict = None):
+        if build_stats is None:
+            live = int(sum(self.meta.live))
+            build_stats = {"chunks_indexed": live, "rows_stored": len(self.meta), "tombstones": len(self.meta) - live}
+        try:
+            write_index_manifest(
+                index_params=index_params or self._previous_index_params(),
+                build_stats=build_stats,
+                operation=operation
+            )
+        except Exception as e:
+            log_event(logger=self.logger, level=logging.WARNING, message="Manifest Not Written", error=str(e))
+
+    def _previous_index_params(self) -> dict:
+        manifest_path = self.dir / "index_manifest.json"
+        if not manifest_path.exists():
+            return None
+        with manifest_path.open("r", encoding="utf-8") as f:
+            return json.load(f).get("index")
+
+
+def resolve_chunk_files(papers: List[str], chunks_dir: Path) -> List[Path]:
+    # Accepts chunk file paths or bare paper ids
+    files = []
+    for p in papers:
+        path = Path(p)
+        files.append(path if path.suffix == ".json" else chunks_dir / f"{p}.json")
+    missing = [str(f) for f in files if not f.exists()]
+    if missing:
+        raise FileNotFoundError(f"Chunk files not found: {missing}")
+    return files
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally update the FAISS index without a full rebuild")
+    parser.add_argument("command", choices=["sync", "add", "remove", "compact"])
+    parser.add_argument("papers", nargs="*", help="Paper ids (or chunk files for add)")
+    parser.add_argument("--faiss_dir", type=Path, default=FAISS_DIR)
+    parser.add_argument("--chunks_dir", type=Path, default=CHUNKS_DIR)
+    parser.add_argument("--cache_dir", type=Path, default=EMBEDDING_CACHE_DIR)
+    parser.add_argument("--no_auto_compact", action="store_true", help=f"Don't compact past {COMPACT_THRESHOLD:.0%} tombstones")
+    args = parser.parse_args()
+
+    store = MutableIndex(args.faiss_dir, args.cache_dir)
+
+    if args.command == "compact":
+        store.compact()
+        return
+
+    if args.command == "sync":
+        store.sync(args.chunks_dir, load_min_length())
+    elif args.command == "add":
+        store.add_papers(resolve_chunk_files(args.papers, args.chunks_dir), load_min_length())
+    else:
+        store.remove_papers(args.papers)
+        store.stats["papers_removed"] += len(args.papers)
+
+    store.save({"op": args.command, **store.stats})
+    log_event(logger=store.logger, level=logging.INFO, message="Index Updated", vectors=store.index.ntotal, dead_fraction=round(store.dead_fraction(), 4), **store.stats)
+
+    if not args.no_auto_compact and store.dead_fraction() > COMPACT_THRESHOLD:
+        store.compact()
+
+if __name__ == "__main__":
+    main()
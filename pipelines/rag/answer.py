@@ -1,12 +1,16 @@
 import json
 import logging
 import os
+import asyncio
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional, Dict, Any
 import time
 
 from utils.mlflow_handler import MLflowHandler 
 from utils.mlflow_schema import RunType, ALLOWED_METRICS
-from utils.metadata import get_git_commit, get_index_hash, PROMPT_VERSION, GUARDRAIL_VERSION
+from utils.metadata import get_identity, IdentitySnapshot
 
 from google import genai
 
@@ -15,10 +19,37 @@ from pipelines.retrieval.search import Retriever
 from pipelines.postprocess.checks import HallucinationChecker 
 from pipelines.postprocess.align import Attributor, split_into_sentences
 from pipelines.retrieval.hydrate import attach_text
-from scripts.compute_dataset_hash import compute_dataset_hash
+from pipelines.rag.answer_cache import get_answer_cache
 from utils.logging import log_event, setup_logger
 from pipelines.postprocess.confidence import ConfidenceScorer
 from pipelines.postprocess.refusal import check_refusal
+from utils.helper_functions import load_yaml
+
+GEMINI_MODEL = "gemini-2.5-flash-lite"
+GENERATION_CONFIG = {
+    "temperature": 0.0, 
+    "max_output_tokens": 1024,
+}
+# Evidence chunks per query when neither the call nor the retriever sets top_k
+DEFAULT_TOP_K = 8
+# Generation attempts per query (empty responses / citation errors retry)
+MAX_RETRIES = 3
+# Wait before retrying after an empty LLM response
+RETRY_BACKOFF_SEC = 1.0
+
+# Defaults for params.yaml -> serving
+DEFAULT_SERVING_CONFIG = {
+    "max_concurrent_llm": 16,   # /query requests generating at once; more get 429
+    "deadline_sec": 60.0,       # per-request budget (requests may ask for less); exceeded -> 503
+    "executor_workers": 8,      # threads for retrieval / verification of async requests
+}
+
+def load_serving_config(params_path: str = "params.yaml") -> dict:
+    try:
+        params = load_yaml(params_path) or {}
+    except FileNotFoundError:
+        params = {}
+    return {**DEFAULT_SERVING_CONFIG, **(params.get("serving") or {})}
 
 
 class LLM:
@@ -28,52 +59,68 @@ class LLM:
     def generate(self, prompt: str) -> str:
         try:
             response = self.client.models.generate_content(
-                model="gemini-2.5-flash-lite", 
+                model=GEMINI_MODEL, 
+                contents=prompt,
+                config=GENERATION_CONFIG,
+            )
+            return response.text.strip()
+        except Exception as e:
+            return ""
+
+    async def agenerate(self, prompt: str) -> str:
+        # Same request on the client's async transport; doesn't hold a thread
+        try:
+            response = await self.client.aio.models.generate_content(
+                model=GEMINI_MODEL, 
                 contents=prompt,
-                config={
-                    "temperature": 0.0, 
-                    "max_output_tokens": 1024,
-                },
+                config=GENERATION_CONFIG,
             )
             return response.text.strip()
         except Exception as e:
             return ""
 
+    async def astream(self, prompt: str):
+        # Yields text as the model produces it; a failed call just ends the stream
+        try:
+            stream = await self.client.aio.models.generate_content_stream(
+                model=GEMINI_MODEL, 
+                contents=prompt,
+                config=GENERATION_CONFIG,
+            )
+            async for chunk in stream:
+                if chunk.text:
+                    yield chunk.text
+        except Exception as e:
+            return
 
-def log_rag_run(query, answer, citations, dataset_hash, metrics):
-    tags = {
-        "dataset_hash": dataset_hash,
+
+def log_rag_run(query, answer, citations, identity: IdentitySnapshot, metrics):
+    tags = identity.as_tags()
+    tags.update({
         "query": query,
-        "index_hash": get_index_hash(),
-        "prompt_version": PROMPT_VERSION,
-        "guardrail_version": GUARDRAIL_VERSION,
-        "git_commit": get_git_commit(),
         "run_type": RunType.GUARDRAIL.value 
-    }
+    })
     
     # FILTER METRICS TO COMPLY WITH SCHEMA
     allowed_keys = ALLOWED_METRICS[RunType.GUARDRAIL]
     filtered_metrics = {k: v for k, v in metrics.items() if k in allowed_keys}
     
-    with MLflowHandler.start_run(
-        run_name="rag_query", 
-        run_type=RunType.GUARDRAIL, 
-        tags=tags, 
-        nested=True
-    ) as run:
-        # Log only the allowed numerical metrics
-        MLflowHandler.log_metrics(RunType.GUARDRAIL, filtered_metrics)
-        
-        # Log refusal reason as a param if present
-        if metrics.get("refusal_reason"):
-             MLflowHandler.log_params({"refusal_reason": metrics["refusal_reason"]})
-
-        if hasattr(run, "info"):
-            return run.info.run_id
-        return None
+    # Log refusal reason as a param if present
+    params = {"refusal_reason": metrics["refusal_reason"]} if metrics.get("refusal_reason") else None
+    
+    # Validated here, written off the request path; refusals are never sampled out.
+    # The returned id is the run's log_record_id tag (nested under any active run).
+    return MLflowHandler.submit_run(
+        run_name="rag_query",
+        run_type=RunType.GUARDRAIL,
+        tags=tags,
+        metrics=filtered_metrics,
+        params=params,
+        priority=float(metrics.get("refusal_triggered", 0.0)) > 0.5
+    )
 
 
-def _construct_refusal(query, evidence, reason, dataset_hash, prior_metrics=None):
+def _construct_refusal(query, evidence, reason, identity: IdentitySnapshot, prior_metrics=None):
     metrics = {
         "retrieval_latency": 0.0,
         "llm_latency": 0.0,
@@ -92,7 +139,7 @@ def _construct_refusal(query, evidence, reason, dataset_hash, prior_metrics=None
         metrics["refusal_triggered"] = 1.0
         metrics["refusal_reason"] = reason
     
-    run_id = log_rag_run(query, "REFUSAL", [], dataset_hash, metrics)
+    log_record_id = log_rag_run(query, "REFUSAL", [], identity, metrics)
 
     return {
         "query": query,
@@ -100,8 +147,8 @@ def _construct_refusal(query, evidence, reason, dataset_hash, prior_metrics=None
         "answer_sentences": [],
         "citations": [],
         "metrics": metrics,
-        "run_id": run_id,
-        "index_hash": get_index_hash()
+        "log_record_id": log_record_id,
+        "index_hash": identity.index_hash
     }
 
 
@@ -113,6 +160,70 @@ def format_evidence(evidence: List[dict]) -> str:
     return "\n\n".join(blocks)
 
 
+def build_prompt(query: str, evidence: List[dict]) -> str:
+    evidence_text = format_evidence(evidence)
+    system_prompt = f"""
+    You are a scholarly assistant.
+    
+    Rules:
+    - Use ONLY the evidence provided below.
+    - Every sentence MUST include a citation in the format [index].
+    - Example: "The sky is blue [1]."
+    - If the evidence is insufficient, say: "UNSUPPORTED"
+    
+    Evidence:
+    {evidence_text}
+    """
+    return f"{system_prompt}\n\nQuestion:\n{query}"
+
+
+class CitationTracker:
+    """
+    Numbers the evidence chunks an answer cites in order of first use and
+    keeps each citation's best alignment score. Shared by the batch and the
+    streaming answer paths so both number citations identically.
+    """
+    
+    def __init__(self, evidence: List[dict]):
+        self.evidence = evidence
+        self.used: Dict[int, dict] = {}
+        
+    def add(self, det: Dict[str, Any]) -> dict:
+        '''
+        Registers one verified sentence; returns it as an answer sentence.
+        '''
+        c_indices = []
+        if det["verification_status"] == "supported" and det["supported_by_chunk_index"] is not None:
+            idx = det["supported_by_chunk_index"]
+            if 0 <= idx < len(self.evidence):
+                if idx not in self.used:
+                     chunk = self.evidence[idx]
+                     safe_text = chunk.get("text") or ""
+                 
+                     self.used[idx] = {
+                         "citation_id": len(self.used) + 1,
+                         "paper_id": chunk["paper_id"],
+                         "section": chunk["section"],
+                         "text": safe_text,
+                         "score": float(det["max_score"])
+                     }
+                else:
+                    if float(det["max_score"]) > self.used[idx]["score"]:
+                         self.used[idx]["score"] = float(det["max_score"])
+            
+                c_indices.append(self.used[idx]["citation_id"])
+        
+        return {
+            "text": det["sentence"],
+            "verification_status": det["verification_status"],
+            "citation_indices": c_indices
+        }
+    
+    @property
+    def citations(self) -> List[dict]:
+        return sorted(self.used.values(), key=lambda x: x["citation_id"])
+
+
 def adapt_for_rag(results, query):
     adapted = []
     for r in results:
@@ -128,6 +239,7 @@ def adapt_for_rag(results, query):
                 order = 0
                 
         adapted.append({
+            "row_id": r.get("row_id"),
             "paper_id": r.get("paper_id", "unknown"),
             "chunk_id": chunk_id,
             "section": section,
@@ -141,93 +253,388 @@ def adapt_for_rag(results, query):
     }
 
 
-def answer(
-    query: str, 
-    top_k: int = 8, 
-    k_min: int = 1, 
-    mode: str = "strict", 
-    retriever = None, 
-    eval_mode: bool = False,
-    relevant_papers: Optional[List[str]] = None, 
-    confidence_threshold: float = 0.0
-):
-    logger = setup_logger(name="rag_answer", log_dir="./logs", level=logging.INFO)
-    
-    if retriever is None:
-        retriever = Retriever(top_k=top_k)
+class RAGPipeline:
+    """
+    Long-lived answer pipeline. Owns the retriever, the LLM client (and its
+    HTTP connection pool), the checker, attributor and confidence scorer, so
+    a query only pays for retrieval, generation and verification. One
+    instance is shared by the API, the eval harness and the data scripts.
+
+    The answer logic is a generator (_answer_steps) that yields prompts and
+    receives LLM responses; answer() drives it synchronously, aanswer()
+    awaits the LLM and runs the CPU steps on a thread pool.
+
+    Verified answers go to the answer cache (answer_cache.py, off by
+    default); a repeat or safe paraphrase of a cached query with the same
+    index / prompt / guardrail versions and request knobs is answered from
+    it without generation.
+    """
     
-    attributor = Attributor(retriever.model)
-    checker = HallucinationChecker() 
-    current_dataset_hash = compute_dataset_hash()
-    current_index_hash = get_index_hash()
+    def __init__(self, retriever = None, llm: Optional[LLM] = None, top_k: int = DEFAULT_TOP_K, config: Optional[dict] = None):
+        self.logger = setup_logger(name="rag_answer", log_dir="./logs", level=logging.INFO)
+        self.config = config or load_serving_config()
+        self.retriever = retriever if retriever is not None else Retriever(top_k=top_k)
+        self._llm = llm
+        self._executor = None
+        self._lock = threading.Lock()
         
-    t0_retrieval = time.time()
-    raw = retriever.search(query)
-    retrieved_ids = [r["paper_id"] for r in raw.get("results", [])]
-    
-    retrieved = adapt_for_rag(raw.get("results", []), query)
-    hydrated = attach_text(retrieved)
-    evidence = hydrated["results"]
-    t1_retrieval = time.time()
-    retrieval_latency = t1_retrieval - t0_retrieval
-    
-    base_metrics = {"retrieval_latency": retrieval_latency}
+        # Looked up per call rather than bound here, so a pipeline given a
+        # weakref.proxy of its retriever (get_pipeline) never pins it
+        vector_source = self._evidence_vectors if hasattr(self.retriever, "evidence_vectors") else None
+        self.attributor = Attributor(self.retriever.model, vector_source=vector_source)
+        self.checker = HallucinationChecker()
+        self.scorer = ConfidenceScorer()
+        # Needs query embeddings; retrievers without embed_query() skip it
+        self.answer_cache = get_answer_cache() if hasattr(self.retriever, "embed_query") else None
+        
+    @property
+    def llm(self) -> LLM:
+        # Created on first generation: retrieval-only refusals need no API key
+        if self._llm is None:
+            with self._lock:
+                if self._llm is None:
+                    self._llm = LLM()
+        return self._llm
     
-    metrics = base_metrics.copy()
-    metrics.update({
-        "llm_latency": 0.0, 
-        "refusal_triggered": 0.0, 
-        "num_total_sentences": 0, 
-        "confidence_score": 0.0,
-        "num_supported_sentences": 0,
-        "retrieved_chunks": len(evidence)
-    })
-
-    should_refuse, reason = check_refusal(
-        retrieved_chunks=evidence,
-        alignment_details=[], 
-        confidence_score=0.0,
-        confidence_threshold=confidence_threshold,
-        min_distinct_papers=k_min
-    )
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        # Retrieval / verification for the async path; created on first use
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=int(self.config["executor_workers"]),
+                        thread_name_prefix="rag-cpu"
+                    )
+        return self._executor
     
-    if should_refuse and not evidence:
-         return _construct_refusal(query, evidence, reason, current_dataset_hash, base_metrics)
-
-    evidence_text = format_evidence(evidence)
-    system_prompt = f"""
-    You are a scholarly assistant.
+    def resolve_top_k(self, top_k: Optional[int] = None) -> int:
+        # Unset -> the retriever's own top_k, as Retriever.search() does for k
+        return top_k or getattr(self.retriever, "top_k", DEFAULT_TOP_K)
     
-    Rules:
-    - Use ONLY the evidence provided below.
-    - Every sentence MUST include a citation in the format [index].
-    - Example: "The sky is blue [1]."
-    - If the evidence is insufficient, say: "UNSUPPORTED"
+    def _evidence_vectors(self, rows: List[int]):
+        return self.retriever.evidence_vectors(rows)
     
-    Evidence:
-    {evidence_text}
-    """
-
-    MAX_RETRIES = 3 
-    attempt = 0
-    current_prompt = f"{system_prompt}\n\nQuestion:\n{query}"
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        
+    def answer(
+        self,
+        query: str, 
+        top_k: Optional[int] = None, 
+        k_min: int = 1, 
+        mode: str = "strict", 
+        eval_mode: bool = False,
+        relevant_papers: Optional[List[str]] = None, 
+        confidence_threshold: float = 0.0,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        use_cache: bool = True
+    ):
+        top_k = self.resolve_top_k(top_k)
+        cache_params = self._cache_params(top_k, k_min, mode, relevant_papers, confidence_threshold, nprobe, ef_search)
+        use_cache = use_cache and not eval_mode
+        query_vector, cached = self._cache_get(query, cache_params) if use_cache else (None, None)
+        if cached is not None:
+            return cached
+        
+        steps = self._answer_steps(query, top_k, k_min, mode, relevant_papers, confidence_threshold, nprobe, ef_search)
+        done, value = _advance(steps, None)
+        while not done:
+            response = self.llm.generate(value)
+            if not response:
+                time.sleep(RETRY_BACKOFF_SEC)
+            done, value = _advance(steps, response)
+        self._cache_put(query, query_vector, cache_params, value)
+        return value
     
-    llm = LLM()
-    t0_llm = time.time()
+    async def aanswer(
+        self,
+        query: str, 
+        top_k: Optional[int] = None, 
+        k_min: int = 1, 
+        mode: str = "strict", 
+        eval_mode: bool = False,
+        relevant_papers: Optional[List[str]] = None, 
+        confidence_threshold: float = 0.0,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        use_cache: bool = True
+    ):
+        '''
+        Non-blocking answer(): the LLM call and retry backoff are awaited on the
+        event loop; retrieval and verification run on the pipeline's executor.
+        Cancelling the task (e.g. a deadline) abandons the remaining steps.
+        '''
+        loop = asyncio.get_running_loop()
+        top_k = self.resolve_top_k(top_k)
+        cache_params = self._cache_params(top_k, k_min, mode, relevant_papers, confidence_threshold, nprobe, ef_search)
+        use_cache = use_cache and not eval_mode
+        query_vector, cached = (await loop.run_in_executor(self.executor, self._cache_get, query, cache_params)) if use_cache else (None, None)
+        if cached is not None:
+            return cached
+        
+        steps = self._answer_steps(query, top_k, k_min, mode, relevant_papers, confidence_threshold, nprobe, ef_search)
+        done, value = await loop.run_in_executor(self.executor, _advance, steps, None)
+        while not done:
+            response = await self.llm.agenerate(value)
+            if not response:
+                await asyncio.sleep(RETRY_BACKOFF_SEC)
+            done, value = await loop.run_in_executor(self.executor, _advance, steps, response)
+        await loop.run_in_executor(self.executor, self._cache_put, query, query_vector, cache_params, value)
+        return value
     
-    while attempt < MAX_RETRIES:
-        log_event(logger=logger, level=logging.INFO, message=f"Generation Attempt {attempt + 1}")
+    async def astream(
+        self,
+        query: str, 
+        top_k: Optional[int] = None, 
+        k_min: int = 1, 
+        mode: str = "strict", 
+        relevant_papers: Optional[List[str]] = None, 
+        confidence_threshold: float = 0.0,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        use_cache: bool = True
+    ):
+        '''
+        Streaming answer: yields (event, data) pairs.
+            retrieved  evidence count + retrieval latency
+            token      raw LLM text as it arrives
+            sentence   a completed sentence that passed the citation check and
+                       attribution, with the citations it uses
+            retract    the tokens / sentences streamed so far are withdrawn
+                       (before a retry, or before a refusal); clients must
+                       discard them
+            refusal    final; same dict as answer() for a refusal
+            done       final; same dict as answer()
+        Each sentence is verified as soon as the next one starts. The answer
+        is gated exactly like answer(): an empty response or a citation error
+        anywhere in it retracts the attempt and retries with feedback, up to
+        MAX_RETRIES times; otherwise every completed sentence goes through
+        the same scoring and refusal gate, so one unsupported sentence
+        refuses the answer. Sentences after an unsupported one are only
+        citation-checked and not streamed. On a refusal the streamed
+        sentences are retracted first.
+        A cached answer is replayed as its sentences followed by done.
+        '''
+        loop = asyncio.get_running_loop()
+        top_k = self.resolve_top_k(top_k)
+        cache_params = self._cache_params(top_k, k_min, mode, relevant_papers, confidence_threshold, nprobe, ef_search)
+        query_vector, cached = (await loop.run_in_executor(self.executor, self._cache_get, query, cache_params)) if use_cache else (None, None)
+        if cached is not None:
+            yield "retrieved", {"chunks": cached["metrics"].get("retrieved_chunks", 0), "retrieval_latency": 0.0, "cached": True}
+            citations = {c["citation_id"]: c for c in cached["citations"]}
+            for sentence in cached["answer_sentences"]:
+                yield "sentence", {**sentence, "citations": [citations[i] for i in sentence["citation_indices"] if i in citations]}
+            yield "done", cached
+            return
         
-        response = llm.generate(current_prompt)
+        current_identity = get_identity()
+        evidence, retrieved_ids, retrieval_latency = await loop.run_in_executor(
+            self.executor, self._retrieve, query, top_k, nprobe, ef_search
+        )
+        yield "retrieved", {"chunks": len(evidence), "retrieval_latency": retrieval_latency}
         
-        if not response:
-            log_event(logger=logger, level=logging.WARNING, message=f"Attempt {attempt + 1} failed: Empty Response")
-            attempt += 1
-            time.sleep(1)
-            continue
-
-        current_errors = []
+        base_metrics = {"retrieval_latency": retrieval_latency}
+        should_refuse, reason = check_refusal(
+            retrieved_chunks=evidence,
+            alignment_details=[], 
+            confidence_score=0.0,
+            confidence_threshold=confidence_threshold,
+            min_distinct_papers=k_min
+        )
+        if should_refuse and not evidence:
+            yield "refusal", await loop.run_in_executor(self.executor, _construct_refusal, query, evidence, reason, current_identity, base_metrics)
+            return
+        
+        current_prompt = build_prompt(query, evidence)
+        t0_llm = time.time()
+        
+        for attempt in range(MAX_RETRIES):
+            log_event(logger=self.logger, level=logging.INFO, message=f"Generation Attempt {attempt + 1}", stream=True)
+            tracker = CitationTracker(evidence)
+            details: List[Dict[str, Any]] = []
+            final_sentences: List[dict] = []
+            unsupported = False
+            citation_errors: List[str] = []
+            buffer, completed = "", 0
+            
+            stream = self.llm.astream(current_prompt)
+            try:
+                finished = False
+                while not citation_errors and not finished:
+                    try:
+                        piece = await stream.__anext__()
+                        buffer += piece
+                        yield "token", {"text": piece}
+                        # The last split is still being written
+                        pending = split_into_sentences(buffer)[completed:-1]
+                    except StopAsyncIteration:
+                        finished = True
+                        pending = split_into_sentences(buffer)[completed:]
+                    
+                    for sentence in pending:
+                        completed += 1
+                        if unsupported:
+                            # The answer is refused unless a later citation error makes answer() retry instead
+                            citation_errors = self.checker.run_checks(sentence, evidence)["errors"]
+                            if citation_errors:
+                                break
+                            continue
+                        det, errors = await loop.run_in_executor(self.executor, self._verify_sentence, sentence, evidence)
+                        if errors:
+                            citation_errors = errors
+                            break
+                        details.append(det)
+                        if not det["supported"]:
+                            unsupported = True
+                            continue
+                        answer_sentence = tracker.add(det)
+                        final_sentences.append(answer_sentence)
+                        cited = [c for c in tracker.citations if c["citation_id"] in answer_sentence["citation_indices"]]
+                        yield "sentence", {**answer_sentence, "citations": cited}
+            finally:
+                await stream.aclose()
+            
+            if buffer.strip() and not citation_errors:
+                break
+            
+            # Same retry path as answer(): withdraw this attempt, then regenerate
+            error_msg = "; ".join(citation_errors) or "Empty Response"
+            log_event(logger=self.logger, level=logging.WARNING, message=f"Attempt {attempt + 1} failed: {error_msg}", stream=True)
+            if buffer:
+                yield "retract", {"reason": error_msg, "attempt": attempt + 1}
+            if citation_errors:
+                current_prompt += f"\n\nPREVIOUS RESPONSE REJECTED. REASON: {error_msg}. \nREWRITE CORRECTLY USING [index]."
+            else:
+                await asyncio.sleep(RETRY_BACKOFF_SEC)
+        else:
+            metrics = base_metrics.copy()
+            metrics.update({"llm_latency": time.time() - t0_llm, "retrieved_chunks": len(evidence)})
+            yield "refusal", await loop.run_in_executor(self.executor, _construct_refusal, query, evidence, "Max Retries Failed", current_identity, metrics)
+            return
+        
+        # Same gate as answer(): every verified sentence, including an unsupported one
+        metrics = base_metrics.copy()
+        metrics.update({
+            "llm_latency": time.time() - t0_llm, 
+            "refusal_triggered": 0.0, 
+            "num_total_sentences": len(details), 
+            "confidence_score": 0.0,
+            "num_supported_sentences": len([d for d in details if d["verification_status"] == "supported"]),
+            "retrieved_chunks": len(evidence)
+        })
+        metrics.update(self.scorer.calculate(
+            alignment_details = details,
+            retrieved_ids = retrieved_ids, 
+            relevant_papers=relevant_papers if relevant_papers is not None else [], 
+            k = top_k
+        ))
+        should_refuse, reason = check_refusal(
+            retrieved_chunks=evidence,
+            alignment_details=details, 
+            confidence_score=metrics.get("confidence_score", 0.0),
+            confidence_threshold=confidence_threshold,
+            citation_precision=metrics.get("citation_precision", 1.0),
+            min_distinct_papers=k_min
+        )
+        if should_refuse:
+            metrics["refusal_reason"] = reason
+            yield "retract", {"reason": reason, "attempt": attempt + 1}
+            yield "refusal", await loop.run_in_executor(self.executor, _construct_refusal, query, evidence, reason, current_identity, metrics)
+            return
         
+        final_response_text = reconstruct_final_answer(details)
+        if mode == "synthesis" and not final_response_text.strip().lower().startswith("synthesis"):
+            final_response_text = "SYNTHESIS: " + final_response_text
+        final_citations = tracker.citations
+        audit_citations = [f"{c['paper_id']}:{c['section']}:{c['citation_id']}" for c in final_citations]
+        log_record_id = log_rag_run(query, final_response_text, audit_citations, current_identity, metrics)
+        
+        result = {
+            "query": query,
+            "answer": final_response_text,
+            "answer_sentences": final_sentences,
+            "citations": final_citations, 
+            'metrics': metrics,
+            "log_record_id": log_record_id,
+            "index_hash": current_identity.index_hash
+        }
+        await loop.run_in_executor(self.executor, self._cache_put, query, query_vector, cache_params, result)
+        yield "done", result
+    
+    def _cache_params(self, top_k, k_min, mode, relevant_papers, confidence_threshold, nprobe, ef_search) -> dict:
+        # Everything besides the query and the identity that changes the answer
+        return {
+            "top_k": top_k,
+            "k_min": k_min,
+            "mode": mode,
+            "relevant_papers": sorted(relevant_papers) if relevant_papers is not None else None,
+            "confidence_threshold": confidence_threshold,
+            "nprobe": nprobe,
+            "ef_search": ef_search,
+        }
+    
+    def _cache_get(self, query: str, params: dict):
+        '''
+        Returns:
+            (query embedding, cached answer or None); (None, None) without a cache.
+        '''
+        if self.answer_cache is None:
+            return None, None
+        vector = self.retriever.embed_query(query)
+        return vector, self.answer_cache.get(query, vector, get_identity().index_hash, params)
+    
+    def _cache_put(self, query: str, vector, params: dict, result: dict):
+        if self.answer_cache is not None and vector is not None:
+            self.answer_cache.put(query, vector, params, result)
+    
+    def _verify_sentence(self, sentence: str, evidence: List[dict]):
+        '''
+        Citation check + attribution of one answer sentence.
+        Returns:
+            (alignment detail, citation errors)
+        '''
+        syntax_result = self.checker.run_checks(sentence, evidence)
+        det = self.attributor.verify([sentence], evidence)["details"][0]
+        return det, syntax_result["errors"]
+    
+    def _retrieve(self, query: str, top_k: int, nprobe: Optional[int], ef_search: Optional[int]):
+        '''
+        Returns:
+            (hydrated evidence, retrieved paper ids, retrieval latency in seconds)
+        '''
+        t0_retrieval = time.time()
+        raw = self.retriever.search(query, k=top_k, nprobe=nprobe, ef_search=ef_search)
+        retrieved_ids = [r["paper_id"] for r in raw.get("results", [])]
+    
+        retrieved = adapt_for_rag(raw.get("results", []), query)
+        # Texts from the same loaded index generation as the hits
+        hydrated = attach_text(retrieved, store=getattr(self.retriever, "text_store", None))
+        return hydrated["results"], retrieved_ids, time.time() - t0_retrieval
+    
+    def _answer_steps(
+        self,
+        query: str, 
+        top_k: int, 
+        k_min: int, 
+        mode: str, 
+        relevant_papers: Optional[List[str]], 
+        confidence_threshold: float,
+        nprobe: Optional[int],
+        ef_search: Optional[int]
+    ):
+        '''
+        Yields each prompt to send to the LLM and receives its response;
+        returns the final answer or refusal dict.
+        '''
+        current_identity = get_identity()
+        evidence, retrieved_ids, retrieval_latency = self._retrieve(query, top_k, nprobe, ef_search)
+    
+        base_metrics = {"retrieval_latency": retrieval_latency}
+    
         metrics = base_metrics.copy()
         metrics.update({
             "llm_latency": 0.0, 
@@ -238,101 +645,180 @@ def answer(
             "retrieved_chunks": len(evidence)
         })
 
-        syntax_result = checker.run_checks(response, evidence)
+        should_refuse, reason = check_refusal(
+            retrieved_chunks=evidence,
+            alignment_details=[], 
+            confidence_score=0.0,
+            confidence_threshold=confidence_threshold,
+            min_distinct_papers=k_min
+        )
+    
+        if should_refuse and not evidence:
+             return _construct_refusal(query, evidence, reason, current_identity, base_metrics)
+
+        attempt = 0
+        current_prompt = build_prompt(query, evidence)
+    
+        t0_llm = time.time()
+    
+        while attempt < MAX_RETRIES:
+            log_event(logger=self.logger, level=logging.INFO, message=f"Generation Attempt {attempt + 1}")
+        
+            response = yield current_prompt
+        
+            if not response:
+                log_event(logger=self.logger, level=logging.WARNING, message=f"Attempt {attempt + 1} failed: Empty Response")
+                attempt += 1
+                continue
+
+            current_errors = []
+        
+            metrics = base_metrics.copy()
+            metrics.update({
+                "llm_latency": 0.0, 
+                "refusal_triggered": 0.0, 
+                "num_total_sentences": 0, 
+                "confidence_score": 0.0,
+                "num_supported_sentences": 0,
+                "retrieved_chunks": len(evidence)
+            })
+
+            syntax_result = self.checker.run_checks(response, evidence)
                 
-        if not syntax_result["verification_passed"]:
-             current_errors.extend(syntax_result["errors"])
-        else:
-            sentences = split_into_sentences(response)
-            attr_result = attributor.verify(sentences, evidence, threshold=0.2)
+            if not syntax_result["verification_passed"]:
+                 current_errors.extend(syntax_result["errors"])
+            else:
+                sentences = split_into_sentences(response)
+                attr_result = self.attributor.verify(sentences, evidence)
             
-            truncated_details = apply_strict_truncation(attr_result["details"])
+                truncated_details = apply_strict_truncation(attr_result["details"])
             
-            metrics["num_total_sentences"] = len(truncated_details)
-            metrics["num_supported_sentences"] = len([d for d in truncated_details if d["verification_status"] == "supported"])
+                metrics["num_total_sentences"] = len(truncated_details)
+                metrics["num_supported_sentences"] = len([d for d in truncated_details if d["verification_status"] == "supported"])
             
-            scorer = ConfidenceScorer()    
-            conf_metrics = scorer.calculate(
-                alignment_details = attr_result["details"],
-                retrieved_ids = retrieved_ids, 
-                relevant_papers=relevant_papers if relevant_papers is not None else [], 
-                k = top_k
-            )
-            metrics.update(conf_metrics)
-
-            should_refuse, reason = check_refusal(
-                retrieved_chunks=evidence,
-                alignment_details=attr_result["details"], 
-                confidence_score=metrics.get("confidence_score", 0.0),
-                confidence_threshold=confidence_threshold,
-                citation_precision=metrics.get("citation_precision", 1.0),
-                min_distinct_papers=k_min
-            )
+                conf_metrics = self.scorer.calculate(
+                    alignment_details = attr_result["details"],
+                    retrieved_ids = retrieved_ids, 
+                    relevant_papers=relevant_papers if relevant_papers is not None else [], 
+                    k = top_k
+                )
+                metrics.update(conf_metrics)
+
+                should_refuse, reason = check_refusal(
+                    retrieved_chunks=evidence,
+                    alignment_details=attr_result["details"], 
+                    confidence_score=metrics.get("confidence_score", 0.0),
+                    confidence_threshold=confidence_threshold,
+                    citation_precision=metrics.get("citation_precision", 1.0),
+                    min_distinct_papers=k_min
+                )
             
-            if should_refuse:
-                 metrics["refusal_reason"] = reason
+                if should_refuse:
+                     metrics["refusal_reason"] = reason
 
-            if should_refuse:
-                return _construct_refusal(query, evidence, reason, current_dataset_hash, metrics)
+                if should_refuse:
+                    return _construct_refusal(query, evidence, reason, current_identity, metrics)
 
-        if not current_errors:
-            metrics["llm_latency"] = time.time() - t0_llm
-            final_response_text = reconstruct_final_answer(truncated_details)
+            if not current_errors:
+                metrics["llm_latency"] = time.time() - t0_llm
+                final_response_text = reconstruct_final_answer(truncated_details)
             
-            final_sentences = []
-            used_citations_map = {} 
-            next_citation_id = 1
+                tracker = CitationTracker(evidence)
+                final_sentences = [tracker.add(det) for det in truncated_details]
+                final_citations = tracker.citations
             
-            for det in truncated_details:
-                c_indices = []
-                if det["verification_status"] == "supported" and det["supported_by_chunk_index"] is not None:
-                    idx = det["supported_by_chunk_index"]
-                    if 0 <= idx < len(evidence):
-                        if idx not in used_citations_map:
-                             chunk = evidence[idx]
-                             safe_text = chunk.get("text") or ""
-                             
-                             used_citations_map[idx] = {
-                                 "citation_id": next_citation_id,
-                                 "paper_id": chunk["paper_id"],
-                                 "section": chunk["section"],
-                                 "text": safe_text,
-                                 "score": float(det["max_score"])
-                             }
-                             next_citation_id += 1
-                        else:
-                            if float(det["max_score"]) > used_citations_map[idx]["score"]:
-                                 used_citations_map[idx]["score"] = float(det["max_score"])
-                        
-                        c_indices.append(used_citations_map[idx]["citation_id"])
-                
-                final_sentences.append({
-                    "text": det["sentence"],
-                    "verification_status": det["verification_status"],
-                    "citation_indices": c_indices
-                })
-            
-            final_citations = sorted(used_citations_map.values(), key=lambda x: x["citation_id"])
+                if mode == "synthesis" and not final_response_text.strip().lower().startswith("synthesis"):
+                    final_response_text = "SYNTHESIS: " + final_response_text
             
-            if mode == "synthesis" and not final_response_text.strip().lower().startswith("synthesis"):
-                final_response_text = "SYNTHESIS: " + final_response_text
+                audit_citations = [f"{c['paper_id']}:{c['section']}:{c['citation_id']}" for c in final_citations]
+                log_record_id = log_rag_run(query, final_response_text, audit_citations, current_identity, metrics)
             
-            audit_citations = [f"{c['paper_id']}:{c['section']}:{c['citation_id']}" for c in final_citations]
-            run_id = log_rag_run(query, final_response_text, audit_citations, current_dataset_hash, metrics)
-            
-            return {
-                "query": query,
-                "answer": final_response_text,
-                "answer_sentences": final_sentences,
-                "citations": final_citations, 
-                'metrics': metrics,
-                "run_id": run_id,
-                "index_hash": current_index_hash
-            }
+                return {
+                    "query": query,
+                    "answer": final_response_text,
+                    "answer_sentences": final_sentences,
+                    "citations": final_citations, 
+                    'metrics': metrics,
+                    "log_record_id": log_record_id,
+                    "index_hash": current_identity.index_hash
+                }
         
-        error_msg = "; ".join(current_errors)
-        log_event(logger=logger, level=logging.WARNING, message=f"Attempt {attempt + 1} failed: {error_msg}")
-        current_prompt += f"\n\nPREVIOUS RESPONSE REJECTED. REASON: {error_msg}. \nREWRITE CORRECTLY USING [index]."
-        attempt += 1
+            error_msg = "; ".join(current_errors)
+            log_event(logger=self.logger, level=logging.WARNING, message=f"Attempt {attempt + 1} failed: {error_msg}")
+            current_prompt += f"\n\nPREVIOUS RESPONSE REJECTED. REASON: {error_msg}. \nREWRITE CORRECTLY USING [index]."
+            attempt += 1
 
-    return _construct_refusal(query, evidence, "Max Retries Failed", current_dataset_hash, metrics)
\ No newline at end of file
+        return _construct_refusal(query, evidence, "Max Retries Failed", current_identity, metrics)
+
+
+def _advance(steps, response):
+    # StopIteration can't cross an executor future, so completion is returned as a flag
+    try:
+        return False, steps.send(response)
+    except StopIteration as done:
+        return True, done.value
+
+
+# id(retriever) -> its pipeline; the entry is dropped when the retriever is collected
+_pipelines: Dict[int, RAGPipeline] = {}
+_default_pipeline: Optional[RAGPipeline] = None
+# Re-entrant: a retriever's finalizer can run during a collection inside get_pipeline
+_pipeline_lock = threading.RLock()
+
+def _drop_pipeline(key: int):
+    with _pipeline_lock:
+        pipeline = _pipelines.pop(key, None)
+    if pipeline is not None:
+        pipeline.close()
+
+def get_pipeline(retriever = None) -> RAGPipeline:
+    '''
+    Process-wide RAGPipeline: one for the default retriever, one per
+    explicitly passed retriever. A cached pipeline only holds a
+    weakref.proxy of its retriever, and is dropped (and closed) once the
+    caller's retriever is garbage collected.
+    '''
+    global _default_pipeline
+    with _pipeline_lock:
+        if retriever is None:
+            if _default_pipeline is None:
+                _default_pipeline = RAGPipeline()
+            return _default_pipeline
+        key = id(retriever)
+        pipeline = _pipelines.get(key)
+        if pipeline is None:
+            pipeline = RAGPipeline(retriever=weakref.proxy(retriever))
+            _pipelines[key] = pipeline
+            weakref.finalize(retriever, _drop_pipeline, key)
+        return pipeline
+
+
+def answer(
+    query: str, 
+    top_k: Optional[int] = None, 
+    k_min: int = 1, 
+    mode: str = "strict", 
+    retriever = None, 
+    eval_mode: bool = False,
+    relevant_papers: Optional[List[str]] = None, 
+    confidence_threshold: float = 0.0,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    use_cache: bool = True
+):
+    '''
+    Functional entry point kept for existing callers; runs on the shared
+    pipeline of the given (or default) retriever.
+    '''
+    return get_pipeline(retriever).answer(
+        query,
+        top_k=top_k,
+        k_min=k_min,
+        mode=mode,
+        eval_mode=eval_mode,
+        relevant_papers=relevant_papers,
+        confidence_threshold=confidence_threshold,
+        nprobe=nprobe,
+        ef_search=ef_search,
+        use_cache=use_cache
+    )
@@ -0,0 +1,329 @@
+"""
+Semantic answer cache
+---------------------
+Verified answers are stored under their query text and embedding. Within
+one scope a query is served from the cache by
+- the exact tier: same text after normalize_query() (case, whitespace,
+  trailing punctuation), or
+- the semantic tier (optional): an entry at least `threshold`
+  cosine-similar whose tokens containing digits match exactly, so entity
+  paraphrases such as "CIFAR-10" vs "CIFAR-100" or "GPT-3" vs "GPT-4"
+  never share an answer even when their embeddings are near-identical.
+The scope is the index hash, PROMPT_VERSION, GUARDRAIL_VERSION and the
+request knobs that change the answer (mode, top_k, k_min, thresholds,
+relevant papers, nprobe, ef_search), so a rebuilt index or a new prompt
+never serves an old answer. Without a known index hash nothing is cached.
+
+The cache ships disabled (serving.answer_cache.enabled); validate the
+semantic threshold on paraphrase / near-miss query pairs of the corpus
+before enabling it, or set semantic: false to use only the exact tier.
+
+Entries live in memory (bounded, LRU) and in a SQLite file, so the cache
+survives restarts. Refusals are not cached. A hit is logged as an
+"Answer Cache Hit" event instead of an MLflow run, so its result has no
+log_record_id of its own; cached_log_record_id points at the run that
+produced the answer.
+"""
+
+import re
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from utils.helper_functions import load_yaml
+from utils.logging import log_event, setup_logger
+from utils.metadata import PROMPT_VERSION, GUARDRAIL_VERSION
+
+# Defaults for params.yaml -> serving.answer_cache
+DEFAULT_ANSWER_CACHE_CONFIG = {
+    "enabled": False,
+    "semantic": True,           # also match paraphrases (threshold + entity guard), not only exact text
+    "threshold": 0.95,          # min cosine similarity between query embeddings for a semantic hit
+    "max_entries": 10000,       # LRU bound, in memory and on disk
+    "path": "data/cache/answer_cache.sqlite",
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS answers (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    scope TEXT NOT NULL,
+    index_hash TEXT,
+    prompt_version TEXT NOT NULL,
+    guardrail_version TEXT NOT NULL,
+    query TEXT NOT NULL,
+    vector BLOB NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_used REAL NOT NULL
+)
+"""
+
+# Index hash reported when the index manifest can't be read
+UNKNOWN_INDEX_HASH = "unknown"
+
+def load_answer_cache_config(params_path: str = "params.yaml") -> dict:
+    try:
+        params = load_yaml(params_path) or {}
+    except FileNotFoundError:
+        params = {}
+    cache = (params.get("serving") or {}).get("answer_cache") or {}
+    return {**DEFAULT_ANSWER_CACHE_CONFIG, **cache}
+
+def normalize_query(query: str) -> str:
+    # Exact-tier key: case, runs of whitespace and trailing punctuation don't change the question
+    return re.sub(r"\s+", " ", query or "").strip().rstrip("?.!").strip().casefold()
+
+def entity_tokens(query: str) -> frozenset:
+    '''
+    Tokens that contain a digit ("cifar-10", "gpt-4", "2017"): near-identical
+    embeddings can still ask about different entities when these differ.
+    '''
+    return frozenset(t for t in re.findall(r"\w[\w\-]*", (query or "").casefold()) if any(c.isdigit() for c in t))
+
+def answer_scope(index_hash: Optional[str], params: Dict[str, Any]) -> str:
+    '''
+    Hash of everything besides the query that an answer depends on.
+    Args:
+        index_hash (str): Index artifact hash the answer was retrieved from.
+        params (dict): Request knobs (mode, top_k, k_min, thresholds, ...).
+    Returns:
+        str: Scope key; only entries with the same scope can match.
+    '''
+    payload = {
+        "index_hash": index_hash,
+        "prompt_version": PROMPT_VERSION,
+        "guardrail_version": GUARDRAIL_VERSION,
+        "params": params,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class SemanticAnswerCache:
+    """
+    Thread-safe, bounded LRU cache of verified answers looked up by cosine
+    similarity of normalized query embeddings, persisted to SQLite.
+    """
+
+    def __init__(self, config: Optional[dict] = None):
+        cfg = {**DEFAULT_ANSWER_CACHE_CONFIG, **(config or load_answer_cache_config())}
+        self.semantic = bool(cfg["semantic"])
+        self.threshold = float(cfg["threshold"])
+        self.max_entries = int(cfg["max_entries"])
+        self.path = Path(cfg["path"])
+        self.logger = setup_logger(name="answer_cache", log_dir="logs", level=logging.INFO)
+
+        self._lock = threading.Lock()
+        # id -> (scope, vector, result, normalized query); insertion order is recency order
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # scope -> (ids, stacked vectors, normalized query -> id), rebuilt when the scope changes
+        self._matrices: Dict[str, tuple] = {}
+        self.counters = {"hits": 0, "exact_hits": 0, "semantic_hits": 0, "misses": 0, "skipped": 0, "stores": 0, "evictions": 0}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        self._conn.commit()
+        self._load()
+
+    def _load(self):
+        # Entries of another prompt / guardrail version can never match again
+        self._conn.execute(
+            "DELETE FROM answers WHERE prompt_version != ? OR guardrail_version != ?",
+            (PROMPT_VERSION, GUARDRAIL_VERSION)
+        )
+        rows = self._conn.execute(
+            "SELECT id, scope, query, vector, result FROM answers ORDER BY last_used DESC LIMIT ?",
+            (self.max_entries,)
+        ).fetchall()
+        if len(rows) == self.max_entries:
+            self._conn.execute(
+                "DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+        self._conn.commit()
+        for entry_id, scope, query, vector, result in reversed(rows):
+            self._entries[entry_id] = (scope, np.frombuffer(vector, dtype="float32"), json.loads(result), normalize_query(query))
+        log_event(logger=self.logger, level=logging.INFO, message="Answer Cache Loaded", entries=len(self._entries), path=str(self.path))
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _scope_matrix(self, scope: str):
+        cached = self._matrices.get(scope)
+        if cached is None:
+            ids = [i for i, entry in self._entries.items() if entry[0] == scope]
+            matrix = np.stack([self._entries[i][1] for i in ids]) if ids else None
+            # Later (more recently used) entries win on duplicate text
+            exact = {self._entries[i][3]: i for i in ids}
+            cached = (ids, matrix, exact)
+            self._matrices[scope] = cached
+        return cached
+
+    def _semantic_match(self, query: str, query_vec: np.ndarray, ids: list, matrix: Optional[np.ndarray]):
+        # Most similar entry above the threshold whose entity tokens match the query's
+        if matrix is None or matrix.shape[1] != query_vec.shape[0]:
+            return None, 0.0
+        sims = matrix @ query_vec
+        entities = entity_tokens(query)
+        for best in np.argsort(-sims):
+            if sims[best] < self.threshold:
+                break
+            if entity_tokens(self._entries[ids[best]][3]) == entities:
+                return ids[best], float(sims[best])
+        return None, 0.0
+
+    def get(self, query: str, vector: np.ndarray, index_hash: Optional[str], params: Dict[str, Any]) -> Optional[dict]:
+        '''
+        Looks up a cached answer of the same scope: exact normalized text
+        first, then (if enabled) the closest safe paraphrase.
+        Args:
+            query (str): The incoming query.
+            vector (np.ndarray): Its normalized embedding.
+            index_hash (str): Current index artifact hash; unknown -> miss.
+            params (dict): Request knobs, as passed to put().
+        Returns:
+            dict: The stored answer re-addressed to `query`, with cache_hit /
+            cache_tier / cache_similarity in its metrics, or None on a miss.
+        '''
+        if not index_hash or index_hash == UNKNOWN_INDEX_HASH:
+            with self._lock:
+                self.counters["skipped"] += 1
+            return None
+        scope = answer_scope(index_hash, params)
+        query_vec = np.asarray(vector, dtype="float32").ravel()
+        with self._lock:
+            ids, matrix, exact = self._scope_matrix(scope)
+            entry_id, similarity, tier = exact.get(normalize_query(query)), 1.0, "exact"
+            if entry_id is None and self.semantic:
+                (entry_id, similarity), tier = self._semantic_match(query, query_vec, ids, matrix), "semantic"
+            if entry_id is None:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(entry_id)
+            self.counters["hits"] += 1
+            self.counters[f"{tier}_hits"] += 1
+            stored = self._entries[entry_id][2]
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), entry_id))
+            self._conn.commit()
+
+        log_event(
+            logger=self.logger, level=logging.INFO, message="Answer Cache Hit",
+            tier=tier, similarity=round(similarity, 4), index_hash=index_hash,
+            cached_log_record_id=stored.get("log_record_id")
+        )
+        metrics = dict(stored.get("metrics") or {})
+        metrics.update({
+            "retrieval_latency": 0.0,
+            "llm_latency": 0.0,
+            "cache_hit": True,
+            "cache_tier": tier,
+            "cache_similarity": similarity,
+        })
+        return {
+            **stored,
+            "query": query,
+            "cached_query": stored.get("query"),
+            # No run is logged for a hit; this points at the one that produced the answer
+            "log_record_id": None,
+            "cached_log_record_id": stored.get("log_record_id"),
+            "metrics": metrics,
+        }
+
+    def put(self, query: str, vector: np.ndarray, params: Dict[str, Any], result: dict) -> bool:
+        '''
+        Stores a verified answer; refusals, empty answers and answers from
+        an index of unknown hash are skipped.
+        Args:
+            query (str): The query the answer was generated for.
+            vector (np.ndarray): Its normalized embedding.
+            params (dict): Request knobs, as passed to get().
+            result (dict): The answer() dict; its index_hash scopes the entry.
+        Returns:
+            bool: True if the answer was cached.
+        '''
+        metrics = result.get("metrics") or {}
+        if result.get("answer") is None or float(metrics.get("refusal_triggered", 0.0)) > 0.5 or metrics.get("cache_hit"):
+            return False
+        if self.max_entries <= 0:
+            return False
+
+        index_hash = result.get("index_hash")
+        if not index_hash or index_hash == UNKNOWN_INDEX_HASH:
+            return False
+        scope = answer_scope(index_hash, params)
+        query_vec = np.asarray(vector, dtype="float32").ravel()
+        payload = json.dumps(result, default=str)
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO answers (scope, index_hash, prompt_version, guardrail_version, query, vector, result, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (scope, index_hash, PROMPT_VERSION, GUARDRAIL_VERSION, query, query_vec.tobytes(), payload, now, now)
+            )
+            self._entries[cursor.lastrowid] = (scope, query_vec, json.loads(payload), normalize_query(query))
+            self._matrices.pop(scope, None)
+            self.counters["stores"] += 1
+
+            evicted = []
+            while len(self._entries) > self.max_entries:
+                entry_id, (old_scope, _, _, _) = self._entries.popitem(last=False)
+                self._matrices.pop(old_scope, None)
+                evicted.append((entry_id,))
+            if evicted:
+                self._conn.executemany("DELETE FROM answers WHERE id = ?", evicted)
+                self.counters["evictions"] += len(evicted)
+            self._conn.commit()
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrices.clear()
+            self._conn.execute("DELETE FROM answers")
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+            size = len(self._entries)
+        lookups = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "size": size,
+            "max_entries": self.max_entries,
+            "semantic": self.semantic,
+            "threshold": self.threshold,
+            "hit_rate": round(counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_answer_cache: Optional[SemanticAnswerCache] = None
+_answer_cache_lock = threading.Lock()
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    '''
+    Process-wide answer cache, or None when serving.answer_cache.enabled is false.
+    '''
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                config = load_answer_cache_config()
+                if not config["enabled"]:
+                    return None
+                _answer_cache = SemanticAnswerCache(config)
+    return _answer_cache
@@ -10,14 +10,14 @@ import time
 from typing import List, Optional
 
 import mlflow
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 from pipelines.postprocess.truncate import apply_strict_truncation, reconstruct_final_answer
 from pipelines.retrieval.search import Retriever
 from pipelines.postprocess.checks import HallucinationChecker 
 from pipelines.postprocess.align import Attributor, split_into_sentences
 from pipelines.retrieval.hydrate import attach_text
-from scripts.compute_dataset_hash import compute_dataset_hash
+from utils.metadata import get_identity
 from utils.logging import log_event, setup_logger
 from pipelines.postprocess.confidence import ConfidenceScorer
 from pipelines.postprocess.refusal import check_refusal
@@ -32,12 +32,12 @@ class LLM:
             base_url=OLLAMA_BASE_URL,
             api_key="ollama",
         )
+        self.async_client = None
 
-    def generate(self, system_prompt: str, query: str, evidence_text: str) -> str:
-        try:
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"""Question: {query}
+    def _messages(self, system_prompt: str, query: str, evidence_text: str) -> list:
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"""Question: {query}
 
 Evidence Sources:
 {evidence_text}
@@ -50,11 +50,29 @@ Instructions:
 3. Do not mention author names or years. Only use the numbers [1], [2], etc.
 
 Answer:"""}
-            ]
+        ]
 
+    def generate(self, system_prompt: str, query: str, evidence_text: str) -> str:
+        try:
             response = self.client.chat.completions.create(
                 model=LOCAL_MODEL_NAME,
-                messages=messages,
+                messages=self._messages(system_prompt, query, evidence_text),
+                temperature=0.1, 
+                max_tokens=1024,
+            )
+            return response.choices[0].message.content.strip()
+        except Exception as e:
+            logging.error(f"LLM Generation failed: {e}")
+            return ""
+
+    async def agenerate(self, system_prompt: str, query: str, evidence_text: str) -> str:
+        # Non-blocking variant for async callers; the client is created on first use
+        if self.async_client is None:
+            self.async_client = AsyncOpenAI(base_url=OLLAMA_BASE_URL, api_key="ollama")
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=LOCAL_MODEL_NAME,
+                messages=self._messages(system_prompt, query, evidence_text),
                 temperature=0.1, 
                 max_tokens=1024,
             )
@@ -93,6 +111,7 @@ def adapt_for_rag(results, query):
         "query": query,
         "results": [
             {
+                "row_id": r.get("row_id"),
                 "paper_id": r["paper_id"],
                 "chunk_id": r["chunk_id"],
                 "section": r["chunk_id"].split("::")[2],
@@ -157,17 +176,17 @@ def answer(
     if retriever is None:
         retriever = Retriever(top_k=top_k)
     
-    attributor = Attributor(retriever.model)
+    attributor = Attributor(retriever.model, vector_source=retriever.evidence_vectors)
     checker = HallucinationChecker() 
-    current_dataset_hash = compute_dataset_hash()
+    current_dataset_hash = get_identity().dataset_hash
         
     # --- 1. RETRIEVE ---
     t0_retrieval = time.time()
-    raw = retriever.search(query)
+    raw = retriever.search(query, k=top_k)
     retrieved_ids = [r["paper_id"] for r in raw.get("results", [])]
     
     retrieved = adapt_for_rag(raw["results"], query)
-    hydrated = attach_text(retrieved)
+    hydrated = attach_text(retrieved, store=retriever.text_store)
     evidence = hydrated["results"]
     t1_retrieval = time.time()
     retrieval_latency = t1_retrieval - t0_retrieval
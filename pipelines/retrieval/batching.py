@@ -0,0 +1,219 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future
+from typing import List, Optional
+
+import numpy as np
+
+from utils.helper_functions import normalize, load_yaml
+from pipelines.retrieval.encoder import MODEL_NAME, load_encoder, resolve_backend
+
+# Defaults for params.yaml -> embedding.batching
+DEFAULT_BATCHING_CONFIG = {
+    "enabled": True,
+    "window_ms": 3.0,    # how long the first queued request waits for others to join its batch
+    "max_batch": 64,     # texts per coalesced batch; larger single requests bypass the queue
+    "process": False,    # run the model in a dedicated process (keeps its threads away from FAISS)
+    "threads": 0,        # intra-op threads of the dedicated process; 0 = half the cores
+    "startup_timeout_sec": 300.0,  # max wait for the dedicated process to load the model
+}
+
+def load_batching_config(params_path: str = "params.yaml") -> dict:
+    try:
+        params = load_yaml(params_path) or {}
+    except FileNotFoundError:
+        params = {}
+    batching = (params.get("embedding") or {}).get("batching") or {}
+    return {**DEFAULT_BATCHING_CONFIG, **batching}
+
+def _serve(conn, backend: str, model_name: str, threads: int):
+    # Dedicated encoder process: owns the model, encodes whatever batch it is sent
+    try:
+        import torch
+        torch.set_num_threads(max(1, threads))
+        model = load_encoder(backend, model_name, device="cpu")
+    except Exception as e:
+        conn.send(("error", repr(e)))
+        return
+    conn.send(("ready", None))
+    while True:
+        texts = conn.recv()
+        if texts is None:
+            return
+        try:
+            out = model.encode(texts, batch_size=len(texts), show_progress_bar=False, normalize_embeddings=False)
+            conn.send(("ok", np.asarray(out, dtype=np.float32)))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+
+
+class BatchingEncoder:
+    """
+    Coalesces concurrent encode() calls into one model batch. The first
+    request to arrive opens a short window (window_ms) or waits until
+    max_batch texts are queued; the batch is encoded once and every caller
+    gets its own rows back. Drop-in for the SentenceTransformer methods the
+    Retriever and Attributor use.
+    """
+
+    def __init__(
+        self,
+        model=None,
+        backend: Optional[str] = None,
+        model_name: Optional[str] = None,
+        config: Optional[dict] = None
+    ):
+        cfg = config or load_batching_config()
+        self.window = float(cfg["window_ms"]) / 1000.0
+        self.max_batch = int(cfg["max_batch"])
+        self.model = None
+        self._conn = None
+        self._proc = None
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue" = queue.Queue()
+        self.counters = {"requests": 0, "batches": 0, "texts": 0, "bypassed": 0}
+
+        if cfg["process"] and model is None:
+            threads = int(cfg["threads"] or max(1, (os.cpu_count() or 2) // 2))
+            ctx = mp.get_context("spawn")
+            self._conn, child = ctx.Pipe()
+            self._proc = ctx.Process(
+                target=_serve,
+                args=(child, resolve_backend(backend), model_name or MODEL_NAME, threads),
+                daemon=True,
+                name="encoder-service"
+            )
+            self._proc.start()
+            # Only the worker may hold the child end, so its death reads as EOF here
+            child.close()
+            # Block until the model is loaded so the first request doesn't pay for it
+            self._await_ready(float(cfg["startup_timeout_sec"]))
+        else:
+            self.model = model or load_encoder(backend, model_name or MODEL_NAME)
+
+        self._thread = threading.Thread(target=self._run, daemon=True, name="encoder-batcher")
+        self._thread.start()
+
+    def _await_ready(self, timeout: float):
+        '''
+        Waits for the encoder process's startup handshake.
+        Raises:
+            RuntimeError: If it failed to load the model, died, or timed out.
+        '''
+        deadline = time.monotonic() + timeout
+        status, payload = "error", f"no model loaded within {timeout:.0f}s"
+        try:
+            while not self._conn.poll(0.5) and self._proc.is_alive() and time.monotonic() < deadline:
+                pass
+            if self._conn.poll():
+                status, payload = self._conn.recv()
+        except EOFError:
+            self._proc.join(timeout=5)
+            payload = f"exited with code {self._proc.exitcode}"
+        if status != "ready":
+            self._proc.kill()
+            self._proc.join(timeout=5)
+            self._conn.close()
+            raise RuntimeError(f"Encoder process failed to start: {payload}")
+
+    @property
+    def mode(self) -> str:
+        return "process" if self._proc is not None else "thread"
+
+    def _encode_now(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            if self._conn is None:
+                out = self.model.encode(texts, batch_size=len(texts), show_progress_bar=False, normalize_embeddings=False)
+                return np.asarray(out, dtype=np.float32)
+            try:
+                self._conn.send(texts)
+                status, payload = self._conn.recv()
+            except (EOFError, OSError) as e:
+                status, payload = "error", f"encoder process is gone ({e!r})"
+        if status != "ok":
+            raise RuntimeError(f"Encoder process failed: {payload}")
+        return payload
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch, size = [item], len(item[0])
+            deadline = time.perf_counter() + self.window
+            while size < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                try:
+                    nxt = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    self._queue.put(None)
+                    break
+                batch.append(nxt)
+                size += len(nxt[0])
+
+            texts = [t for item_texts, _ in batch for t in item_texts]
+            try:
+                vectors = self._encode_now(texts)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+
+            self.counters["batches"] += 1
+            self.counters["texts"] += len(texts)
+            start = 0
+            for item_texts, fut in batch:
+                fut.set_result(vectors[start:start + len(item_texts)])
+                start += len(item_texts)
+
+    def encode(
+        self,
+        sentences,
+        batch_size: int = 32,
+        show_progress_bar: bool = False,
+        normalize_embeddings: bool = False,
+        **kwargs
+    ) -> np.ndarray:
+        '''
+        SentenceTransformer.encode-compatible. Small requests are queued and
+        coalesced; requests larger than max_batch are encoded directly.
+        '''
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        self.counters["requests"] += 1
+
+        if not texts:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+        elif len(texts) > self.max_batch:
+            self.counters["bypassed"] += 1
+            vectors = self._encode_now(texts)
+        else:
+            fut = Future()
+            self._queue.put((texts, fut))
+            vectors = fut.result()
+
+        if normalize_embeddings and len(vectors):
+            vectors = normalize(vectors)
+        return vectors[0] if single else vectors
+
+    def stats(self) -> dict:
+        batches = self.counters["batches"]
+        return {
+            **self.counters,
+            "mode": self.mode,
+            "mean_batch_size": round(self.counters["texts"] / batches, 2) if batches else 0.0,
+        }
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+        if self._proc is not None:
+            with self._lock:
+                self._conn.send(None)
+            self._proc.join(timeout=5)
+            self._proc = None
@@ -0,0 +1,86 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable
+
+from utils.helper_functions import load_yaml
+
+# Defaults for params.yaml -> retrieval.cache
+DEFAULT_CACHE_CONFIG = {
+    "enabled": True,
+    "embedding_size": 4096,   # normalized query -> query vector
+    "result_size": 2048,      # (query, k, filters, search knobs, index hash) -> ranked hits
+    "ttl_sec": 3600,          # 0 = no expiry
+}
+
+_MISSING = object()
+
+def load_cache_config(params_path: str = "params.yaml") -> dict:
+    try:
+        params = load_yaml(params_path) or {}
+    except FileNotFoundError:
+        params = {}
+    cache = (params.get("retrieval") or {}).get("cache") or {}
+    return {**DEFAULT_CACHE_CONFIG, **cache}
+
+def normalize_query(query: str) -> str:
+    # Only whitespace is folded: the tokenizer decides what else is equivalent
+    return " ".join((query or "").split())
+
+
+class LRUCache:
+    """
+    Thread-safe bounded LRU map with an optional per-entry TTL and
+    hit / miss / eviction / expiration counters.
+    """
+
+    def __init__(self, maxsize: int, ttl_sec: float = 0.0):
+        self.maxsize = int(maxsize)
+        self.ttl = float(ttl_sec or 0.0)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.counters["misses"] += 1
+                return default
+            value, stored_at = entry
+            if self.ttl and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self.counters["expirations"] += 1
+                self.counters["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self.counters["hits"] += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            if self._data:
+                self.counters["invalidations"] += 1
+            self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,109 @@
+import os
+import re
+from pathlib import Path
+from typing import Optional
+
+from sentence_transformers import SentenceTransformer
+
+from utils.helper_functions import load_yaml
+
+MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
+
+# Local exports (ONNX / quantized ONNX) when the hub repo doesn't ship them
+ENCODER_DIR = Path("models/encoders")
+
+# torch       reference PyTorch model
+# torch_int8  PyTorch with nn.Linear dynamically quantized to int8
+# onnx        ONNX Runtime, fp32
+# onnx_int8   ONNX Runtime, dynamically quantized int8 (kernels picked by onnx_quantization)
+BACKENDS = ("torch", "torch_int8", "onnx", "onnx_int8")
+
+# Defaults for params.yaml -> embedding
+DEFAULT_BACKEND_CONFIG = {
+    "backend": "torch",           # query encoding + attribution (Retriever, Attributor)
+    "build_backend": "torch",     # corpus encoding; changes the stored vectors
+    "onnx_quantization": "avx2",  # avx2 | avx512 | avx512_vnni | arm64
+}
+
+def load_backend_config(params_path: str = "params.yaml") -> dict:
+    try:
+        params = load_yaml(params_path) or {}
+    except FileNotFoundError:
+        params = {}
+    embedding = params.get("embedding") or {}
+    return {key: embedding.get(key, value) for key, value in DEFAULT_BACKEND_CONFIG.items()}
+
+def resolve_backend(backend: Optional[str] = None, role: str = "query") -> str:
+    '''
+    Picks the backend for a role ("query" or "build"): explicit argument,
+    then the ENCODER_BACKEND / ENCODER_BUILD_BACKEND env vars, then params.yaml.
+    '''
+    if backend is None:
+        cfg = load_backend_config()
+        if role == "build":
+            backend = os.environ.get("ENCODER_BUILD_BACKEND", cfg["build_backend"])
+        else:
+            backend = os.environ.get("ENCODER_BACKEND", cfg["backend"])
+    backend = str(backend).strip().lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"Unsupported encoder backend '{backend}'. Expected one of {BACKENDS}")
+    return backend
+
+def encoder_id(model_name: str, backend: str) -> str:
+    '''
+    Identity of the vectors an encoder produces; keys the embedding cache so
+    vectors from different backends are never mixed.
+    '''
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+def _local_dir(model_name: str) -> Path:
+    return ENCODER_DIR / re.sub(r"[^A-Za-z0-9_.-]+", "__", model_name)
+
+def _load_onnx_int8(model_name: str, quantization: str) -> SentenceTransformer:
+    file_name = f"onnx/model_qint8_{quantization}.onnx"
+    try:
+        # sentence-transformers hub repos ship pre-quantized variants
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs={"file_name": file_name})
+    except Exception:
+        pass
+
+    local = _local_dir(model_name)
+    if not (local / file_name).exists():
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+        base = SentenceTransformer(model_name, backend="onnx")
+        base.save(str(local))
+        export_dynamic_quantized_onnx_model(base, quantization, str(local))
+    return SentenceTransformer(str(local), backend="onnx", model_kwargs={"file_name": file_name})
+
+def load_encoder(
+    backend: Optional[str] = None,
+    model_name: str = MODEL_NAME,
+    role: str = "query",
+    device: Optional[str] = None
+) -> SentenceTransformer:
+    '''
+    Loads the sentence encoder on the requested backend. Every backend is a
+    SentenceTransformer, so callers keep using encode() unchanged.
+    Args:
+        backend (str, optional): One of BACKENDS; resolved from config if None.
+        model_name (str): Hub id or local path of the model.
+        role (str): "query" or "build"; selects the configured default.
+        device (str, optional): torch device for the torch backends.
+    Returns:
+        SentenceTransformer: The encoder.
+    '''
+    backend = resolve_backend(backend, role)
+
+    if backend == "torch":
+        return SentenceTransformer(model_name, device=device)
+
+    if backend == "torch_int8":
+        import torch
+        model = SentenceTransformer(model_name, device="cpu")
+        torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return model
+
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx")
+
+    return _load_onnx_int8(model_name, load_backend_config()["onnx_quantization"])
@@ -1,8 +1,35 @@
 import json
 from pathlib import Path
+from typing import Optional
 import re
+import threading
+
+from utils.metadata import get_index_hash
+from pipelines.retrieval.text_store import TextStore
 
 CHUNKS_DIR = Path("data/processed/chunks")
+TEXT_STORE_DIR = Path("data/processed/faiss")
+
+# (index manifest hash, TextStore or None) of the last opened store
+_text_store = None
+_text_store_lock = threading.Lock()
+
+def get_text_store() -> Optional[TextStore]:
+    '''
+    The packed text store written by the embed stage (None if the index
+    predates it). Reopened when the index manifest hash changes, since a
+    rebuild or compaction renumbers the rows.
+    '''
+    global _text_store
+    index_hash = get_index_hash()
+    cached = _text_store
+    if cached is None or cached[0] != index_hash:
+        with _text_store_lock:
+            cached = _text_store
+            if cached is None or cached[0] != index_hash:
+                cached = (index_hash, TextStore.open(TEXT_STORE_DIR))
+                _text_store = cached
+    return cached[1]
 
 def clean_pdf_artifacts(text: str) -> str:
     if not text: return ""
@@ -17,17 +44,27 @@ def clean_pdf_artifacts(text: str) -> str:
     
 def norm(s: str):
     return (s or "").strip().lower()
-def attach_text(retrieval_output: dict) -> dict:
+def attach_text(retrieval_output: dict, store: Optional[TextStore] = None) -> dict:
     '''
     Attaches the text of the retrieved documents to the retrieval output.
     Args:
         retrieval_output (dict): The retrieval output.
+        store (TextStore, optional): Text store the row ids refer to, e.g. the
+            one a Retriever loaded with its index (default: the store of the
+            current index manifest).
     Returns:
         dict: The retrieval output with the text attached.
     '''
     cache = {}
+    store = store if store is not None else get_text_store()
     
     for r in  retrieval_output["results"]:
+        # Fast path: cleaned text sliced from the packed store by FAISS row id
+        row_id = r.get("row_id")
+        if store is not None and row_id is not None and 0 <= row_id < len(store):
+            r["text"] = store[row_id]
+            continue
+        
         paper_id = r["paper_id"]
         
         if paper_id not in cache:
@@ -0,0 +1,465 @@
+import copy
+from pathlib import Path
+from typing import Optional, Tuple
+
+import faiss
+import numpy as np
+
+from utils.helper_functions import load_yaml
+from pipelines.retrieval.segments import read_segments
+
+# Defaults for params.yaml -> indexing; anything set there overrides these
+DEFAULT_INDEX_CONFIG = {
+    "index_type": "flat",
+    "mmap": True,               # map the index read-only instead of copying it per process
+    "ivf": {
+        "nlist": 0,             # 0 = auto (~4 * sqrt(N))
+        "nprobe": 16,
+        "train_size": 50000,    # max vectors sampled for k-means training
+    },
+    "hnsw": {
+        "m": 32,
+        "ef_construction": 200,
+        "ef_search": 64,
+    },
+    "compression": {
+        "pq_m": 16,               # sub-quantizers for ivf_pq (must divide dim)
+        "pq_nbits": 8,
+        "opq": False,             # learn an OPQ rotation before PQ
+        "rerank": True,           # exact re-score against full-precision vectors on disk
+        "rerank_factor": 4,       # compressed candidates fetched per requested result
+        "recall_tolerance": 0.02, # max recall@10 drop vs exact search
+        "eval_queries": 256,
+    },
+    "build": {
+        "max_memory_mb": 2048,    # budget for in-flight batches + the in-RAM index while building
+        "batch_size": 8192,       # chunks read / encoded / appended per step (clamped by the budget)
+    },
+    "sentences": {
+        "enabled": True,          # per-sentence evidence vectors for attribution (sentence_store)
+        "min_words": 4,           # shorter fragments (headers, "See Fig. 2.") are not stored
+        "batch_size": 16384,      # sentences encoded per step
+    },
+}
+
+ENGINE_ALIASES = {
+    "flat": "flat",
+    "idmap,flat": "flat",
+    "ivf_flat": "ivf_flat",
+    "ivfflat": "ivf_flat",
+    "ivf,flat": "ivf_flat",
+    "hnsw": "hnsw",
+    "hnsw,flat": "hnsw",
+    "sq8": "sq8",
+    "fp16": "fp16",
+    "sqfp16": "fp16",
+    "ivf_pq": "ivf_pq",
+    "ivfpq": "ivf_pq",
+}
+
+# Engines storing lossy codes; their hits are re-scored against the exact vectors
+COMPRESSED_ENGINES = {"sq8", "fp16", "ivf_pq"}
+
+# On-disk type tags FAISS writes for IndexFlatIP and the IndexIDMap(2) wrappers
+FLAT_IP_FOURCC = b"IxFI"
+ID_MAP_FOURCCS = (b"IxMp", b"IxM2")
+
+# An IDMap file nests its sub-index after the wrapper's own header:
+# fourcc(4) + d(4) + ntotal(8) + 2 * dummy(8) + is_trained(1) + metric_type(4)
+ID_MAP_INNER_OFFSET = 37
+
+# FAISS warns below ~39 training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+def _merge(base: dict, override: dict) -> dict:
+    out = copy.deepcopy(base)
+    for key, value in (override or {}).items():
+        if isinstance(value, dict) and isinstance(out.get(key), dict):
+            out[key] = _merge(out[key], value)
+        else:
+            out[key] = value
+    return out
+
+def load_index_config(params_path: str = "params.yaml") -> dict:
+    '''
+    Reads the indexing section of params.yaml on top of DEFAULT_INDEX_CONFIG.
+    '''
+    try:
+        params = load_yaml(params_path) or {}
+    except FileNotFoundError:
+        params = {}
+    return _merge(DEFAULT_INDEX_CONFIG, params.get("indexing", {}))
+
+def resolve_engine(index_type: str) -> str:
+    engine = ENGINE_ALIASES.get(str(index_type).strip().lower().replace(" ", ""))
+    if engine is None:
+        raise ValueError(f"Unsupported index_type '{index_type}'. Expected one of {sorted(set(ENGINE_ALIASES.values()))}")
+    return engine
+
+def auto_nlist(n_vectors: int) -> int:
+    nlist = int(4 * np.sqrt(max(n_vectors, 1)))
+    return max(1, min(nlist, n_vectors // MIN_POINTS_PER_CENTROID))
+
+def build_index(
+    emb: np.ndarray,
+    cfg: dict,
+    seed: int = 42,
+    ids: Optional[np.ndarray] = None
+) -> Tuple[faiss.Index, dict]:
+    '''
+    Creates, trains (if needed) and fills an inner-product index over
+    L2-normalized embeddings.
+    Args:
+        emb (np.ndarray): float32 matrix of normalized embeddings (may be a memmap).
+        cfg (dict): Indexing config from load_index_config().
+        seed (int): Seed for the training sample / k-means.
+        ids (np.ndarray, optional): Stable int64 labels; when given the index
+            is wrapped in an IndexIDMap2 so it can be upserted / deleted by id.
+    Returns:
+        Tuple[faiss.Index, dict]: The index and the parameters it was built with.
+    '''
+    index, params = create_index(emb, cfg, seed=seed, with_ids=ids is not None)
+    add_vectors(index, emb, ids)
+    return index, params
+
+def create_index(
+    emb: np.ndarray,
+    cfg: dict,
+    seed: int = 42,
+    with_ids: bool = False
+) -> Tuple[faiss.Index, dict]:
+    '''
+    Creates and trains (if needed) an empty index for emb. Only a training
+    sample of emb is read, so emb can be an on-disk memmap larger than RAM.
+    '''
+    n, dim = emb.shape
+    engine = resolve_engine(cfg["index_type"])
+
+    if engine == "ivf_flat":
+        ivf_cfg = cfg["ivf"]
+        nlist = int(ivf_cfg.get("nlist") or auto_nlist(n))
+        if n < nlist * MIN_POINTS_PER_CENTROID:
+            # Too few vectors to train centroids; exhaustive search is exact and cheap here
+            engine = "flat"
+        else:
+            quantizer = faiss.IndexFlatIP(dim)
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.cp.seed = seed
+            index.train(_training_sample(emb, int(ivf_cfg["train_size"]), seed))
+            index.nprobe = int(ivf_cfg["nprobe"])
+            return _wrap(index, with_ids), {
+                "engine": engine,
+                "nlist": nlist,
+                "nprobe": index.nprobe,
+                "train_size": min(n, int(ivf_cfg["train_size"])),
+            }
+
+    if engine == "ivf_pq":
+        comp_cfg = cfg["compression"]
+        m, nbits = int(comp_cfg["pq_m"]), int(comp_cfg["pq_nbits"])
+        nlist = int(cfg["ivf"].get("nlist") or auto_nlist(n))
+        if dim % m != 0:
+            raise ValueError(f"compression.pq_m={m} must divide the embedding dimension {dim}")
+        if n < max(nlist, 2 ** nbits) * MIN_POINTS_PER_CENTROID:
+            # PQ codebooks can't be trained on this few vectors; SQ8 is still 4x smaller
+            engine = "sq8"
+        else:
+            spec = f"IVF{nlist},PQ{m}x{nbits}"
+            if comp_cfg.get("opq"):
+                spec = f"OPQ{m}," + spec
+            index = faiss.index_factory(dim, spec, faiss.METRIC_INNER_PRODUCT)
+            _ivf(index).cp.seed = seed
+            index.train(_training_sample(emb, int(cfg["ivf"]["train_size"]), seed))
+            _ivf(index).nprobe = int(cfg["ivf"]["nprobe"])
+            return _wrap(index, with_ids), {
+                "engine": engine,
+                "factory": spec,
+                "nlist": nlist,
+                "nprobe": int(cfg["ivf"]["nprobe"]),
+                "pq_m": m,
+                "pq_nbits": nbits,
+                "opq": bool(comp_cfg.get("opq")),
+            }
+
+    if engine in ("sq8", "fp16"):
+        qtype = faiss.ScalarQuantizer.QT_8bit if engine == "sq8" else faiss.ScalarQuantizer.QT_fp16
+        index = faiss.IndexScalarQuantizer(dim, qtype, faiss.METRIC_INNER_PRODUCT)
+        index.train(_training_sample(emb, int(cfg["ivf"]["train_size"]), seed))
+        return _wrap(index, with_ids), {"engine": engine}
+
+    if engine == "hnsw":
+        hnsw_cfg = cfg["hnsw"]
+        index = faiss.IndexHNSWFlat(dim, int(hnsw_cfg["m"]), faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = int(hnsw_cfg["ef_construction"])
+        index.hnsw.efSearch = int(hnsw_cfg["ef_search"])
+        return _wrap(index, with_ids), {
+            "engine": engine,
+            "m": int(hnsw_cfg["m"]),
+            "ef_construction": int(hnsw_cfg["ef_construction"]),
+            "ef_search": int(hnsw_cfg["ef_search"]),
+        }
+
+    index = faiss.IndexFlatIP(dim)
+    return _wrap(index, with_ids), {"engine": "flat"}
+
+def _wrap(index: faiss.Index, with_ids: bool) -> faiss.Index:
+    return faiss.IndexIDMap2(index) if with_ids else index
+
+def add_vectors(
+    index: faiss.Index,
+    emb: np.ndarray,
+    ids: Optional[np.ndarray] = None,
+    block_size: int = 65536
+):
+    '''
+    Adds emb to the index in blocks, so a memmapped matrix is never fully
+    materialized in memory.
+    '''
+    for start in range(0, len(emb), block_size):
+        block = np.ascontiguousarray(emb[start:start + block_size], dtype=np.float32)
+        if ids is None:
+            index.add(block)
+        else:
+            index.add_with_ids(block, np.ascontiguousarray(ids[start:start + block_size], dtype=np.int64))
+
+def estimate_index_bytes(engine: str, n: int, dim: int, cfg: dict) -> int:
+    '''
+    Approximate resident size of a built index (codes + ids), used to warn
+    when the in-RAM index alone would exceed indexing.build.max_memory_mb.
+    '''
+    per_vector = {
+        "flat": dim * 4,
+        "ivf_flat": dim * 4 + 8,
+        "hnsw": dim * 4 + int(cfg["hnsw"]["m"]) * 2 * 4,
+        "sq8": dim,
+        "fp16": dim * 2,
+        "ivf_pq": int(cfg["compression"]["pq_m"]) * int(cfg["compression"]["pq_nbits"]) // 8 + 8,
+    }[engine]
+    return n * (per_vector + 16)
+
+def _training_sample(emb: np.ndarray, train_size: int, seed: int) -> np.ndarray:
+    if len(emb) <= train_size:
+        return emb
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(emb), size=train_size, replace=False))
+    return np.ascontiguousarray(emb[rows])
+
+def _ivf(index: faiss.Index):
+    if not isinstance(index, faiss.Index):
+        return None
+    try:
+        return faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return None
+
+def _unwrap(index: faiss.Index) -> faiss.Index:
+    # Strips an IndexIDMap(2) wrapper down to the index doing the search
+    base = faiss.downcast_index(index)
+    if has_id_map(base):
+        base = faiss.downcast_index(base.index)
+    return base
+
+def _hnsw(index: faiss.Index):
+    if not isinstance(index, faiss.Index):
+        return None
+    base = _unwrap(index)
+    return base if hasattr(base, "hnsw") else None
+
+def has_id_map(index) -> bool:
+    '''
+    True when the index returns stable ids as labels rather than row positions.
+    '''
+    if not isinstance(index, faiss.Index):
+        return False
+    return isinstance(faiss.downcast_index(index), (faiss.IndexIDMap, faiss.IndexIDMap2))
+
+def supports_remove(index: faiss.Index) -> bool:
+    '''
+    HNSW graphs can't delete nodes; their removed ids stay in the graph as
+    tombstones (filtered at query time) until the next compaction rebuild.
+    '''
+    return _hnsw(index) is None
+
+
+class MemmapFlatIndex:
+    """
+    Exact inner-product search straight over a read-only memmap of the
+    normalized vectors (vectors.npy). Every process mapping the file shares
+    the same OS page-cache pages and opening it only reads the .npy header.
+    Exposes the subset of the faiss.Index API the Retriever uses; labels are
+    storage rows (tombstoned rows included), not stable ids.
+    """
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+        self.ntotal = int(vectors.shape[0])
+        self.d = int(vectors.shape[1])
+
+    def search(self, x: np.ndarray, k: int, params=None):
+        return faiss.knn(np.ascontiguousarray(x, dtype="float32"), self.vectors, k, metric=faiss.METRIC_INNER_PRODUCT)
+
+
+def load_index(index_path: Path, vectors_path: Path, mmap: bool = False) -> Tuple[object, str]:
+    '''
+    Loads the FAISS index, optionally without copying it into the private heap.
+    Args:
+        index_path (Path): Path to index.faiss.
+        vectors_path (Path): Path to the full-precision vectors.npy.
+        mmap (bool): Prefer memory-mapped loading.
+    Returns:
+        Tuple[index, str]: The index and how it was loaded
+        ("heap", "mmap" for FAISS-mapped codes / inverted lists, "memmap_flat").
+    '''
+    if not mmap:
+        return faiss.read_index(str(index_path)), "heap"
+
+    # Zero-copy mapping of the stored codes (FAISS >= 1.10) covers every engine
+    flags = faiss.IO_FLAG_READ_ONLY
+    if hasattr(faiss, "IO_FLAG_MMAP_IFC"):
+        try:
+            return faiss.read_index(str(index_path), faiss.IO_FLAG_MMAP_IFC | flags), "mmap"
+        except RuntimeError:
+            pass
+
+    # Older FAISS: flat indexes are served from the vectors memmap (only the
+    # headers are read) and IVF inverted lists are mapped; anything else is read.
+    # Rows appended since the last compaction live in delta segments, which
+    # faiss.knn can't scan as one array, so then the index is read instead.
+    fourcc, dim, ntotal = _read_header(index_path)
+    single_file = vectors_path.exists() and not read_segments(vectors_path)[1]
+    if fourcc in ID_MAP_FOURCCS:
+        # vectors.npy also holds tombstoned rows, so it can't be shorter than the live set
+        fourcc = _read_fourcc(index_path, ID_MAP_INNER_OFFSET)
+        if fourcc == FLAT_IP_FOURCC and single_file:
+            vectors = np.load(vectors_path, mmap_mode="r")
+            if vectors.shape[1] == dim and vectors.shape[0] >= ntotal:
+                return MemmapFlatIndex(vectors), "memmap_flat"
+    elif fourcc == FLAT_IP_FOURCC and single_file:
+        vectors = np.load(vectors_path, mmap_mode="r")
+        if vectors.shape == (ntotal, dim):
+            return MemmapFlatIndex(vectors), "memmap_flat"
+
+    index = faiss.read_index(str(index_path), faiss.IO_FLAG_MMAP | flags)
+    return index, ("mmap" if _ivf(index) is not None else "heap")
+
+def _read_header(index_path: Path) -> Tuple[bytes, int, int]:
+    # Every FAISS index file starts with: fourcc, d (int32), ntotal (int64)
+    with open(index_path, "rb") as f:
+        raw = f.read(16)
+    return raw[:4], int(np.frombuffer(raw, dtype="<i4", count=1, offset=4)[0]), int(np.frombuffer(raw, dtype="<i8", count=1, offset=8)[0])
+
+def _read_fourcc(index_path: Path, offset: int) -> bytes:
+    with open(index_path, "rb") as f:
+        f.seek(offset)
+        return f.read(4)
+
+def describe_index(index: faiss.Index) -> str:
+    '''
+    Returns the engine name of a loaded index (see ENGINE_ALIASES values).
+    '''
+    if isinstance(index, MemmapFlatIndex):
+        return "flat"
+    ivf = _ivf(index)
+    if ivf is not None:
+        return "ivf_pq" if isinstance(faiss.downcast_index(ivf), faiss.IndexIVFPQ) else "ivf_flat"
+    if _hnsw(index) is not None:
+        return "hnsw"
+    base = _unwrap(index)
+    if isinstance(base, faiss.IndexScalarQuantizer):
+        return "fp16" if base.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "flat"
+
+def configure_search(index: faiss.Index, cfg: dict) -> dict:
+    '''
+    Applies the configured default nprobe / efSearch to a loaded index.
+    Returns:
+        dict: The effective search-time parameters.
+    '''
+    engine = describe_index(index)
+    params = {"engine": engine}
+
+    ivf = _ivf(index)
+    if ivf is not None:
+        ivf.nprobe = int(cfg["ivf"]["nprobe"])
+        params["nprobe"] = ivf.nprobe
+
+    hnsw = _hnsw(index)
+    if hnsw is not None:
+        hnsw.hnsw.efSearch = int(cfg["hnsw"]["ef_search"])
+        params["ef_search"] = hnsw.hnsw.efSearch
+
+    if engine in COMPRESSED_ENGINES:
+        params["rerank"] = bool(cfg["compression"]["rerank"])
+        params["rerank_factor"] = int(cfg["compression"]["rerank_factor"])
+
+    return params
+
+def exact_rerank(q_emb: np.ndarray, scores: np.ndarray, idxs: np.ndarray, vectors: np.ndarray):
+    '''
+    Re-scores compressed-index candidates with exact inner products against
+    the full-precision vectors (typically a read-only memmap) and re-sorts them.
+    Padding ids (-1) keep their place at the end with -inf scores.
+    '''
+    exact = np.full(scores.shape, -np.inf, dtype=np.float32)
+    for row in range(len(idxs)):
+        valid = idxs[row] >= 0
+        if valid.any():
+            exact[row, valid] = vectors[idxs[row, valid]] @ q_emb[row]
+    order = np.argsort(-exact, axis=1, kind="stable")
+    return np.take_along_axis(exact, order, axis=1), np.take_along_axis(idxs, order, axis=1)
+
+def measure_recall(
+    index: faiss.Index,
+    emb: np.ndarray,
+    cfg: dict,
+    k: int = 10,
+    seed: int = 42,
+    ids: Optional[np.ndarray] = None
+) -> float:
+    '''
+    Recall@k of the (optionally re-ranked) index against exact search, using
+    a seeded sample of corpus vectors as queries with their self-match excluded.
+    Pass the stable ids the index was built with if it is an IDMap.
+    '''
+    comp_cfg = cfg["compression"]
+    sample = _training_sample(emb, int(comp_cfg["eval_queries"]), seed)
+    fetch = k + 1
+    if comp_cfg["rerank"]:
+        fetch *= int(comp_cfg["rerank_factor"])
+
+    # Brute-force ground truth straight over emb (no second copy of the corpus)
+    _, truth = faiss.knn(sample, emb, k + 1, metric=faiss.METRIC_INNER_PRODUCT)
+
+    scores, found = index.search(sample, min(fetch, len(emb)))
+    if ids is not None:
+        # Map stable ids back to rows of emb
+        ids = np.asarray(ids, dtype=np.int64)
+        sorter = np.argsort(ids)
+        pos = np.clip(np.searchsorted(ids, found, sorter=sorter), 0, len(ids) - 1)
+        found = np.where(found >= 0, sorter[pos], -1)
+    if comp_cfg["rerank"]:
+        scores, found = exact_rerank(sample, scores, found, emb)
+
+    hits = 0
+    for row in range(len(sample)):
+        self_id = truth[row, 0]
+        expected = [i for i in truth[row] if i != self_id][:k]
+        got = [i for i in found[row] if i != self_id and i >= 0][:k]
+        hits += len(set(expected) & set(got))
+    return hits / max(1, len(sample) * k)
+
+def search_parameters(
+    index: faiss.Index,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None
+) -> Optional[faiss.SearchParameters]:
+    '''
+    Builds per-call FAISS search parameters so one request can override
+    nprobe / efSearch without mutating the index shared by other requests.
+    Returns None when nothing applies (flat index or no override).
+    '''
+    if nprobe and _ivf(index) is not None:
+        return faiss.SearchParametersIVF(nprobe=int(nprobe))
+    if ef_search and _hnsw(index) is not None:
+        return faiss.SearchParametersHNSW(efSearch=int(ef_search))
+    return None
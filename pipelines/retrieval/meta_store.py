@@ -0,0 +1,228 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from pipelines.retrieval.segments import atomic_save_npy, atomic_write_json
+
+# Column files inside the metadata directory. Rows are append-only storage
+# positions shared with vectors.npy and the text store; FAISS is keyed by the
+# stable id in ids.npy, which MetaStore.rows_for_ids maps back to a live row.
+PAPER_COLUMN = "paper_idx.npy"     # int32 -> papers.json
+SECTION_COLUMN = "section_idx.npy" # int16 -> sections.json
+ORDER_COLUMN = "order.npy"         # int32 chunk order within its section
+ID_COLUMN = "ids.npy"              # int64 stable chunk id (the FAISS label)
+LIVE_COLUMN = "live.npy"           # uint8 tombstone flag; 0 = deleted, awaiting compaction
+PAPERS_TABLE = "papers.json"       # [{"paper_id", "source", "fingerprint"}] interned once per paper
+SECTIONS_TABLE = "sections.json"   # section enum
+CHUNK_ID_OVERRIDES = "chunk_id_overrides.json"  # rows whose chunk_id isn't the canonical format
+
+def stable_chunk_id(chunk_id: str) -> int:
+    '''
+    Stable non-negative int64 FAISS label derived from the chunk id string,
+    so the same chunk keeps its id across rebuilds, upserts and compaction.
+    '''
+    digest = hashlib.sha256(chunk_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") & 0x7FFF_FFFF_FFFF_FFFF
+
+def canonical_chunk_id(paper_id: str, section: str, order: int) -> str:
+    '''
+    Rebuilds the chunk id written by the extraction stage.
+    '''
+    return f"{paper_id}::sec::{section}::chunk::{order}"
+
+
+class MetaStoreWriter:
+    """
+    Accumulates per-chunk metadata as compact integer columns plus interned
+    paper / section tables, then writes them as .npy files.
+    """
+
+    def __init__(self):
+        self.papers: List[dict] = []
+        self.sections: List[str] = []
+        self._paper_lookup: Dict[str, int] = {}
+        self._section_lookup: Dict[str, int] = {}
+        self.paper_idx: List[int] = []
+        self.section_idx: List[int] = []
+        self.order: List[int] = []
+        self.ids: List[int] = []
+        self.live: List[int] = []
+        self.overrides: Dict[str, str] = {}
+
+    @classmethod
+    def from_store(cls, meta_dir: Path) -> "MetaStoreWriter":
+        '''
+        Loads an existing store so rows can be appended / tombstoned in place.
+        '''
+        store = MetaStore(meta_dir)
+        writer = cls()
+        writer.papers = list(store.papers)
+        writer.sections = list(store.sections)
+        writer._paper_lookup = {p["paper_id"]: i for i, p in enumerate(writer.papers)}
+        writer._section_lookup = {sec: i for i, sec in enumerate(writer.sections)}
+        writer.paper_idx = store.paper_idx.tolist()
+        writer.section_idx = store.section_idx.tolist()
+        writer.order = store.order.tolist()
+        writer.ids = store.ids.tolist()
+        writer.live = store.live.tolist()
+        writer.overrides = {str(k): v for k, v in store.overrides.items()}
+        return writer
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def _intern_paper(self, paper_id: str, source: str) -> int:
+        idx = self._paper_lookup.get(paper_id)
+        if idx is None:
+            idx = len(self.papers)
+            self._paper_lookup[paper_id] = idx
+            self.papers.append({"paper_id": paper_id, "source": source})
+        return idx
+
+    def _intern_section(self, section: str) -> int:
+        idx = self._section_lookup.get(section)
+        if idx is None:
+            idx = len(self.sections)
+            self._section_lookup[section] = idx
+            self.sections.append(section)
+        return idx
+
+    def append(
+        self, 
+        chunk_id: str, 
+        paper_id: str, 
+        source: str, 
+        section: str, 
+        order: int, 
+        fingerprint: Optional[str] = None
+    ) -> int:
+        '''
+        Appends one live row and returns its stable id. fingerprint is the
+        chunk file's extraction fingerprint, used to detect changed papers.
+        '''
+        row = len(self.order)
+        pidx = self._intern_paper(paper_id, source)
+        if fingerprint:
+            self.papers[pidx]["fingerprint"] = fingerprint
+        self.paper_idx.append(pidx)
+        self.section_idx.append(self._intern_section(section))
+        self.order.append(int(order))
+        self.ids.append(stable_chunk_id(chunk_id))
+        self.live.append(1)
+        if chunk_id != canonical_chunk_id(paper_id, section, order):
+            self.overrides[str(row)] = chunk_id
+        return self.ids[-1]
+
+    def live_fingerprints(self) -> Dict[str, Optional[str]]:
+        '''
+        Fingerprint of every paper that still has live rows.
+        '''
+        live_papers = {pidx for pidx, alive in zip(self.paper_idx, self.live) if alive}
+        return {self.papers[i]["paper_id"]: self.papers[i].get("fingerprint") for i in live_papers}
+
+    def live_rows_of_papers(self, paper_ids: Iterable[str]) -> List[int]:
+        wanted = {self._paper_lookup[p] for p in paper_ids if p in self._paper_lookup}
+        return [row for row, pidx in enumerate(self.paper_idx) if pidx in wanted and self.live[row]]
+
+    def tombstone(self, rows: Iterable[int]) -> List[int]:
+        '''
+        Marks rows deleted and returns their stable ids (to remove from FAISS).
+        '''
+        removed = []
+        for row in rows:
+            if self.live[row]:
+                self.live[row] = 0
+                removed.append(self.ids[row])
+        return removed
+
+    def write(self, out_dir: Path):
+        '''
+        Every file goes through a temp file + os.replace: a running MetaStore
+        keeps its mapped (old) columns intact. The tables are written before
+        the columns that index into them, and the id / live columns last.
+        '''
+        out_dir.mkdir(parents=True, exist_ok=True)
+        atomic_write_json(out_dir / PAPERS_TABLE, self.papers)
+        atomic_write_json(out_dir / SECTIONS_TABLE, self.sections)
+        atomic_write_json(out_dir / CHUNK_ID_OVERRIDES, self.overrides)
+
+        atomic_save_npy(out_dir / PAPER_COLUMN, np.asarray(self.paper_idx, dtype=np.int32))
+        atomic_save_npy(out_dir / SECTION_COLUMN, np.asarray(self.section_idx, dtype=np.int16))
+        atomic_save_npy(out_dir / ORDER_COLUMN, np.asarray(self.order, dtype=np.int32))
+        atomic_save_npy(out_dir / ID_COLUMN, np.asarray(self.ids, dtype=np.int64))
+        atomic_save_npy(out_dir / LIVE_COLUMN, np.asarray(self.live, dtype=np.uint8))
+
+
+class MetaStore:
+    """
+    Read side of the columnar metadata store. Columns are memory-mapped, and a
+    row dict is only materialized for the rows a search actually returns.
+    """
+
+    def __init__(self, meta_dir: Path):
+        self.meta_dir = meta_dir
+        self.paper_idx = np.load(meta_dir / PAPER_COLUMN, mmap_mode="r")
+        self.section_idx = np.load(meta_dir / SECTION_COLUMN, mmap_mode="r")
+        self.order = np.load(meta_dir / ORDER_COLUMN, mmap_mode="r")
+
+        # Stores written before stable ids existed are keyed by row position
+        if (meta_dir / ID_COLUMN).exists():
+            self.ids = np.load(meta_dir / ID_COLUMN, mmap_mode="r")
+            self.live = np.load(meta_dir / LIVE_COLUMN, mmap_mode="r")
+        else:
+            self.ids = np.arange(len(self.order), dtype=np.int64)
+            self.live = np.ones(len(self.order), dtype=np.uint8)
+
+        # id -> row lookup over live rows only, so an upserted chunk (same id,
+        # new row) resolves to its newest version and deleted rows never resolve
+        live_rows = np.flatnonzero(self.live)
+        live_ids = np.asarray(self.ids[live_rows])
+        sorter = np.argsort(live_ids, kind="stable")
+        self._sorted_ids = live_ids[sorter]
+        self._sorted_rows = live_rows[sorter]
+
+        with (meta_dir / PAPERS_TABLE).open("r", encoding="utf-8") as f:
+            self.papers = json.load(f)
+        with (meta_dir / SECTIONS_TABLE).open("r", encoding="utf-8") as f:
+            self.sections = json.load(f)
+
+        overrides_path = meta_dir / CHUNK_ID_OVERRIDES
+        self.overrides = {}
+        if overrides_path.exists():
+            with overrides_path.open("r", encoding="utf-8") as f:
+                self.overrides = {int(k): v for k, v in json.load(f).items()}
+
+    def __len__(self) -> int:
+        return int(self.order.shape[0])
+
+    @property
+    def num_live(self) -> int:
+        return int(self._sorted_rows.shape[0])
+
+    def rows_for_ids(self, labels: np.ndarray) -> np.ndarray:
+        '''
+        Maps FAISS labels (stable ids) to live storage rows; -1 if unknown/deleted.
+        '''
+        labels = np.asarray(labels, dtype=np.int64)
+        if not len(self._sorted_ids):
+            return np.full(labels.shape, -1, dtype=np.int64)
+        pos = np.searchsorted(self._sorted_ids, labels)
+        pos = np.clip(pos, 0, len(self._sorted_ids) - 1)
+        found = (self._sorted_ids[pos] == labels) & (labels >= 0)
+        return np.where(found, self._sorted_rows[pos], -1)
+
+    def __getitem__(self, row: int) -> dict:
+        row = int(row)
+        paper = self.papers[int(self.paper_idx[row])]
+        section = self.sections[int(self.section_idx[row])]
+        order = int(self.order[row])
+        return {
+            "chunk_id": self.overrides.get(row) or canonical_chunk_id(paper["paper_id"], section, order),
+            "paper_id": paper["paper_id"],
+            "source": paper["source"],
+            "section": section,
+            "order": order,
+        }
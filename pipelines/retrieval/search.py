@@ -1,25 +1,97 @@
 import json
 import logging
+import os
+import threading
 from pathlib import Path
+from typing import List, Optional
 
-import faiss
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
 from utils.logging import log_event, setup_logger
 from utils.helper_functions import normalize
+from utils.metadata import get_index_hash
 from pipelines.retrieval.hydrate import attach_text
+from pipelines.retrieval.encoder import load_encoder, resolve_backend
+from pipelines.retrieval.batching import BatchingEncoder, load_batching_config
+from pipelines.retrieval.cache import LRUCache, load_cache_config, normalize_query
+from pipelines.retrieval.meta_store import MetaStore
+from pipelines.retrieval.sentence_store import SentenceStore
+from pipelines.retrieval.text_store import TextStore
+from pipelines.retrieval.segments import load_npy_rows, open_segmented
+from pipelines.retrieval.index_factory import configure_search, exact_rerank, has_id_map, load_index, load_index_config, search_parameters
 
 FAISS_DIR = Path("data/processed/faiss")
 INDEX_PATH = FAISS_DIR / "index.faiss"
-META_PATH = FAISS_DIR / "index_meta.json"
+META_DIR = FAISS_DIR / "meta"
+VECTORS_PATH = FAISS_DIR / "vectors.npy"
 
 MODEL_NAME = "sentence-transformers/all-mpnet-base-v2"
 
 CHUNKS_DIR = Path("data/processed/chunks")
-    
+
+# Hits at or below this similarity are dropped
+MIN_SCORE = 0.0
+# Candidates fetched per requested result; grown geometrically if filtering leaves too few
+OVERFETCH_FACTOR = 2
+MAX_FETCH_K = 4096
+
+
+class IndexArtifacts:
+    """
+    One loaded generation of the published index files: FAISS index, meta
+    store, chunk / sentence vectors and chunk texts, tagged with the
+    manifest hash read before loading. A search takes one snapshot and uses
+    it throughout, so a reload never mixes two generations mid-query.
+    Stores are published before the meta store, so they may hold rows of a
+    newer save but never fewer rows; a store that is short is not used.
+    """
+
+    def __init__(self, index_hash: str, mmap: bool, index_cfg: dict):
+        self.index_hash = index_hash
+        # Columnar, memory-mapped; rows are materialized only when returned
+        self.meta = MetaStore(META_DIR)
+
+        # mmap mode shares one set of page-cache pages across workers / eval scripts
+        self.index, self.load_mode = load_index(INDEX_PATH, VECTORS_PATH, mmap=mmap)
+        self.search_config = configure_search(self.index, index_cfg)
+        # IDMap indexes label hits with stable chunk ids, others with storage rows
+        self.id_mapped = has_id_map(self.index)
+
+        # Stored chunk vectors (one per storage row, delta segments included),
+        # memory-mapped so only touched rows are paged in. Compressed indexes
+        # only produce candidates and take their exact scores from here;
+        # attribution reuses them too.
+        self.chunk_store = None
+        if VECTORS_PATH.exists():
+            store = open_segmented(VECTORS_PATH, load_npy_rows)
+            if store.shape[0] >= len(self.meta):
+                self.chunk_store = store
+        self.vectors = None
+        self.rerank_factor = 1
+        if self.search_config.get("rerank") and self.chunk_store is not None:
+            self.vectors = self.chunk_store
+            self.rerank_factor = self.search_config["rerank_factor"]
+
+        # Per-sentence evidence vectors written at build time; attribution
+        # scores answer sentences against these instead of whole chunks
+        self.sentence_store = SentenceStore.open(FAISS_DIR)
+        if self.sentence_store is not None and len(self.sentence_store) < len(self.meta):
+            self.sentence_store = None
+
+        # Cleaned chunk texts by storage row (attach_text falls back to the chunk JSON)
+        self.text_store = TextStore.open(FAISS_DIR)
+        if self.text_store is not None and len(self.text_store) < len(self.meta):
+            self.text_store = None
+
+
 class Retriever:
-    def __init__(self, top_k: int = 8):
+    def __init__(
+        self, 
+        top_k: int = 8, 
+        mmap: Optional[bool] = None, 
+        backend: Optional[str] = None, 
+        batching: Optional[bool] = None
+    ):
         self.top_k = top_k
         self.logger = setup_logger(
             name = "retrieval", 
@@ -27,38 +99,252 @@ class Retriever:
             level = logging.INFO
         )
         
-        self.model = SentenceTransformer(MODEL_NAME)
-        self.index = faiss.read_index(str(INDEX_PATH))
+        # torch / torch_int8 / onnx / onnx_int8 (params.yaml embedding.backend, ENCODER_BACKEND env)
+        self.backend = resolve_backend(backend, role="query")
+        # Concurrent requests share coalesced encoder batches (optionally in a
+        # dedicated process); ENCODER_BATCHING=0 encodes inline per call
+        batching_cfg = load_batching_config()
+        if batching is None:
+            batching = os.environ.get("ENCODER_BATCHING", str(batching_cfg["enabled"])).strip().lower() in ("1", "true", "yes")
+        if batching:
+            self.model = BatchingEncoder(backend=self.backend, model_name=MODEL_NAME, config=batching_cfg)
+        else:
+            self.model = load_encoder(self.backend, MODEL_NAME)
+        self.index_cfg = load_index_config()
+        if mmap is None:
+            mmap = os.environ.get("FAISS_MMAP", str(self.index_cfg["mmap"])).strip().lower() in ("1", "true", "yes")
+        self.mmap = mmap
+        
+        # Two-tier cache: normalized query -> vector, and (query, k, filters,
+        # search knobs, index artifact hash) -> ranked hits
+        cache_cfg = load_cache_config()
+        enabled = bool(cache_cfg["enabled"])
+        self.embedding_cache = LRUCache(cache_cfg["embedding_size"] if enabled else 0, cache_cfg["ttl_sec"])
+        self.result_cache = LRUCache(cache_cfg["result_size"] if enabled else 0, cache_cfg["ttl_sec"])
         
-        with META_PATH.open("r", encoding="utf-8") as f:
-            self.meta = json.load(f)
+        # Reloaded when the index manifest hash changes (update_index / rebuild)
+        self._reload_lock = threading.Lock()
+        self.artifacts = IndexArtifacts(get_index_hash(), self.mmap, self.index_cfg)
             
         log_event(
             logger = self.logger, 
             level = logging.INFO, 
             message = "Retriever Initialized",
-            vectors = self.index.ntotal
+            vectors = self.index.ntotal,
+            live_chunks = self.meta.num_live,
+            encoder_backend = self.backend,
+            encoder_batching = self.model.mode if batching else "off",
+            load_mode = self.artifacts.load_mode,
+            sentence_evidence = self.sentence_store is not None,
+            **self.artifacts.search_config
         )
+    
+    # Views of the currently loaded artifacts
+    @property
+    def index(self):
+        return self.artifacts.index
+    
+    @property
+    def meta(self) -> MetaStore:
+        return self.artifacts.meta
+    
+    @property
+    def sentence_store(self) -> Optional[SentenceStore]:
+        return self.artifacts.sentence_store
+    
+    @property
+    def text_store(self) -> Optional[TextStore]:
+        return self.artifacts.text_store
+    
+    @property
+    def index_hash(self) -> str:
+        # Manifest hash of the loaded artifacts
+        return self.artifacts.index_hash
+    
+    def _current(self) -> IndexArtifacts:
+        '''
+        The artifacts to serve a call from. When the index manifest hash has
+        changed, one caller reloads every store (the others keep using the
+        previous snapshot meanwhile) and the result cache is cleared; a
+        failed reload keeps the old snapshot and is retried on a later call.
+        '''
+        artifacts = self.artifacts
+        index_hash = get_index_hash()
+        if index_hash == artifacts.index_hash or not self._reload_lock.acquire(blocking=False):
+            return artifacts
+        try:
+            if self.artifacts.index_hash != index_hash:
+                try:
+                    self.artifacts = IndexArtifacts(index_hash, self.mmap, self.index_cfg)
+                except Exception as e:
+                    log_event(logger=self.logger, level=logging.WARNING, message="Index Reload Failed", index_hash=index_hash, error=str(e))
+                    return self.artifacts
+                # Every cached ranking belongs to the previous index
+                self.result_cache.clear()
+                log_event(
+                    logger=self.logger, level=logging.INFO, message="Index Reloaded",
+                    index_hash=index_hash, vectors=self.index.ntotal, live_chunks=self.meta.num_live
+                )
+            return self.artifacts
+        finally:
+            self._reload_lock.release()
         
-    def search(self, query: str)-> dict:
+    def _encode(self, queries: List[str], batch_size: int = 32) -> np.ndarray:
         '''
-        Searches for relevant documents based on a query.
-        Args:
-            query (str): The query to search for.
+        Normalized query vectors; repeated queries are served from the
+        embedding cache and only the distinct misses are encoded.
+        '''
+        keys = [normalize_query(q) for q in queries]
+        vectors = [self.embedding_cache.get(key) for key in keys]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            unique = list(dict.fromkeys(keys[i] for i in missing))
+            q_emb = self.model.encode(unique, batch_size=batch_size, normalize_embeddings=False)
+            fresh = dict(zip(unique, normalize(np.asarray(q_emb).astype("float32"))))
+            for key, vec in fresh.items():
+                self.embedding_cache.put(key, vec)
+            for i in missing:
+                vectors[i] = fresh[keys[i]]
+        return np.stack(vectors)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        '''
+        Normalized embedding of one query (through the embedding cache, so a
+        following search() doesn't encode it again).
+        '''
+        return self._encode([query])[0]
+
+    def _result_key(
+        self, 
+        query: str, 
+        k: int, 
+        filters: Optional[dict], 
+        nprobe: Optional[int], 
+        ef_search: Optional[int],
+        artifacts: IndexArtifacts
+    ) -> tuple:
+        # Keyed to the hash of the artifacts that produce the ranking
+        filters_key = json.dumps(filters, sort_keys=True, default=list) if filters else None
+        return (normalize_query(query), int(k), filters_key, nprobe, ef_search, artifacts.index_hash)
+
+    def chunk_vectors(self, rows: List[int], artifacts: Optional[IndexArtifacts] = None) -> Optional[np.ndarray]:
+        '''
+        Normalized indexed vectors of the given storage rows, without running
+        the encoder: read from vectors.npy, else reconstructed from the index.
+        Returns None if neither source can provide them.
+        '''
+        art = artifacts or self.artifacts
+        rows = np.asarray(rows, dtype=np.int64)
+        if art.chunk_store is not None:
+            return np.asarray(art.chunk_store[rows], dtype=np.float32)
+        try:
+            labels = np.asarray(art.meta.ids)[rows] if art.id_mapped else rows
+            return np.vstack([art.index.reconstruct(int(label)) for label in labels]).astype(np.float32)
+        except Exception:
+            # e.g. IVF without a direct map, or a read-only mapped index
+            return None
+
+    def evidence_vectors(self, rows: List[int]):
+        '''
+        Stored evidence vectors for attribution, sentence-level when the
+        sentence store exists (chunks without stored sentences fall back to
+        their chunk vector).
         Returns:
-            dict: A dictionary containing the query and the results.
+            (float32 [n, dim] vectors, owner position in rows per vector,
+            bool [len(rows)]: True where a row's vectors are sentence-level),
+            or None if no stored vectors are available.
         '''
-        q_emb = self.model.encode([query], normalize_embeddings=False)
-        q_emb = normalize(np.asarray(q_emb).astype("float32"))
-        
-        scores, idxs = self.index.search(q_emb, self.top_k)
+        art = self.artifacts
+        if art.sentence_store is None:
+            vectors = self.chunk_vectors(rows, art)
+            return None if vectors is None else (vectors, np.arange(len(rows)), np.zeros(len(rows), dtype=bool))
         
+        vectors, owners = art.sentence_store.vectors_for_rows(rows)
+        sentence_level = np.asarray([art.sentence_store.count(r) > 0 for r in rows], dtype=bool)
+        missing = np.flatnonzero(~sentence_level).tolist()
+        if missing:
+            fallback = self.chunk_vectors([rows[i] for i in missing], art)
+            if fallback is None:
+                return None
+            vectors = np.concatenate([vectors.reshape(-1, fallback.shape[1]), fallback])
+            owners = np.concatenate([owners, np.asarray(missing)])
+        return vectors, owners, sentence_level
+
+    def _attach_vectors(self, results: List[dict], artifacts: IndexArtifacts):
+        vectors = self.chunk_vectors([r["row_id"] for r in results], artifacts) if results else None
+        for i, r in enumerate(results):
+            r["vector"] = vectors[i] if vectors is not None else None
+
+    def cache_stats(self) -> dict:
+        '''
+        Hit / miss / eviction counters of both cache tiers (and the encoder batcher).
+        '''
+        stats = {
+            "index_hash": self.artifacts.index_hash,
+            "embedding_cache": self.embedding_cache.stats(),
+            "result_cache": self.result_cache.stats(),
+        }
+        if hasattr(self.model, "stats"):
+            stats["encoder"] = self.model.stats()
+        return stats
+
+    def _matches(self, m: dict, filters: Optional[dict]) -> bool:
+        if not filters:
+            return True
+        for field, allowed in filters.items():
+            if allowed is not None and m.get(field) not in allowed:
+                return False
+        return True
+
+    def _to_rows(self, scores: np.ndarray, labels: np.ndarray, artifacts: IndexArtifacts):
+        '''
+        Maps FAISS labels to live storage rows. Tombstoned / unknown hits become
+        -1 with a -inf score and are moved behind the live ones.
+        '''
+        if artifacts.id_mapped:
+            rows = artifacts.meta.rows_for_ids(labels)
+        else:
+            rows = np.asarray(labels, dtype=np.int64).copy()
+            valid = rows >= 0
+            rows[valid & (artifacts.meta.live[np.where(valid, rows, 0)] == 0)] = -1
+        scores = np.where(rows >= 0, scores, -np.inf).astype(np.float32)
+        order = np.argsort(-scores, axis=1, kind="stable")
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
+
+    def _collect(
+        self, 
+        scores: np.ndarray, 
+        idxs: np.ndarray, 
+        k: int, 
+        artifacts: IndexArtifacts,
+        filters: Optional[dict] = None, 
+        padded: bool = False
+    ):
+        '''
+        Turns one row of FAISS output into at most k result dicts.
+        Returns the results and whether the candidate list was exhausted
+        (no deeper fetch can produce more hits that pass MIN_SCORE).
+        padded says FAISS itself ran out of candidates for this query.
+        '''
         results = []
-        MIN_SCORE = 0.0
-        for score, idx in zip(scores[0], idxs[0]):
-            m = self.meta[idx]
+        seen = set()
+        for score, idx in zip(scores, idxs):
+            # -1 marks padding or a deleted chunk; both are sorted last. Scores are
+            # sorted, so nothing past the score floor can qualify either.
+            if idx < 0:
+                return results, padded
+            if score <= MIN_SCORE:
+                return results, True
+            # HNSW keeps replaced vectors until compaction; they resolve to the same row
+            if idx in seen:
+                continue
+            seen.add(idx)
+            m = artifacts.meta[idx]
+            if not self._matches(m, filters):
+                continue
             results.append({
                 "score": float(score),
+                "row_id": int(idx),
                 "chunk_id": m["chunk_id"], 
                 "paper_id": m["paper_id"], 
                 "source": m["source"], 
@@ -66,15 +352,140 @@ class Retriever:
                 "order" : m["order"], 
                 "text": None
             })
-        
-        results = [
-            r for r in results
-            if r["score"] > MIN_SCORE
-        ]
+            if len(results) == k:
+                break
             
-        return {
-            "results": results
-        }
+        return results, False
+
+    def _search_vectors(
+        self, 
+        q_emb: np.ndarray, 
+        k: int, 
+        artifacts: IndexArtifacts,
+        filters: Optional[dict] = None, 
+        nprobe: Optional[int] = None, 
+        ef_search: Optional[int] = None
+    ) -> List[dict]:
+        '''
+        Over-fetches from FAISS so that the MIN_SCORE floor and metadata filters
+        still leave k results, re-searching deeper only for queries that came up short.
+        '''
+        art = artifacts
+        n_total = art.index.ntotal
+        fetch_limit = min(n_total, MAX_FETCH_K)
+        fetch_k = min(k * OVERFETCH_FACTOR * art.rerank_factor, fetch_limit)
+        params = search_parameters(art.index, nprobe=nprobe, ef_search=ef_search)
+        search_kwargs = {"params": params} if params is not None else {}
+
+        outputs = [{"results": []} for _ in range(len(q_emb))]
+        pending = np.arange(len(q_emb))
+
+        while len(pending) and fetch_k > 0:
+            scores, labels = art.index.search(q_emb[pending], fetch_k, **search_kwargs)
+            padded = (labels < 0).any(axis=1)
+            scores, idxs = self._to_rows(scores, labels, art)
+            if art.vectors is not None:
+                scores, idxs = exact_rerank(q_emb[pending], scores, idxs, art.vectors)
+            short = []
+            for row, i in enumerate(pending):
+                results, exhausted = self._collect(scores[row], idxs[row], k, art, filters, padded=bool(padded[row]))
+                outputs[i] = {"results": results}
+                if len(results) < k and not exhausted and fetch_k < fetch_limit:
+                    short.append(i)
+
+            pending = np.asarray(short, dtype=np.int64)
+            fetch_k = min(fetch_k * OVERFETCH_FACTOR, fetch_limit)
+
+        return outputs
+
+    def search(
+        self, 
+        query: str, 
+        k: Optional[int] = None, 
+        filters: Optional[dict] = None, 
+        nprobe: Optional[int] = None, 
+        ef_search: Optional[int] = None,
+        with_vectors: bool = False
+    )-> dict:
+        '''
+        Searches for relevant documents based on a query.
+        Args:
+            query (str): The query to search for.
+            k (int): Number of results to return (defaults to the retriever's top_k).
+            filters (dict): Optional metadata filters, e.g. {"section": ["methods"]}.
+            nprobe (int): IVF lists to probe for this call (IVF indexes only).
+            ef_search (int): HNSW search breadth for this call (HNSW indexes only).
+            with_vectors (bool): Attach each hit's stored vector as "vector".
+        Returns:
+            dict: A dictionary containing the query and the results.
+        '''
+        k = k or self.top_k
+        art = self._current()
+        key = self._result_key(query, k, filters, nprobe, ef_search, art)
+        cached = self.result_cache.get(key)
+        if cached is not None:
+            # Copies: callers hydrate result dicts in place
+            out = {"results": [dict(r) for r in cached]}
+        else:
+            q_emb = self._encode([query])
+            out = self._search_vectors(q_emb, k, art, filters, nprobe=nprobe, ef_search=ef_search)[0]
+            self.result_cache.put(key, [dict(r) for r in out["results"]])
+        
+        if with_vectors:
+            self._attach_vectors(out["results"], art)
+        return out
+
+    def search_batch(
+        self, 
+        queries: List[str], 
+        k: Optional[int] = None, 
+        filters: Optional[dict] = None, 
+        batch_size: int = 256,
+        nprobe: Optional[int] = None, 
+        ef_search: Optional[int] = None
+    ) -> List[dict]:
+        '''
+        Searches for many queries at once: encodes them in large batches and
+        runs a single FAISS search over the query matrix.
+        Args:
+            queries (List[str]): The queries to search for.
+            k (int): Results per query (defaults to the retriever's top_k).
+            filters (dict): Optional metadata filters applied to every query.
+            batch_size (int): Encoder batch size.
+            nprobe (int): IVF lists to probe (IVF indexes only).
+            ef_search (int): HNSW search breadth (HNSW indexes only).
+        Returns:
+            List[dict]: One result dict per query, same shape as search().
+        '''
+        if not queries:
+            return []
+        k = k or self.top_k
+        art = self._current()
+
+        keys = [self._result_key(q, k, filters, nprobe, ef_search, art) for q in queries]
+        outputs = [None] * len(queries)
+        for i, key in enumerate(keys):
+            cached = self.result_cache.get(key)
+            if cached is not None:
+                outputs[i] = {"results": [dict(r) for r in cached]}
+        
+        missing = [i for i, out in enumerate(outputs) if out is None]
+        if missing:
+            q_emb = self._encode([queries[i] for i in missing], batch_size=batch_size)
+            searched = self._search_vectors(q_emb, k, art, filters, nprobe=nprobe, ef_search=ef_search)
+            for i, out in zip(missing, searched):
+                self.result_cache.put(keys[i], [dict(r) for r in out["results"]])
+                outputs[i] = out
+
+        log_event(
+            logger = self.logger,
+            level = logging.INFO,
+            message = "Batch Search Complete",
+            queries = len(queries),
+            cached = len(queries) - len(missing),
+            k = k
+        )
+        return outputs
         
 if __name__ == "__main__":
     r = Retriever(top_k = 5)
@@ -82,6 +493,6 @@ if __name__ == "__main__":
     plications, focusing on classifying cybersickness, user emotions,
     and activity. """)
     # print(out)
-    out = attach_text(out)
+    out = attach_text(out, store=r.text_store)
     
     print(json.dumps(out, indent=2))
\ No newline at end of file
@@ -0,0 +1,202 @@
+"""
+Append-only segment files
+-------------------------
+Row data that grows between compactions (vectors.npy, the text blob and the
+sentence vectors) is one base file plus delta segments. An incremental save
+writes each new segment to a temp file, os.replace()s it into place, then
+republishes the small segment list the same way. Files that a running
+server has memory-mapped are never truncated or written to, and an append
+costs O(new rows). compact() folds everything back into one base file.
+
+Readers open the segments listed when they start and keep that snapshot
+until they reload.
+"""
+
+import os
+import re
+import json
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+def _tmp_path(path: Path) -> Path:
+    return path.with_name(path.name + ".tmp")
+
+def atomic_save_npy(path: Path, array: np.ndarray):
+    '''
+    np.save through a temp file + os.replace, so readers that mapped the old
+    file keep a valid (old) inode and new readers see the whole new file.
+    '''
+    tmp = _tmp_path(path)
+    with tmp.open("wb") as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+def atomic_write_json(path: Path, obj, **kwargs):
+    tmp = _tmp_path(path)
+    with tmp.open("w", encoding="utf-8") as f:
+        json.dump(obj, f, **kwargs)
+    os.replace(tmp, path)
+
+def segment_list_path(base: Path) -> Path:
+    return base.with_name(base.name + ".segments.json")
+
+def _segment_pattern(base: Path):
+    stem, suffix = base.name.split(".", 1)
+    return stem, "." + suffix, re.compile(rf"^{re.escape(stem)}\.seg(\d+){re.escape('.' + suffix)}$")
+
+def read_segments(base: Path) -> Tuple[Optional[int], List[dict]]:
+    '''
+    Published delta segments of a base file, oldest first.
+    Returns:
+        (rows in the base file, or None if unrecorded; [{"file": name, "rows": n}])
+    '''
+    path = segment_list_path(base)
+    if not path.exists():
+        return None, []
+    with path.open("r", encoding="utf-8") as f:
+        listing = json.load(f)
+    return listing["base_rows"], listing["segments"]
+
+def publish_segments(base: Path, base_rows: int, segments: List[dict]):
+    atomic_write_json(segment_list_path(base), {"base_rows": int(base_rows), "segments": segments})
+
+def new_segment_path(base: Path, segments: List[dict]) -> Path:
+    '''
+    Path for the next segment. Unpublished leftovers of a crashed save are
+    never mapped by a reader, so reusing their number is safe.
+    '''
+    stem, suffix, pattern = _segment_pattern(base)
+    numbers = [int(pattern.match(s["file"]).group(1)) for s in segments]
+    return base.with_name(f"{stem}.seg{max(numbers, default=0) + 1}{suffix}")
+
+def write_segment(base: Path, segments: List[dict], write: Callable[[Path], None], rows: int) -> List[dict]:
+    '''
+    Writes a new segment (write(tmp_path) fills it) and returns the segment
+    list including it. The caller publishes the list once every store the
+    rows belong to has been written.
+    '''
+    path = new_segment_path(base, segments)
+    tmp = _tmp_path(path)
+    write(tmp)
+    os.replace(tmp, path)
+    return segments + [{"file": path.name, "rows": int(rows)}]
+
+def trim_segments(base_rows: int, segments: List[dict], keep_rows: int) -> List[dict]:
+    '''
+    Drops trailing segments that only hold rows past keep_rows, i.e. rows of
+    a save that crashed before the meta store referencing them was published.
+    Raises:
+        ValueError: If keep_rows doesn't fall on a segment boundary.
+    '''
+    total = base_rows + sum(s["rows"] for s in segments)
+    while segments and total - segments[-1]["rows"] >= keep_rows:
+        total -= segments[-1]["rows"]
+        segments = segments[:-1]
+    if total != keep_rows:
+        raise ValueError(f"Store holds {total} committed rows, expected {keep_rows}")
+    return segments
+
+def remove_stale_segments(base: Path):
+    '''
+    Deletes segment files of base that the published list doesn't reference
+    (folded by a compaction, or left over by a crashed save). Readers that
+    still map one keep its inode until they close it.
+    '''
+    _, segments = read_segments(base)
+    listed = {s["file"] for s in segments}
+    _, _, pattern = _segment_pattern(base)
+    for path in base.parent.glob("*"):
+        name = path.name[:-len(".tmp")] if path.name.endswith(".tmp") else path.name
+        if pattern.match(name) and path.name not in listed:
+            path.unlink(missing_ok=True)
+
+def replace_base(tmp_path: Path, base: Path, rows: int):
+    '''
+    Publishes a freshly written base file (full build / compaction) and
+    drops the segments of the one it replaces.
+    '''
+    os.replace(tmp_path, base)
+    publish_segments(base, rows, [])
+    remove_stale_segments(base)
+
+def remove_segmented(base: Path):
+    # The base file, its segment list and every segment
+    base.unlink(missing_ok=True)
+    segment_list_path(base).unlink(missing_ok=True)
+    remove_stale_segments(base)
+
+
+class SegmentedRows:
+    """
+    Read-only row-wise concatenation of a base array and its delta segments
+    (typically memmaps). Supports the indexing the stores use: an int, a
+    contiguous slice, or an integer array of rows.
+    """
+
+    def __init__(self, parts: List[np.ndarray]):
+        self.parts = parts
+        self.bounds = np.cumsum([0] + [len(p) for p in parts])
+        self.dtype = parts[0].dtype
+        self.shape = (int(self.bounds[-1]),) + tuple(parts[0].shape[1:])
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def _locate(self, rows: np.ndarray):
+        part = np.searchsorted(self.bounds, rows, side="right") - 1
+        return part, rows - self.bounds[part]
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return self[np.arange(start, stop, step)]
+            pieces = []
+            for i, part in enumerate(self.parts):
+                lo, hi = max(start, self.bounds[i]), min(stop, self.bounds[i + 1])
+                if lo < hi:
+                    pieces.append(part[lo - self.bounds[i]:hi - self.bounds[i]])
+            if len(pieces) == 1:
+                return pieces[0]
+            return np.concatenate(pieces) if pieces else np.zeros((0,) + self.shape[1:], dtype=self.dtype)
+        if np.isscalar(key) or (isinstance(key, np.ndarray) and key.ndim == 0):
+            row = int(key)
+            if row < 0:
+                row += len(self)
+            part, local = self._locate(np.asarray([row]))
+            return self.parts[int(part[0])][int(local[0])]
+
+        rows = np.asarray(key, dtype=np.int64)
+        flat = np.where(rows < 0, rows + len(self), rows).ravel()
+        if flat.size and (flat.min() < 0 or flat.max() >= len(self)):
+            raise IndexError(f"row out of range for {len(self)} rows")
+        out = np.empty((flat.size,) + self.shape[1:], dtype=self.dtype)
+        part, local = self._locate(flat)
+        for i in np.unique(part):
+            mask = part == i
+            out[mask] = self.parts[int(i)][local[mask]]
+        return out.reshape(rows.shape + self.shape[1:])
+
+
+def open_segmented(base: Path, load: Callable[[Path, Optional[int]], np.ndarray]):
+    '''
+    Opens base plus its published segments.
+    Args:
+        base (Path): Base file.
+        load (callable): load(path, rows) -> array; rows is None for a
+            base file written before segments existed.
+    Returns:
+        The base array itself when there are no segments, else SegmentedRows.
+    '''
+    base_rows, segments = read_segments(base)
+    parts = [load(base, base_rows)]
+    for segment in segments:
+        parts.append(load(base.with_name(segment["file"]), int(segment["rows"])))
+    return parts[0] if len(parts) == 1 else SegmentedRows(parts)
+
+def load_npy_rows(path: Path, rows: Optional[int] = None) -> np.ndarray:
+    # open_segmented loader for .npy row files
+    array = np.load(path, mmap_mode="r")
+    return array if rows is None else array[:rows]
@@ -0,0 +1,157 @@
+import os
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from pipelines.retrieval.segments import (
+    atomic_save_npy, new_segment_path, open_segmented, publish_segments, read_segments, remove_segmented, remove_stale_segments, trim_segments
+)
+
+SENTENCE_VECTORS = "sentence_vectors.f16"   # raw float16 [n_sentences, dim], normalized (+ delta segments)
+SENTENCE_OFFSETS = "sentence_offsets.npy"   # int64 [n_rows + 1]; row i owns sentences offsets[i]:offsets[i + 1]
+SENTENCE_DTYPE = np.float16
+
+def remove_sentence_store(store_dir: Path):
+    # A stale store would be keyed to rows of a previous build
+    remove_segmented(store_dir / SENTENCE_VECTORS)
+    (store_dir / SENTENCE_OFFSETS).unlink(missing_ok=True)
+
+
+class SentenceStoreWriter:
+    """
+    Streams per-sentence evidence vectors into one packed float16 file,
+    keyed by the storage row of the chunk they were split from. Like the
+    text store, nothing is published until close().
+    """
+
+    def __init__(self, out_dir: Path, append: bool = False, rows: Optional[int] = None):
+        '''
+        append=True continues an existing store (incremental index updates)
+        after its first `rows` chunk rows (default: all); the new vectors go
+        to a new segment, so files a reader has mapped are never modified.
+        '''
+        out_dir.mkdir(parents=True, exist_ok=True)
+        self.out_dir = out_dir
+        self.data_path = out_dir / SENTENCE_VECTORS
+        self.offsets: List[int] = [0]
+        self.dim: Optional[int] = None
+        self.append_mode = append and (out_dir / SENTENCE_OFFSETS).exists() and self.data_path.exists()
+        self.segments: List[dict] = []
+        if self.append_mode:
+            existing = SentenceStore(out_dir)
+            self.dim = existing.dim or None
+            self.offsets = np.asarray(existing.offsets).tolist()
+            if rows is not None:
+                self.offsets = self.offsets[:rows + 1]
+            self.base_rows = existing.base_rows
+            _, segments = read_segments(self.data_path)
+            self.segments = trim_segments(self.base_rows, segments, self.offsets[-1])
+            del existing
+            self._target = new_segment_path(self.data_path, self.segments)
+        else:
+            self._target = self.data_path
+        self._committed = self.offsets[-1]
+        self._tmp = self._target.with_name(self._target.name + ".tmp")
+        self._data = self._tmp.open("wb")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def append(self, vectors: np.ndarray):
+        '''
+        Adds one chunk row. vectors is [n_sentences, dim] and may be empty.
+        '''
+        vectors = np.asarray(vectors)
+        if len(vectors):
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Sentence vector dim {vectors.shape[1]} != store dim {self.dim}")
+            self._data.write(np.ascontiguousarray(vectors, dtype=SENTENCE_DTYPE).tobytes())
+        self.offsets.append(self.offsets[-1] + len(vectors))
+
+    def close(self):
+        self._data.close()
+        added = self.offsets[-1] - self._committed
+        if not self.append_mode:
+            os.replace(self._tmp, self.data_path)
+            publish_segments(self.data_path, self.offsets[-1], [])
+        else:
+            if added:
+                os.replace(self._tmp, self._target)
+                self.segments = self.segments + [{"file": self._target.name, "rows": added}]
+            else:
+                self._tmp.unlink()
+            publish_segments(self.data_path, self.base_rows, self.segments)
+        # Readers load the offsets before the segment list, so they never see rows without data
+        atomic_save_npy(self.out_dir / SENTENCE_OFFSETS, np.asarray(self.offsets, dtype=np.int64))
+        remove_stale_segments(self.data_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SentenceStore:
+    """
+    Read side: vectors (segments included) and offsets are memory-mapped, so
+    the evidence sentences of a handful of retrieved chunks are a few
+    contiguous slices.
+    """
+
+    def __init__(self, store_dir: Path):
+        self.offsets = np.load(store_dir / SENTENCE_OFFSETS, mmap_mode="r")
+        n = int(self.offsets[-1]) if len(self.offsets) else 0
+        data_path = store_dir / SENTENCE_VECTORS
+        base_rows, segments = read_segments(data_path)
+        # Stores written before segments keep every sentence in the base file
+        self.base_rows = n if base_rows is None else int(base_rows)
+
+        # dim isn't stored: each raw file is exactly rows * dim float16 values
+        self.dim = 0
+        itemsize = np.dtype(SENTENCE_DTYPE).itemsize
+        for path, rows in [(data_path, self.base_rows)] + [(data_path.with_name(s["file"]), s["rows"]) for s in segments]:
+            if rows:
+                self.dim = path.stat().st_size // (rows * itemsize)
+                break
+        if n and self.dim:
+            def load(path: Path, rows: Optional[int]) -> np.ndarray:
+                rows = self.base_rows if rows is None else rows
+                if not rows:
+                    return np.zeros((0, self.dim), dtype=SENTENCE_DTYPE)
+                return np.memmap(path, dtype=SENTENCE_DTYPE, mode="r", shape=(rows, self.dim))
+            self.vectors = open_segmented(data_path, load)
+        else:
+            self.vectors = np.zeros((0, 0), dtype=SENTENCE_DTYPE)
+
+    @classmethod
+    def open(cls, store_dir: Path) -> Optional["SentenceStore"]:
+        if not (store_dir / SENTENCE_OFFSETS).exists() or not (store_dir / SENTENCE_VECTORS).exists():
+            return None
+        return cls(store_dir)
+
+    def __len__(self) -> int:
+        return int(self.offsets.shape[0]) - 1
+
+    def count(self, row: int) -> int:
+        return int(self.offsets[row + 1]) - int(self.offsets[row])
+
+    def __getitem__(self, row: int) -> np.ndarray:
+        row = int(row)
+        return self.vectors[int(self.offsets[row]):int(self.offsets[row + 1])]
+
+    def vectors_for_rows(self, rows: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        Stacks the sentence vectors of several chunk rows.
+        Returns:
+            float32 [n_sentences, dim] vectors, and for each sentence the
+            position (in rows) of the chunk it belongs to.
+        '''
+        blocks = [self[r] for r in rows]
+        owners = np.repeat(np.arange(len(rows)), [len(b) for b in blocks])
+        if not len(owners):
+            return np.zeros((0, self.dim), dtype=np.float32), owners
+        return np.concatenate(blocks).astype(np.float32), owners
@@ -0,0 +1,109 @@
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+from pipelines.retrieval.segments import (
+    atomic_save_npy, new_segment_path, open_segmented, publish_segments, read_segments, remove_stale_segments, trim_segments
+)
+
+TEXT_BLOB = "texts.bin"            # concatenated UTF-8 chunk texts, already cleaned (+ delta segments)
+TEXT_OFFSETS = "text_offsets.npy"  # int64 [n + 1]; row i spans offsets[i]:offsets[i + 1]
+
+
+class TextStoreWriter:
+    """
+    Streams chunk texts into one packed blob, keyed by FAISS row id.
+    Nothing is published until close(): a new store replaces the old one,
+    an appended one adds a delta segment, and the offsets go last.
+    """
+
+    def __init__(self, out_dir: Path, append: bool = False, rows: Optional[int] = None):
+        '''
+        append=True continues an existing store (incremental index updates)
+        after its first `rows` rows (default: all); the new texts go to a
+        new segment, so files a reader has mapped are never modified.
+        '''
+        out_dir.mkdir(parents=True, exist_ok=True)
+        self.out_dir = out_dir
+        self.blob_path = out_dir / TEXT_BLOB
+        self.offsets: List[int] = [0]
+        self.append_mode = append and (out_dir / TEXT_OFFSETS).exists() and self.blob_path.exists()
+        self.segments: List[dict] = []
+        if self.append_mode:
+            self.offsets = np.load(out_dir / TEXT_OFFSETS).tolist()
+            if rows is not None:
+                self.offsets = self.offsets[:rows + 1]
+            base_rows, segments = read_segments(self.blob_path)
+            # Stores written before segments keep every byte in the base file
+            self.base_bytes = self.offsets[-1] if base_rows is None else base_rows
+            self.segments = trim_segments(self.base_bytes, segments, self.offsets[-1])
+            self._target = new_segment_path(self.blob_path, self.segments)
+        else:
+            self._target = self.blob_path
+        self._committed = self.offsets[-1]
+        self._tmp = self._target.with_name(self._target.name + ".tmp")
+        self._blob = self._tmp.open("wb")
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def append(self, text: str):
+        data = (text or "").encode("utf-8")
+        self._blob.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self):
+        self._blob.close()
+        added = self.offsets[-1] - self._committed
+        if not self.append_mode:
+            os.replace(self._tmp, self.blob_path)
+            publish_segments(self.blob_path, self.offsets[-1], [])
+        else:
+            if added:
+                os.replace(self._tmp, self._target)
+                self.segments = self.segments + [{"file": self._target.name, "rows": added}]
+            else:
+                self._tmp.unlink()
+            publish_segments(self.blob_path, self.base_bytes, self.segments)
+        # Readers load the offsets before the segment list, so they never see rows without data
+        atomic_save_npy(self.out_dir / TEXT_OFFSETS, np.asarray(self.offsets, dtype=np.int64))
+        remove_stale_segments(self.blob_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _map_bytes(path: Path, rows: Optional[int]) -> np.ndarray:
+    size = path.stat().st_size if rows is None else rows
+    # np.memmap refuses zero-length files
+    return np.memmap(path, dtype=np.uint8, mode="r", shape=(size,)) if size else np.zeros(0, dtype=np.uint8)
+
+
+class TextStore:
+    """
+    Read side: the blob (segments included) and offsets are memory-mapped,
+    so fetching a chunk's text is a constant-time slice with no JSON parsing.
+    """
+
+    def __init__(self, store_dir: Path):
+        self.offsets = np.load(store_dir / TEXT_OFFSETS, mmap_mode="r")
+        self.blob = open_segmented(store_dir / TEXT_BLOB, _map_bytes)
+
+    @classmethod
+    def open(cls, store_dir: Path) -> Optional["TextStore"]:
+        if not (store_dir / TEXT_OFFSETS).exists() or not (store_dir / TEXT_BLOB).exists():
+            return None
+        return cls(store_dir)
+
+    def __len__(self) -> int:
+        return int(self.offsets.shape[0]) - 1
+
+    def __getitem__(self, row: int) -> str:
+        row = int(row)
+        start, end = int(self.offsets[row]), int(self.offsets[row + 1])
+        return np.asarray(self.blob[start:end]).tobytes().decode("utf-8")
@@ -0,0 +1,129 @@
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+
+import numpy as np
+
+# Add project root to path
+sys.path.append(str(Path(__file__).parents[1]))
+
+from utils.helper_functions import normalize
+from pipelines.retrieval.encoder import BACKENDS, MODEL_NAME, load_encoder
+from pipelines.retrieval.text_store import TextStore
+
+TEXT_STORE_DIR = Path("data/processed/faiss")
+EVAL_QUERIES = Path("pipelines/evaluation/data/eval_queries.json")
+REPORT_PATH = Path("logs/encoder_benchmark.json")
+
+def load_samples(n_texts: int, seed: int = 42):
+    '''
+    Corpus chunks (from the text store) for throughput / parity, and eval
+    queries for single-query latency.
+    '''
+    texts = []
+    store = TextStore.open(TEXT_STORE_DIR)
+    if store is not None and len(store):
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(store), size=min(n_texts, len(store)), replace=False)
+        texts = [store[r] for r in sorted(rows)]
+
+    queries = []
+    if EVAL_QUERIES.exists():
+        with EVAL_QUERIES.open("r", encoding="utf-8") as f:
+            queries = [q["query"] for q in json.load(f)]
+    if not queries:
+        queries = [" ".join(t.split()[:24]) for t in texts[:64]]
+    if not texts:
+        texts = queries
+    return texts, queries
+
+def encode(model, texts, batch_size):
+    out = model.encode(texts, batch_size=batch_size, show_progress_bar=False, normalize_embeddings=False)
+    return normalize(np.asarray(out).astype("float32"))
+
+def topk_overlap(ref: np.ndarray, cand: np.ndarray, k: int = 10) -> float:
+    '''
+    Mean overlap of each text's k nearest neighbours within the sample,
+    i.e. how much retrieval would change if only this backend were used.
+    '''
+    k = min(k, len(ref) - 1)
+    if k <= 0:
+        return 1.0
+    ref_nn = np.argsort(-(ref @ ref.T), axis=1)[:, 1:k + 1]
+    cand_nn = np.argsort(-(cand @ cand.T), axis=1)[:, 1:k + 1]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_nn, cand_nn)]))
+
+def benchmark(backend: str, texts, queries, reference, batch_size: int, latency_runs: int) -> dict:
+    t0 = time.perf_counter()
+    model = load_encoder(backend, MODEL_NAME, device="cpu")
+    load_sec = time.perf_counter() - t0
+
+    # Warm-up (graph init / kernel selection)
+    encode(model, queries[:2], batch_size=2)
+
+    t0 = time.perf_counter()
+    vectors = encode(model, texts, batch_size)
+    batch_sec = time.perf_counter() - t0
+
+    latencies = []
+    for i in range(latency_runs):
+        q = queries[i % len(queries)]
+        t0 = time.perf_counter()
+        encode(model, [q], batch_size=1)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    report = {
+        "backend": backend,
+        "load_sec": round(load_sec, 2),
+        "chunks_per_sec": round(len(texts) / batch_sec, 2) if batch_sec else None,
+        "query_p50_ms": round(float(np.percentile(latencies, 50)), 2),
+        "query_p95_ms": round(float(np.percentile(latencies, 95)), 2),
+    }
+    if reference is not None:
+        cos = np.sum(vectors * reference, axis=1)
+        report.update({
+            "cosine_mean": round(float(cos.mean()), 5),
+            "cosine_min": round(float(cos.min()), 5),
+            "cosine_drift": round(float(1.0 - cos.mean()), 5),
+            "top10_overlap": round(topk_overlap(reference, vectors), 4),
+        })
+    return report, vectors
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity + throughput/latency benchmark of the encoder backends")
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--texts", type=int, default=512, help="Corpus chunks for throughput / parity")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--latency_runs", type=int, default=100)
+    parser.add_argument("--max_drift", type=float, default=0.01, help="Fail if 1 - mean cosine vs torch exceeds this")
+    args = parser.parse_args()
+
+    texts, queries = load_samples(args.texts)
+    print(f"Benchmarking {args.backends} on {len(texts)} chunks / {len(queries)} queries")
+
+    # The PyTorch model is the parity reference and always runs first
+    backends = ["torch"] + [b for b in args.backends if b != "torch"]
+    reference = None
+    results = []
+    for backend in backends:
+        report, vectors = benchmark(backend, texts, queries, reference, args.batch_size, args.latency_runs)
+        if backend == "torch":
+            reference = vectors
+        results.append(report)
+        print(json.dumps(report))
+
+    failed = [r["backend"] for r in results if r.get("cosine_drift", 0.0) > args.max_drift]
+
+    REPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
+    with REPORT_PATH.open("w", encoding="utf-8") as f:
+        json.dump({"model": MODEL_NAME, "texts": len(texts), "max_drift": args.max_drift, "results": results, "failed": failed}, f, indent=2)
+    print(f"Report written to {REPORT_PATH}")
+
+    if failed:
+        print(f"FAIL: cosine drift above {args.max_drift} for {failed}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -36,12 +36,12 @@ def main():
 
     # Run 1
     print("  > Execution 1...")
-    res1 = answer(QUERY, mode="strict")
+    res1 = answer(QUERY, mode="strict", use_cache=False)
     hash1, payload1 = hash_response(res1)
 
     # Run 2
     print("  > Execution 2...")
-    res2 = answer(QUERY, mode="strict")
+    res2 = answer(QUERY, mode="strict", use_cache=False)
     hash2, payload2 = hash_response(res2)
 
     # Comparison
@@ -7,7 +7,7 @@ from pathlib import Path
 # Add project root to path
 sys.path.append(str(Path(__file__).parents[1]))
 
-from utils.helper_functions import get_deterministic_json_bytes
+from utils.helper_functions import get_deterministic_json_bytes, load_yaml
 
 # UPDATED: Path matches new dvc.yaml structure
 metadata_PATH = Path("data/versions/dataset_manifest.json") 
@@ -45,6 +45,7 @@ def compute_dataset_hash() -> str:
 def write_dataset_metadata():
     print(f"Computing hash from: {CHUNKS_DIR}")
     dataset_hash = compute_dataset_hash()
+    processing = load_yaml("params.yaml")["processing"]
 
     metadata = {
         "dataset_name": "scholarly-research-assistant",
@@ -54,8 +55,9 @@ def write_dataset_metadata():
         "excludes": ["logs/", "evaluation/"],
         "chunking": {
             "source": "pipelines/processing/extracting_and_chunking_pdfs.py",
-            "size": 64,
-            "overlap": 0,
+            "size": processing["chunk_size"],
+            "overlap": processing["chunk_overlap"],
+            "min_length": processing["min_length"],
         },
         "embedding": {
             "model": "sentence-transformers/all-mpnet-base-v2",
@@ -9,11 +9,14 @@ sys.path.append(os.getcwd())
 from pipelines.retrieval.search import Retriever
 from pipelines.retrieval.hydrate import attach_text
 
+SEARCH_BATCH_SIZE = 512
+
 def adapt_for_rag(results, query):
     return {
         "query": query,
         "results": [
             {
+                "row_id": r.get("row_id"),
                 "paper_id": r["paper_id"],
                 "chunk_id": r["chunk_id"],
                 # Robust section extraction
@@ -59,57 +62,61 @@ def filter_queries():
 
     print(f"Processing {len(candidates)} queries...")
 
+    # 1. Identify Target Section from Query (queries without one are skipped)
+    targeted = []
     for i, query in enumerate(candidates):
+        query_lower = query.lower()
+        for sec in ["abstract", "introduction", "related work", "methodology", "results", "discussion", "conclusion"]:
+            if sec in query_lower:
+                targeted.append((i, query, normalize_section_name(sec)))
+                break
+
+    for start in range(0, len(targeted), SEARCH_BATCH_SIZE):
+        window = targeted[start:start + SEARCH_BATCH_SIZE]
+
+        # 2. Search (one batched encode + FAISS call per window)
         try:
-            # 1. Identify Target Section from Query
-            target_section = None
-            query_lower = query.lower()
-            
-            for sec in ["abstract", "introduction", "related work", "methodology", "results", "discussion", "conclusion"]:
-                if sec in query_lower:
-                    target_section = normalize_section_name(sec)
-                    break
-            
-            if not target_section:
-                continue 
-
-            # 2. Search
-            raw = retriever.search(query)
-            results = raw.get("results", [])
-
-            # 3. Hydrate
-            retrieved_obj = adapt_for_rag(results, query)
-            hydrated = attach_text(retrieved_obj)
-            evidence = hydrated["results"]
-
-            # 4. STRICT FILTERING
-            valid_evidence = []
-            for e in evidence:
-                # Check A: Garbage
-                if is_garbage(e.get("text")):
+            batch_results = retriever.search_batch([query for _, query, _ in window])
+        except Exception as e:
+            print(f"Error searching batch at {start}: {e}")
+            continue
+
+        for (i, query, target_section), raw in zip(window, batch_results):
+            try:
+                results = raw.get("results", [])
+
+                # 3. Hydrate
+                retrieved_obj = adapt_for_rag(results, query)
+                hydrated = attach_text(retrieved_obj, store=retriever.text_store)
+                evidence = hydrated["results"]
+
+                # 4. STRICT FILTERING
+                valid_evidence = []
+                for e in evidence:
+                    # Check A: Garbage
+                    if is_garbage(e.get("text")):
+                        continue
+                    
+                    # Check B: Section Match
+                    chunk_section = normalize_section_name(e["section"])
+                    
+                    # Loose matching (e.g., "method" matches "methodology")
+                    if target_section in chunk_section or chunk_section in target_section:
+                        valid_evidence.append(e)
+
+                # 5. Threshold: Must have at least 1 CLEAN, MATCHING chunk
+                if len(valid_evidence) < 1:
                     continue
-                
-                # Check B: Section Match
-                chunk_section = normalize_section_name(e["section"])
-                
-                # Loose matching (e.g., "method" matches "methodology")
-                if target_section in chunk_section or chunk_section in target_section:
-                    valid_evidence.append(e)
-
-            # 5. Threshold: Must have at least 1 CLEAN, MATCHING chunk
-            if len(valid_evidence) < 1:
-                continue
-
-            validated_data.append({
-                "query": query,
-                "evidence": valid_evidence
-            })
 
-        except Exception as e:
-            print(f"Error processing {query}: {e}")
+                validated_data.append({
+                    "query": query,
+                    "evidence": valid_evidence
+                })
+
+            except Exception as e:
+                print(f"Error processing {query}: {e}")
 
-        if i % 100 == 0:
-            print(f"Processed {i} | Kept {len(validated_data)} Strict Matches")
+        print(f"Processed {min(start + SEARCH_BATCH_SIZE, len(targeted))}/{len(targeted)} | Kept {len(validated_data)} Strict Matches")
 
     with open("data_validated.json", "w") as f:
         json.dump(validated_data, f, indent=2)
@@ -10,10 +10,9 @@ from google import genai
 sys.path.append(os.getcwd())
 
 from pipelines.retrieval.search import Retriever
-from pipelines.postprocess.checks import HallucinationChecker
-from pipelines.postprocess.align import Attributor, split_into_sentences
+from pipelines.rag.answer import get_pipeline
+from pipelines.postprocess.align import split_into_sentences
 from pipelines.postprocess.truncate import apply_strict_truncation, reconstruct_final_answer
-from pipelines.postprocess.confidence import ConfidenceScorer
 from pipelines.postprocess.refusal import check_refusal
 
 class BatchLLM:
@@ -96,7 +95,7 @@ def process_and_label(query, raw_answer, evidence, attributor, checker, scorer):
 
     # 3. Attribution
     sentences = split_into_sentences(raw_answer)
-    attr_result = attributor.verify(sentences, evidence, threshold=0.2)
+    attr_result = attributor.verify(sentences, evidence)
     
     # 4. Truncation
     truncated_details = apply_strict_truncation(attr_result["details"])
@@ -146,10 +145,11 @@ def main():
         return
     
     print("Initializing pipeline components...")
-    retriever_instance = Retriever(top_k=1) 
-    attributor = Attributor(retriever_instance.model) 
-    checker = HallucinationChecker()
-    scorer = ConfidenceScorer()
+    # Same attributor / checker / scorer instances the API and eval harness use
+    pipeline = get_pipeline(Retriever(top_k=1))
+    attributor = pipeline.attributor
+    checker = pipeline.checker
+    scorer = pipeline.scorer
     llm_batcher = BatchLLM()
 
     BATCH_SIZE = 10
@@ -16,7 +16,9 @@ INDEX_MANIFEST = INDEX_DIR / "index_manifest.json"
 
 # UPDATED: Match filenames generated by build_embeddings_and_faiss.py
 FAISS_INDEX_FILE = "index.faiss" 
-FAISS_META_FILE = "index_meta.json"
+FAISS_META_FILE = "meta"  # columnar metadata store directory
+FAISS_VECTORS_FILE = "vectors.npy"
+FAISS_TEXT_FILES = ["texts.bin", "text_offsets.npy"]
 
 # Frozen Config for Retrieval
 RETRIEVAL_CONFIG = {
@@ -30,7 +32,18 @@ def hash_object(obj):
     """Deterministically hash a dictionary."""
     return hashlib.sha256(json.dumps(obj, sort_keys=True).encode("utf-8")).hexdigest()
 
-def write_index_manifest():
+def previous_manifest() -> dict:
+    if not INDEX_MANIFEST.exists():
+        return {}
+    with INDEX_MANIFEST.open("r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_index_manifest(index_params: dict = None, build_stats: dict = None, operation: dict = None):
+    """
+    operation describes what produced this version ({"op": "build" | "add" |
+    "remove" | "compact", ...}). Full builds start a new lineage chain;
+    incremental updates append to the previous manifest's chain.
+    """
     if not DATASET_MANIFEST.exists():
         print(f"CRITICAL: Dataset manifest not found at {DATASET_MANIFEST}")
         return
@@ -38,6 +51,15 @@ def write_index_manifest():
     with DATASET_MANIFEST.open("r", encoding="utf-8") as f:
         dataset_manifest = json.load(f)
 
+    operation = operation or {"op": "build"}
+    previous = previous_manifest()
+    lineage = [] if operation["op"] == "build" else previous.get("lineage", [])
+    lineage = lineage + [{
+        **operation,
+        "parent_artifact_hash": previous.get("artifact_hash") if operation["op"] != "build" else None,
+        "at": datetime.now(timezone.utc).isoformat(),
+    }]
+
     # 1. Create the Manifest Payload
     manifest = {
         "artifact_type": "faiss_index",
@@ -46,9 +68,17 @@ def write_index_manifest():
             "dataset_created_at": dataset_manifest["created_at"]
         },
         "config": RETRIEVAL_CONFIG,
+        # Engine + build/search knobs actually used (nlist, nprobe, m, efSearch...)
+        "index": index_params or {"engine": "flat"},
+        # Chunks indexed vs. dropped as empty / shorter than processing.min_length
+        "build_stats": build_stats or {},
+        # Every incremental add / remove / compact since the last full build
+        "lineage": lineage,
         "files": {
             "index": FAISS_INDEX_FILE,
-            "metadata": FAISS_META_FILE
+            "metadata": FAISS_META_FILE,
+            "vectors": FAISS_VECTORS_FILE,
+            "texts": FAISS_TEXT_FILES
         },
         "git_commit": get_git_revision_hash(),
         "created_at": datetime.now(timezone.utc).isoformat(),
@@ -59,8 +89,11 @@ def write_index_manifest():
 
     INDEX_DIR.mkdir(parents=True, exist_ok=True)
 
-    with INDEX_MANIFEST.open("w", encoding="utf-8") as f:
+    # Published last and atomically: readers reload when its hash changes
+    tmp_path = INDEX_MANIFEST.with_suffix(".tmp")
+    with tmp_path.open("w", encoding="utf-8") as f:
         json.dump(manifest, f, indent=2)
+    tmp_path.replace(INDEX_MANIFEST)
 
     print(f"✅ Index Manifest Written to {INDEX_MANIFEST}")
     print(f"   Artifact Hash: {manifest['artifact_hash']}")
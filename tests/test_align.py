@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("sentence_transformers")
+
+from pipelines.postprocess.align import Attributor
+
+
+class FixedModel:
+    # Every answer sentence encodes to e0
+    def encode(self, texts, normalize_embeddings=True):
+        return np.tile(np.eye(4, dtype=np.float32)[0], (len(texts), 1))
+
+
+def unit(score):
+    # A normalized vector whose cosine with e0 is `score`
+    return np.asarray([score, np.sqrt(1 - score ** 2), 0, 0], dtype=np.float32)
+
+
+def source(sentence_level):
+    def lookup(rows):
+        vectors = np.stack([unit(0.25) for _ in rows])
+        return vectors, np.arange(len(rows)), np.asarray(sentence_level, dtype=bool)
+    return lookup
+
+
+def test_threshold_follows_evidence_granularity():
+    evidence = [{"row_id": 0}]
+    chunk = Attributor(FixedModel(), vector_source=source([False])).verify(["claim"], evidence)
+    sentence = Attributor(FixedModel(), vector_source=source([True])).verify(["claim"], evidence)
+    assert chunk["details"][0]["supported"]
+    assert not sentence["details"][0]["supported"]
+
+
+def test_mixed_evidence_picks_an_item_that_clears_its_own_bar():
+    evidence = [{"row_id": 0}, {"row_id": 1}]
+
+    def lookup(rows):
+        return np.stack([unit(0.28), unit(0.25)]), np.arange(2), np.asarray([True, False])
+
+    det = Attributor(FixedModel(), vector_source=lookup).verify(["claim"], evidence)["details"][0]
+    assert det["supported"] and det["supported_by_chunk_index"] == 1
+
+
+def test_fallback_paths_are_chunk_level_and_threshold_overrides():
+    evidence = [{"vector": unit(0.25)}]
+    attributor = Attributor(FixedModel())
+    assert attributor.verify(["claim"], evidence)["details"][0]["supported"]
+    assert not attributor.verify(["claim"], evidence, threshold=0.3)["details"][0]["supported"]
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+
+from pipelines.rag.answer_cache import SemanticAnswerCache, entity_tokens, normalize_query
+
+PARAMS = {"mode": "strict", "top_k": 8}
+
+
+def unit(*values):
+    vec = np.asarray(values, dtype=np.float32)
+    return vec / np.linalg.norm(vec)
+
+
+def result(answer="BERT is an encoder.", index_hash="idx1", **metrics):
+    return {
+        "query": "What is BERT?",
+        "answer": answer,
+        "index_hash": index_hash,
+        "log_record_id": "run-1",
+        "metrics": {"refusal_triggered": 0.0, **metrics},
+    }
+
+
+@pytest.fixture
+def make_cache(tmp_path, monkeypatch):
+    # setup_logger writes to ./logs
+    monkeypatch.chdir(tmp_path)
+
+    def make(**config):
+        return SemanticAnswerCache({"path": str(tmp_path / "answers.sqlite"), **config})
+    return make
+
+
+def test_query_normalization_and_entity_tokens():
+    assert normalize_query("  What  is BERT?? ") == normalize_query("what is bert")
+    assert entity_tokens("CIFAR-10 vs GPT-4 in 2017") == {"cifar-10", "gpt-4", "2017"}
+    assert entity_tokens("what is attention") == frozenset()
+
+
+def test_exact_tier_ignores_case_and_punctuation(make_cache):
+    cache = make_cache(semantic=False)
+    assert cache.put("What is BERT?", unit(1, 0), PARAMS, result())
+
+    hit = cache.get("what is bert", unit(0, 1), "idx1", PARAMS)
+    assert hit["answer"] == "BERT is an encoder." and hit["query"] == "what is bert"
+    assert hit["metrics"]["cache_tier"] == "exact"
+    # A hit logs no run of its own
+    assert hit["log_record_id"] is None and hit["cached_log_record_id"] == "run-1"
+    # Exact tier only: a paraphrase with the same vector misses
+    assert cache.get("Explain BERT", unit(1, 0), "idx1", PARAMS) is None
+
+
+def test_semantic_tier_respects_threshold(make_cache):
+    cache = make_cache(threshold=0.95)
+    cache.put("What is BERT?", unit(1, 0), PARAMS, result())
+
+    hit = cache.get("Explain BERT", unit(1, 0.1), "idx1", PARAMS)
+    assert hit["metrics"]["cache_tier"] == "semantic" and hit["metrics"]["cache_similarity"] > 0.95
+    assert cache.get("Explain GPT", unit(1, 0.5), "idx1", PARAMS) is None
+
+
+def test_entity_guard_separates_near_identical_queries(make_cache):
+    cache = make_cache(threshold=0.9)
+    cache.put("Accuracy on CIFAR-10?", unit(1, 0), PARAMS, result("91%"))
+
+    assert cache.get("Accuracy on CIFAR-100?", unit(1, 0), "idx1", PARAMS) is None
+    assert cache.get("CIFAR-10 accuracy", unit(1, 0), "idx1", PARAMS)["answer"] == "91%"
+
+
+def test_scope_covers_index_hash_and_params(make_cache):
+    cache = make_cache()
+    cache.put("What is BERT?", unit(1, 0), PARAMS, result())
+
+    assert cache.get("What is BERT?", unit(1, 0), "idx2", PARAMS) is None
+    assert cache.get("What is BERT?", unit(1, 0), "idx1", {**PARAMS, "top_k": 4}) is None
+    assert cache.get("What is BERT?", unit(1, 0), "idx1", PARAMS) is not None
+
+
+def test_unknown_index_hash_is_never_cached(make_cache):
+    cache = make_cache()
+    assert not cache.put("What is BERT?", unit(1, 0), PARAMS, result(index_hash="unknown"))
+    assert not cache.put("What is BERT?", unit(1, 0), PARAMS, result(index_hash=None))
+    cache.put("What is BERT?", unit(1, 0), PARAMS, result())
+    assert cache.get("What is BERT?", unit(1, 0), "unknown", PARAMS) is None
+    assert cache.stats()["skipped"] == 1
+
+
+def test_refusals_and_hits_are_not_stored(make_cache):
+    cache = make_cache()
+    assert not cache.put("q", unit(1, 0), PARAMS, result(answer=None))
+    assert not cache.put("q", unit(1, 0), PARAMS, result(refusal_triggered=1.0))
+    assert not cache.put("q", unit(1, 0), PARAMS, result(cache_hit=True))
+    assert len(cache) == 0
+
+
+def test_lru_bound_and_persistence(make_cache):
+    cache = make_cache(max_entries=2)
+    cache.put("first", unit(1, 0, 0), PARAMS, result("1"))
+    cache.put("second", unit(0, 1, 0), PARAMS, result("2"))
+    assert cache.get("first", unit(1, 0, 0), "idx1", PARAMS)["answer"] == "1"
+    cache.put("third", unit(0, 0, 1), PARAMS, result("3"))
+
+    assert len(cache) == 2 and cache.stats()["evictions"] == 1
+    assert cache.get("second", unit(0, 1, 0), "idx1", PARAMS) is None
+    cache.close()
+
+    reopened = make_cache(max_entries=2)
+    assert len(reopened) == 2
+    assert reopened.get("first", unit(1, 0, 0), "idx1", PARAMS)["answer"] == "1"
+    assert reopened.get("third", unit(0, 0, 1), "idx1", PARAMS)["answer"] == "3"
@@ -0,0 +1,60 @@
+import pytest
+
+pytest.importorskip("pdfplumber")
+
+from pipelines.processing.extracting_and_chunking_pdfs import chunk_text
+
+
+def words(n: int) -> str:
+    return " ".join(f"w{i}" for i in range(n))
+
+
+def test_windows_overlap_by_the_configured_words():
+    chunks = [c.split() for c in chunk_text(words(10), max_words=4, overlap=2)]
+    assert chunks[0] == ["w0", "w1", "w2", "w3"]
+    for prev, cur in zip(chunks, chunks[1:]):
+        assert prev[-2:] == cur[:2]
+
+
+def test_every_word_is_covered_in_order():
+    for max_words, overlap in [(4, 0), (4, 1), (4, 3), (5, 2), (7, 3)]:
+        for n in range(1, 30):
+            chunks = [c.split() for c in chunk_text(words(n), max_words, overlap)]
+            seen = []
+            for chunk in chunks:
+                seen.extend(w for w in chunk if not seen or int(w[1:]) > int(seen[-1][1:]))
+            assert seen == words(n).split(), (max_words, overlap, n)
+
+
+def test_short_tail_is_folded_into_the_last_window():
+    # After w6..w9 only w10 is new; a [w8, w9, w10] chunk would be mostly overlap
+    chunks = [c.split() for c in chunk_text(words(11), max_words=4, overlap=2)]
+    assert chunks[-1] == ["w6", "w7", "w8", "w9", "w10"]
+    assert all(len(c) < 4 + 2 for c in chunks)
+
+
+def test_tail_with_enough_new_words_is_its_own_chunk():
+    chunks = [c.split() for c in chunk_text(words(9), max_words=4, overlap=1)]
+    assert chunks == [["w0", "w1", "w2", "w3"], ["w3", "w4", "w5", "w6"], ["w6", "w7", "w8"]]
+
+
+def test_no_overlap_keeps_the_tail_separate():
+    chunks = [c.split() for c in chunk_text(words(10), max_words=4, overlap=0)]
+    assert chunks[-1] == ["w8", "w9"]
+
+
+def test_tail_below_min_length_is_not_lost():
+    chunks = [c.split() for c in chunk_text(words(10), max_words=4, overlap=0, min_length=3)]
+    assert chunks[-1] == ["w4", "w5", "w6", "w7", "w8", "w9"]
+
+
+def test_short_section_and_empty_text():
+    assert list(chunk_text("a b", max_words=4, overlap=1, min_length=3)) == []
+    assert list(chunk_text("a b c", max_words=4, overlap=1, min_length=3)) == ["a b c"]
+    assert list(chunk_text("", max_words=4, overlap=1)) == []
+    assert list(chunk_text("a b c d", max_words=4, overlap=1)) == ["a b c d"]
+
+
+def test_overlap_must_be_smaller_than_the_window():
+    with pytest.raises(ValueError):
+        list(chunk_text(words(5), max_words=4, overlap=4))
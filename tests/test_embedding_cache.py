@@ -0,0 +1,66 @@
+import numpy as np
+
+from pipelines.processing.embedding_cache import EmbeddingCache, cache_key
+
+
+class CountingEncoder:
+    def __init__(self, dim: int = 4):
+        self.dim = dim
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return np.asarray([[len(t) + i for i in range(self.dim)] for t in texts], dtype=np.float32)
+
+
+def test_cache_key_ignores_whitespace_but_not_model():
+    assert cache_key("m", "a  b\n c") == cache_key("m", "a b c")
+    assert cache_key("m", "a b") != cache_key("other", "a b")
+
+
+def test_only_misses_are_encoded(tmp_path):
+    cache = EmbeddingCache(tmp_path, "model")
+    encode = CountingEncoder()
+
+    emb, hits = cache.get_or_encode(["alpha", "beta", "alpha"], encode)
+    assert hits == 0 and emb.shape == (3, 4)
+    # Duplicates inside one call are encoded once
+    assert encode.calls == [["alpha", "beta"]]
+    np.testing.assert_array_equal(emb[0], emb[2])
+
+    emb2, hits = cache.get_or_encode(["beta", "gamma"], encode)
+    assert hits == 1 and encode.calls[-1] == ["gamma"]
+    np.testing.assert_array_equal(emb2[0], emb[1])
+    assert len(cache) == 3
+
+
+def test_cache_persists_across_instances(tmp_path):
+    encode = CountingEncoder()
+    EmbeddingCache(tmp_path, "model").get_or_encode(["alpha", "beta"], encode)
+
+    reopened = EmbeddingCache(tmp_path, "model")
+    emb, hits = reopened.get_or_encode(["beta", "alpha"], encode)
+    assert hits == 2 and len(encode.calls) == 1
+    np.testing.assert_array_equal(emb, encode(["beta", "alpha"]))
+
+
+def test_models_get_separate_caches(tmp_path):
+    encode = CountingEncoder()
+    EmbeddingCache(tmp_path, "model").get_or_encode(["alpha"], encode)
+    _, hits = EmbeddingCache(tmp_path, "model@onnx").get_or_encode(["alpha"], encode)
+    assert hits == 0
+
+
+def test_torn_append_is_repaired(tmp_path):
+    cache = EmbeddingCache(tmp_path, "model")
+    cache.get_or_encode(["alpha", "beta"], CountingEncoder())
+    # An interrupted append: half a vector and no key
+    with cache.vectors_path.open("ab") as f:
+        f.write(b"\0" * 6)
+    with cache.keys_path.open("a", encoding="utf-8") as f:
+        f.write(cache_key("model", "orphan") + "\n")
+
+    reopened = EmbeddingCache(tmp_path, "model")
+    assert len(reopened) == 2
+    assert reopened.vectors_path.stat().st_size == 2 * 4 * 4
+    assert reopened.lookup([cache_key("model", "orphan")]).tolist() == [-1]
@@ -0,0 +1,42 @@
+import numpy as np
+
+from pipelines.processing import encoding
+from pipelines.processing.encoding import CorpusEncoder, plan_batches
+
+
+class WordTokenizer:
+    def __call__(self, texts, add_special_tokens=True, truncation=True, max_length=None):
+        return {"input_ids": [t.split()[:max_length] for t in texts]}
+
+
+class LengthModel:
+    def __init__(self):
+        self.batches = []
+
+    def encode(self, texts, batch_size=32, show_progress_bar=False, normalize_embeddings=False):
+        self.batches.append(list(texts))
+        return np.asarray([[len(t.split()), 1.0] for t in texts], dtype=np.float32)
+
+
+def test_plan_batches_respects_the_token_budget():
+    lengths = np.asarray([2, 8, 4, 8, 1])
+    batches = plan_batches(lengths, max_batch_tokens=16, max_batch_size=3)
+    assert [b.tolist() for b in batches] == [[1, 3], [2, 0, 4]]
+    assert sorted(np.concatenate(batches).tolist()) == list(range(5))
+
+
+def test_single_worker_uses_the_given_model_in_input_order(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    model = LengthModel()
+    config = {"workers": 1, "max_batch_tokens": 4, "max_batch_size": 8}
+    encoder = CorpusEncoder("model", config=config, model=model)
+    encoder._tok = WordTokenizer()
+    texts = ["a", "a b c", "a b"]
+
+    out = encoder(texts)
+    expected = np.asarray([[1, 1], [3, 1], [2, 1]], dtype=np.float32)
+    np.testing.assert_allclose(out, expected / np.linalg.norm(expected, axis=1, keepdims=True), rtol=1e-6)
+    # Longest first, packed by the token budget
+    assert model.batches == [["a b c"], ["a b", "a"]]
+    # Neither a second model nor the worker globals were set up in this process
+    assert encoding._worker_model is None and encoder.model is model
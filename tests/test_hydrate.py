@@ -0,0 +1,34 @@
+from pipelines.retrieval import hydrate
+from pipelines.retrieval.text_store import TextStoreWriter
+
+
+def write_texts(out_dir, texts):
+    with TextStoreWriter(out_dir) as writer:
+        for text in texts:
+            writer.append(text)
+
+
+def test_default_store_follows_the_index_hash(tmp_path, monkeypatch):
+    index_hash = ["h1"]
+    monkeypatch.setattr(hydrate, "TEXT_STORE_DIR", tmp_path)
+    monkeypatch.setattr(hydrate, "get_index_hash", lambda: index_hash[0])
+    monkeypatch.setattr(hydrate, "_text_store", None)
+
+    write_texts(tmp_path, ["old 0", "old 1"])
+    out = hydrate.attach_text({"results": [{"row_id": 1, "paper_id": "p"}]})
+    assert out["results"][0]["text"] == "old 1"
+
+    # A compaction renumbers the rows and publishes a new manifest
+    write_texts(tmp_path, ["new 0", "new 1"])
+    assert hydrate.get_text_store()[1] == "old 1"
+    index_hash[0] = "h2"
+    out = hydrate.attach_text({"results": [{"row_id": 1, "paper_id": "p"}]})
+    assert out["results"][0]["text"] == "new 1"
+
+
+def test_explicit_store_wins(tmp_path, monkeypatch):
+    monkeypatch.setattr(hydrate, "TEXT_STORE_DIR", tmp_path / "missing")
+    write_texts(tmp_path / "own", ["mine"])
+    store = hydrate.TextStore(tmp_path / "own")
+    out = hydrate.attach_text({"results": [{"row_id": 0, "paper_id": "p"}]}, store=store)
+    assert out["results"][0]["text"] == "mine"
@@ -0,0 +1,84 @@
+import queue
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("mlflow.entities")
+
+from utils.mlflow_queue import DEFAULT_TRACKING_CONFIG, RunLogQueue
+
+
+class FlakyClient:
+    def __init__(self, fail_batches: int = 0):
+        self.fail_batches = fail_batches
+        self.created = []
+        self.batches = []
+        self.terminated = []
+
+    def create_run(self, experiment_id, start_time, tags, run_name):
+        self.created.append(tags["log_record_id"])
+        return SimpleNamespace(info=SimpleNamespace(run_id=f"run-{len(self.created)}"))
+
+    def log_batch(self, run_id, metrics, params):
+        if self.fail_batches:
+            self.fail_batches -= 1
+            raise ConnectionError("tracking server unavailable")
+        self.batches.append(run_id)
+
+    def set_terminated(self, run_id, end_time):
+        self.terminated.append(run_id)
+
+    def search_runs(self, experiment_ids, filter_string, max_results):
+        return []
+
+
+def record(record_id: str) -> dict:
+    return {
+        "record_id": record_id, "run_name": "q", "experiment_id": "0", "experiment_name": None,
+        "parent_run_id": None, "tags": {}, "metrics": {"m": 1.0}, "params": {}, "timestamp_ms": 0,
+    }
+
+
+@pytest.fixture
+def make_queue(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def make(**config):
+        return RunLogQueue({**DEFAULT_TRACKING_CONFIG, **config}, spill_path=tmp_path / "spill.jsonl")
+    return make
+
+
+def test_replay_resumes_a_half_written_run(make_queue):
+    runs = make_queue(**{"async": False})
+    runs._client = FlakyClient(fail_batches=1)
+    runs._write([record("a")])
+    assert runs.counters["spilled"] == 1 and runs._client.created == ["a"]
+
+    assert runs.replay_spill() == 1
+    # The run created before the failure is finished, not created again
+    assert runs._client.created == ["a"]
+    assert runs._client.batches == ["run-1"] and runs._client.terminated == ["run-1"]
+    assert not runs.spill_path.exists()
+
+
+def test_close_spills_instead_of_blocking_on_a_stuck_writer(make_queue):
+    runs = make_queue(queue_size=1, flush_interval_sec=0.0)
+    release = threading.Event()
+    started = threading.Event()
+
+    def stuck(record, resume=False):
+        started.set()
+        release.wait()
+    runs._write_one = stuck
+
+    runs._queue.put(record("in-flight"))
+    assert started.wait(timeout=5)
+    runs._queue.put(record("queued"))
+    with pytest.raises(queue.Full):
+        runs._queue.put_nowait(record("overflow"))
+
+    runs.close(timeout=0.2)
+    release.set()
+    spilled = runs.spill_path.read_text().splitlines()
+    assert len(spilled) == 1 and '"queued"' in spilled[0]
@@ -0,0 +1,83 @@
+import pytest
+
+pytest.importorskip("google.genai")
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("faiss")
+
+from evaluation import result_store
+from evaluation.result_store import ResultStore, result_key, retriever_encoder
+
+PARAMS = {"top_k": 8, "confidence_threshold": 0.0, "encoder": "model", "nprobe": None, "ef_search": None}
+
+
+def test_key_covers_everything_that_changes_the_answer():
+    base = result_key("q", "strict", "idx1", PARAMS)
+    assert base == result_key("q", "strict", "idx1", dict(reversed(list(PARAMS.items()))))
+    variants = [
+        result_key("q2", "strict", "idx1", PARAMS),
+        result_key("q", "synthesis", "idx1", PARAMS),
+        result_key("q", "strict", "idx2", PARAMS),
+        result_key("q", "strict", None, PARAMS),
+        result_key("q", "strict", "idx1", {**PARAMS, "top_k": 4}),
+        result_key("q", "strict", "idx1", {**PARAMS, "encoder": "model@onnx"}),
+        result_key("q", "strict", "idx1", {**PARAMS, "nprobe": 16}),
+        result_key("q", "strict", "idx1", {**PARAMS, "ef_search": 64}),
+        result_key("q", "strict", "idx1", PARAMS, prompt_version="other"),
+        result_key("q", "strict", "idx1", PARAMS, guardrail_version="other"),
+        result_key("q", "strict", "idx1", PARAMS, model="other"),
+    ]
+    assert base not in variants and len(set(variants)) == len(variants)
+
+
+def test_retriever_encoder_reads_the_dense_backend():
+    class Dense:
+        backend = "onnx"
+
+    class Hybrid:
+        dense = Dense()
+
+    assert retriever_encoder(Dense()) == retriever_encoder(Hybrid())
+    assert retriever_encoder(Dense()).endswith("@onnx")
+    assert retriever_encoder(object()) is None
+
+
+def test_put_get_newest_wins_and_persists(tmp_path):
+    path = tmp_path / "results.sqlite"
+    store = ResultStore(path)
+    key = result_key("q", "strict", "idx1", PARAMS)
+    assert store.get(key) is None
+
+    store.put(key, {"answer": "old"}, "q", "strict", "idx1", PARAMS)
+    store.put(key, {"answer": "new"}, "q", "strict", "idx1", PARAMS)
+    assert store.get(key) == {"answer": "new"}
+    assert store.stats() == {"hits": 1, "misses": 1, "writes": 2, "skipped": 0}
+
+    assert ResultStore(path).get(key) == {"answer": "new"}
+
+
+def test_answer_skips_generation_failures_and_can_refresh(tmp_path, monkeypatch):
+    replies = []
+
+    class Pipeline:
+        retriever = None
+
+        def resolve_top_k(self, top_k):
+            return top_k or 8
+
+        def answer(self, query, **kwargs):
+            return replies.pop(0)
+
+    monkeypatch.setattr(result_store, "get_pipeline", lambda retriever: Pipeline())
+    store = ResultStore(tmp_path / "results.sqlite")
+
+    replies.append({"answer": None, "metrics": {"refusal_reason": "Max Retries Failed"}})
+    out, stored = store.answer("q")
+    assert not stored and out["answer"] is None and store.stats()["skipped"] == 1
+
+    replies.append({"answer": "first", "metrics": {}})
+    assert store.answer("q") == ({"answer": "first", "metrics": {}}, False)
+    assert store.answer("q")[1]
+
+    replies.append({"answer": "second", "metrics": {}})
+    assert store.answer("q", refresh=True)[0]["answer"] == "second"
+    assert store.answer("q")[0]["answer"] == "second"
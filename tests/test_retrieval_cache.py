@@ -0,0 +1,59 @@
+import pytest
+
+from pipelines.retrieval import cache as cache_module
+from pipelines.retrieval.cache import LRUCache, normalize_query
+
+
+def test_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "b" is now the oldest
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1 and len(cache) == 2
+
+
+def test_put_refreshes_recency_and_value():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.put("a", 10)
+    cache.put("c", 3)
+    assert cache.get("a") == 10 and cache.get("b") is None
+
+
+def test_zero_size_disables_caching():
+    cache = LRUCache(0)
+    cache.put("a", 1)
+    assert cache.get("a", "miss") == "miss" and len(cache) == 0
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache_module.time, "monotonic", lambda: now[0])
+    cache = LRUCache(4, ttl_sec=10)
+    cache.put("a", 1)
+    now[0] += 5
+    assert cache.get("a") == 1
+    now[0] += 6
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_clear_and_stats():
+    cache = LRUCache(4)
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("b")
+    cache.clear()
+    stats = cache.stats()
+    assert stats["size"] == 0 and stats["invalidations"] == 1
+    assert stats["hits"] == 1 and stats["misses"] == 1 and stats["hit_rate"] == pytest.approx(0.5)
+
+
+def test_normalize_query_folds_whitespace_only():
+    assert normalize_query("  What is\tBERT?\n") == "What is BERT?"
+    assert normalize_query("bert") != normalize_query("BERT")
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+
+from pipelines.retrieval import segments
+
+
+def save_base(path, array):
+    segments.atomic_save_npy(path, array)
+    segments.publish_segments(path, len(array), [])
+
+
+def append(path, array, keep_rows=None):
+    base_rows, listed = segments.read_segments(path)
+    if keep_rows is not None:
+        listed = segments.trim_segments(base_rows, listed, keep_rows)
+
+    def write(tmp_path):
+        with tmp_path.open("wb") as f:
+            np.save(f, array)
+    listed = segments.write_segment(path, listed, write, len(array))
+    segments.publish_segments(path, base_rows, listed)
+    segments.remove_stale_segments(path)
+
+
+@pytest.fixture
+def rows():
+    return np.arange(20, dtype=np.float32).reshape(10, 2)
+
+
+def test_open_segmented_without_segments_is_the_base_array(tmp_path, rows):
+    path = tmp_path / "vectors.npy"
+    save_base(path, rows)
+    opened = segments.open_segmented(path, segments.load_npy_rows)
+    assert isinstance(opened, np.ndarray)
+    np.testing.assert_array_equal(opened, rows)
+
+
+def test_appends_go_to_new_segments(tmp_path, rows):
+    path = tmp_path / "vectors.npy"
+    save_base(path, rows[:4])
+    base_bytes = path.read_bytes()
+    append(path, rows[4:7])
+    append(path, rows[7:])
+
+    # The base file a reader may have mapped is never rewritten
+    assert path.read_bytes() == base_bytes
+    assert sorted(p.name for p in tmp_path.glob("vectors.seg*")) == ["vectors.seg1.npy", "vectors.seg2.npy"]
+    opened = segments.open_segmented(path, segments.load_npy_rows)
+    assert opened.shape == (10, 2) and len(opened) == 10
+
+
+def test_segmented_rows_indexing(tmp_path, rows):
+    path = tmp_path / "vectors.npy"
+    save_base(path, rows[:4])
+    append(path, rows[4:7])
+    append(path, rows[7:])
+    opened = segments.open_segmented(path, segments.load_npy_rows)
+
+    np.testing.assert_array_equal(opened[5], rows[5])
+    np.testing.assert_array_equal(opened[-1], rows[-1])
+    np.testing.assert_array_equal(opened[2:9], rows[2:9])
+    np.testing.assert_array_equal(opened[::3], rows[::3])
+    np.testing.assert_array_equal(opened[8:8], rows[8:8])
+    picks = np.asarray([[9, 0], [4, 6]])
+    np.testing.assert_array_equal(opened[picks], rows[picks])
+    with pytest.raises(IndexError):
+        opened[np.asarray([10])]
+
+
+def test_trim_drops_rows_of_a_crashed_save(tmp_path, rows):
+    path = tmp_path / "vectors.npy"
+    save_base(path, rows[:4])
+    append(path, rows[4:6])
+    # Rows 6..9 were published but the meta store never referenced them
+    append(path, np.full((4, 2), -1, dtype=np.float32))
+    append(path, rows[6:], keep_rows=6)
+
+    opened = segments.open_segmented(path, segments.load_npy_rows)
+    np.testing.assert_array_equal(opened[:], rows)
+    assert sorted(p.name for p in tmp_path.glob("vectors.seg*")) == ["vectors.seg1.npy", "vectors.seg2.npy"]
+
+
+def test_trim_rejects_rows_inside_a_segment():
+    with pytest.raises(ValueError):
+        segments.trim_segments(4, [{"file": "vectors.seg1.npy", "rows": 3}], 5)
+
+
+def test_replace_base_folds_segments(tmp_path, rows):
+    path = tmp_path / "vectors.npy"
+    save_base(path, rows[:4])
+    append(path, rows[4:])
+    reader = segments.open_segmented(path, segments.load_npy_rows)
+
+    tmp = tmp_path / "vectors.npy.tmp"
+    with tmp.open("wb") as f:
+        np.save(f, rows[::2])
+    segments.replace_base(tmp, path, 5)
+
+    assert segments.read_segments(path) == (5, [])
+    assert list(tmp_path.glob("vectors.seg*")) == []
+    np.testing.assert_array_equal(segments.open_segmented(path, segments.load_npy_rows), rows[::2])
+    # A reader opened before the compaction still sees its own generation
+    np.testing.assert_array_equal(reader[:], rows)
+
+
+def test_legacy_base_without_segment_list(tmp_path, rows):
+    path = tmp_path / "vectors.npy"
+    np.save(path, rows)
+    assert segments.read_segments(path) == (None, [])
+    np.testing.assert_array_equal(segments.open_segmented(path, segments.load_npy_rows), rows)
+
+
+def test_remove_segmented(tmp_path, rows):
+    path = tmp_path / "vectors.npy"
+    save_base(path, rows[:4])
+    append(path, rows[4:])
+    (tmp_path / "vectors.seg9.npy.tmp").write_bytes(b"partial")
+    segments.remove_segmented(path)
+    assert list(tmp_path.iterdir()) == []
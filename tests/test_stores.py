@@ -0,0 +1,130 @@
+import numpy as np
+import pytest
+
+from pipelines.retrieval.meta_store import MetaStore, MetaStoreWriter, stable_chunk_id
+from pipelines.retrieval.sentence_store import SentenceStore, SentenceStoreWriter, remove_sentence_store
+from pipelines.retrieval.text_store import TextStore, TextStoreWriter
+
+
+def chunk_id(paper: str, section: str, order: int) -> str:
+    return f"{paper}::sec::{section}::chunk::{order}"
+
+
+@pytest.fixture
+def meta_dir(tmp_path):
+    writer = MetaStoreWriter()
+    writer.append(chunk_id("p1", "intro", 0), "p1", "p1.pdf", "intro", 0, fingerprint="f1")
+    writer.append(chunk_id("p1", "methods", 1), "p1", "p1.pdf", "methods", 1, fingerprint="f1")
+    writer.append("custom-id", "p2", "p2.pdf", "intro", 0, fingerprint="f2")
+    writer.write(tmp_path / "meta")
+    return tmp_path / "meta"
+
+
+def test_meta_store_round_trip(meta_dir):
+    store = MetaStore(meta_dir)
+    assert len(store) == 3 and store.num_live == 3
+    assert store[1] == {
+        "chunk_id": chunk_id("p1", "methods", 1),
+        "paper_id": "p1",
+        "source": "p1.pdf",
+        "section": "methods",
+        "order": 1,
+    }
+    # Non-canonical chunk ids survive through the overrides table
+    assert store[2]["chunk_id"] == "custom-id"
+    assert store.sections == ["intro", "methods"]
+
+
+def test_meta_store_ids_resolve_to_live_rows(meta_dir):
+    store = MetaStore(meta_dir)
+    ids = [stable_chunk_id(chunk_id("p1", "intro", 0)), stable_chunk_id("custom-id"), 12345, -1]
+    assert store.rows_for_ids(np.asarray(ids)).tolist() == [0, 2, -1, -1]
+
+
+def test_meta_store_upsert_and_tombstone(meta_dir):
+    writer = MetaStoreWriter.from_store(meta_dir)
+    assert writer.live_fingerprints() == {"p1": "f1", "p2": "f2"}
+
+    rows = writer.live_rows_of_papers(["p1"])
+    removed = writer.tombstone(rows)
+    assert rows == [0, 1] and len(removed) == 2
+    # Tombstoning twice removes nothing more
+    assert writer.tombstone(rows) == []
+    # Re-adding a chunk keeps its stable id but gets a new row
+    new_id = writer.append(chunk_id("p1", "intro", 0), "p1", "p1.pdf", "intro", 0, fingerprint="f1b")
+    writer.write(meta_dir)
+
+    store = MetaStore(meta_dir)
+    assert len(store) == 4 and store.num_live == 2
+    assert new_id == removed[0]
+    assert store.rows_for_ids(np.asarray([new_id, removed[1]])).tolist() == [3, -1]
+    assert store.live.tolist() == [0, 0, 1, 1]
+
+
+def test_text_store_round_trip_and_append(tmp_path):
+    with TextStoreWriter(tmp_path) as writer:
+        for text in ["first chunk", "", "dritte Zeile é"]:
+            writer.append(text)
+    with TextStoreWriter(tmp_path, append=True) as writer:
+        writer.append("fourth")
+
+    store = TextStore(tmp_path)
+    assert len(store) == 4
+    assert [store[i] for i in range(4)] == ["first chunk", "", "dritte Zeile é", "fourth"]
+
+
+def test_text_store_append_drops_uncommitted_rows(tmp_path):
+    with TextStoreWriter(tmp_path) as writer:
+        writer.append("a")
+    # A save that crashed after its texts were published but before the meta store
+    with TextStoreWriter(tmp_path, append=True) as writer:
+        writer.append("orphan")
+    with TextStoreWriter(tmp_path, append=True, rows=1) as writer:
+        writer.append("b")
+
+    store = TextStore(tmp_path)
+    assert [store[i] for i in range(len(store))] == ["a", "b"]
+
+
+def test_text_store_readers_keep_their_snapshot(tmp_path):
+    with TextStoreWriter(tmp_path) as writer:
+        writer.append("old")
+    reader = TextStore(tmp_path)
+    with TextStoreWriter(tmp_path, append=True) as writer:
+        writer.append("new")
+    with TextStoreWriter(tmp_path) as writer:
+        writer.append("rebuilt")
+
+    assert len(reader) == 1 and reader[0] == "old"
+    assert TextStore(tmp_path)[0] == "rebuilt"
+    assert TextStore.open(tmp_path / "missing") is None
+
+
+def test_sentence_store_round_trip_and_append(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((6, 8)).astype(np.float32)
+    with SentenceStoreWriter(tmp_path) as writer:
+        writer.append(vectors[:2])
+        writer.append(np.zeros((0, 8), dtype=np.float32))
+    with SentenceStoreWriter(tmp_path, append=True) as writer:
+        writer.append(vectors[2:6])
+
+    store = SentenceStore(tmp_path)
+    assert len(store) == 3 and store.dim == 8
+    assert [store.count(r) for r in range(3)] == [2, 0, 4]
+    stacked, owners = store.vectors_for_rows([2, 0])
+    np.testing.assert_allclose(stacked, np.concatenate([vectors[2:6], vectors[:2]]), atol=1e-2)
+    assert owners.tolist() == [0, 0, 0, 0, 1, 1]
+
+
+def test_sentence_store_rejects_other_dims_and_can_be_removed(tmp_path):
+    with SentenceStoreWriter(tmp_path) as writer:
+        writer.append(np.ones((1, 4), dtype=np.float32))
+        with pytest.raises(ValueError):
+            writer.append(np.ones((1, 5), dtype=np.float32))
+    with SentenceStoreWriter(tmp_path, append=True) as writer:
+        writer.append(np.ones((2, 4), dtype=np.float32))
+
+    remove_sentence_store(tmp_path)
+    assert SentenceStore.open(tmp_path) is None
+    assert list(tmp_path.iterdir()) == []
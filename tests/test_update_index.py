@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("faiss")
+pytest.importorskip("sentence_transformers")
+
+from pipelines.processing import update_index
+from pipelines.processing.update_index import MutableIndex
+from pipelines.retrieval import segments
+from pipelines.retrieval.index_factory import DEFAULT_INDEX_CONFIG, build_index
+from pipelines.retrieval.meta_store import MetaStore, MetaStoreWriter
+from pipelines.retrieval.text_store import TextStore, TextStoreWriter
+
+CONFIG = {**DEFAULT_INDEX_CONFIG, "index_type": "flat", "sentences": {**DEFAULT_INDEX_CONFIG["sentences"], "enabled": False}}
+
+
+@pytest.fixture
+def faiss_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(update_index, "load_index_config", lambda: CONFIG)
+    # The manifest lives at a fixed path under data/
+    monkeypatch.setattr(update_index, "write_index_manifest", lambda **kwargs: None)
+
+    out = tmp_path / "faiss"
+    writer = MetaStoreWriter()
+    texts = []
+    for paper in ["p1", "p2", "p3"]:
+        for order in range(2):
+            writer.append(f"{paper}::sec::intro::chunk::{order}", paper, f"{paper}.pdf", "intro", order, fingerprint=paper)
+            texts.append(f"{paper} text {order}")
+    writer.write(out / "meta")
+
+    rng = np.random.default_rng(0)
+    emb = rng.standard_normal((len(texts), 8)).astype(np.float32)
+    emb /= np.linalg.norm(emb, axis=1, keepdims=True)
+    segments.atomic_save_npy(out / "vectors.npy", emb)
+    segments.publish_segments(out / "vectors.npy", len(emb), [])
+    with TextStoreWriter(out) as text_writer:
+        for text in texts:
+            text_writer.append(text)
+
+    index, _ = build_index(emb, CONFIG, ids=np.asarray(writer.ids, dtype=np.int64))
+    update_index.faiss.write_index(index, str(out / "index.faiss"))
+    return out
+
+
+def test_compact_saves_pending_removals(faiss_dir, tmp_path):
+    store = MutableIndex(faiss_dir, tmp_path / "cache")
+    assert store.remove_papers(["p2"]) == 2
+    store.compact()
+
+    meta = MetaStore(faiss_dir / "meta")
+    texts = TextStore(faiss_dir)
+    assert len(meta) == 4 and meta.num_live == 4
+    assert {meta[r]["paper_id"] for r in range(len(meta))} == {"p1", "p3"}
+    assert [texts[r] for r in range(len(texts))] == ["p1 text 0", "p1 text 1", "p3 text 0", "p3 text 1"]
+    assert update_index.faiss.read_index(str(faiss_dir / "index.faiss")).ntotal == 4
+
+
+def test_saved_removals_survive_reopen(faiss_dir, tmp_path):
+    store = MutableIndex(faiss_dir, tmp_path / "cache")
+    store.remove_papers(["p1"])
+    store.save({"op": "remove"})
+
+    reopened = MutableIndex(faiss_dir, tmp_path / "cache")
+    assert reopened.dead_fraction() == pytest.approx(2 / 6)
+    reopened.compact()
+    assert MetaStore(faiss_dir / "meta").num_live == 4
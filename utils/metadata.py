@@ -1,36 +1,145 @@
 import json
 import subprocess
+import threading
+from functools import lru_cache
 from pathlib import Path
+from typing import Optional, Tuple
 
 # Constants for System Identity
 PROMPT_VERSION = "v1_strict_scholar"
-GUARDRAIL_VERSION = "v1_heuristic_threshold"
+GUARDRAIL_VERSION = "v2_sentence_max_threshold"
+
+DATASET_MANIFEST_PATH = Path("data/versions/dataset_manifest.json")
 
 # UPDATED: Point to the new location defined in dvc.yaml
 INDEX_MANIFEST_PATH = Path("data/processed/faiss/index_manifest.json")
+LEGACY_INDEX_MANIFEST_PATH = Path("data/indexes/index_manifest.json")
 
+@lru_cache(maxsize=1)
 def get_git_commit() -> str:
-    """Returns the current short git commit hash."""
+    """Returns the current short git commit hash (resolved once per process)."""
     try:
         return subprocess.check_output(
-            ["git", "rev-parse", "--short", "HEAD"], 
+            ["git", "rev-parse", "--short", "HEAD"],
             text=True
         ).strip()
     except Exception:
         return "unknown"
 
+def _read_json(path: Path) -> Optional[dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _file_stamp(path: Path) -> Optional[Tuple[int, int]]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class IdentitySnapshot:
+    """
+    Immutable view of the lineage identity attached to every answer and run.
+    """
+    __slots__ = ("dataset_hash", "index_hash", "index_dataset_hash", "git_commit")
+
+    def __init__(self, dataset_hash: str, index_hash: str, index_dataset_hash: Optional[str], git_commit: str):
+        self.dataset_hash = dataset_hash
+        self.index_hash = index_hash
+        self.index_dataset_hash = index_dataset_hash
+        self.git_commit = git_commit
+
+    def as_tags(self) -> dict:
+        return {
+            "dataset_hash": self.dataset_hash,
+            "index_hash": self.index_hash,
+            "prompt_version": PROMPT_VERSION,
+            "guardrail_version": GUARDRAIL_VERSION,
+            "git_commit": self.git_commit,
+        }
+
+
+class IdentityService:
+    """
+    Loads the dataset/index identity from their manifests once and serves it
+    from memory. The manifests are only re-read when their mtime/size change,
+    so the per-request cost is two stat() calls instead of rehashing the corpus.
+    """
+
+    def __init__(
+        self,
+        dataset_manifest: Path = DATASET_MANIFEST_PATH,
+        index_manifest: Path = INDEX_MANIFEST_PATH,
+        legacy_index_manifest: Path = LEGACY_INDEX_MANIFEST_PATH,
+    ):
+        self.dataset_manifest = dataset_manifest
+        self.index_manifest = index_manifest
+        self.legacy_index_manifest = legacy_index_manifest
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._snapshot: Optional[IdentitySnapshot] = None
+
+    def _index_manifest_path(self) -> Path:
+        if self.index_manifest.exists() or not self.legacy_index_manifest.exists():
+            return self.index_manifest
+        # Fallback to the old location just in case
+        return self.legacy_index_manifest
+
+    def _current_stamp(self):
+        index_path = self._index_manifest_path()
+        return (
+            _file_stamp(self.dataset_manifest),
+            str(index_path),
+            _file_stamp(index_path),
+        )
+
+    def _load(self, index_path: Path) -> IdentitySnapshot:
+        dataset = _read_json(self.dataset_manifest) or {}
+        index = _read_json(index_path) or {}
+        lineage = index.get("dataset_lineage", {})
+
+        return IdentitySnapshot(
+            dataset_hash=dataset.get("dataset_hash", "unknown"),
+            index_hash=index.get("artifact_hash", "unknown"),
+            index_dataset_hash=lineage.get("dataset_hash") or index.get("dataset_hash"),
+            git_commit=get_git_commit(),
+        )
+
+    def get(self) -> IdentitySnapshot:
+        """Returns the current snapshot, reloading only if a manifest changed."""
+        stamp = self._current_stamp()
+        snapshot = self._snapshot
+        if snapshot is not None and stamp == self._stamp:
+            return snapshot
+
+        with self._lock:
+            if self._snapshot is None or stamp != self._stamp:
+                self._snapshot = self._load(Path(stamp[1]))
+                self._stamp = stamp
+            return self._snapshot
+
+    def refresh(self) -> IdentitySnapshot:
+        """Forces a reload on the next access and returns the fresh snapshot."""
+        with self._lock:
+            self._stamp = None
+            self._snapshot = None
+        return self.get()
+
+
+identity = IdentityService()
+
+def get_identity() -> IdentitySnapshot:
+    """Returns the process-wide identity snapshot."""
+    return identity.get()
+
+def get_dataset_hash() -> str:
+    """Retrieves the canonical dataset hash from the dataset manifest."""
+    return identity.get().dataset_hash
+
 def get_index_hash() -> str:
     """Retrieves the artifact hash from the FAISS index manifest."""
-    if not INDEX_MANIFEST_PATH.exists():
-        # Fallback to check if the file exists in the old location just in case
-        old_path = Path("data/indexes/index_manifest.json")
-        if old_path.exists():
-             with open(old_path, "r") as f:
-                data = json.load(f)
-                return data.get("artifact_hash", "unknown")
-        
-        return "unknown"
-        
-    with open(INDEX_MANIFEST_PATH, "r") as f:
-        data = json.load(f)
-    return data.get("artifact_hash", "unknown")
\ No newline at end of file
+    return identity.get().index_hash
@@ -2,6 +2,7 @@ import mlflow
 from typing import Dict, Any, Optional
 from contextlib import contextmanager
 from utils.mlflow_schema import validate_run_structure, RunType
+from utils.mlflow_queue import get_run_log_queue
 
 class MLflowHandler:
     """
@@ -67,6 +68,24 @@ class MLflowHandler:
         
         mlflow.log_metrics(metrics)
 
+    @staticmethod
+    def submit_run(
+        run_name: str,
+        run_type: RunType,
+        tags: Dict[str, Any],
+        metrics: Dict[str, float],
+        params: Optional[Dict[str, Any]] = None,
+        priority: bool = False
+    ) -> Optional[str]:
+        """
+        Validates a complete run now and writes it in the background
+        (utils/mlflow_queue.py). Use on request paths instead of start_run.
+        
+        Returns:
+            The run's log_record_id tag, or None if it was sampled out / shed.
+        """
+        return get_run_log_queue().submit(run_name, run_type, tags, metrics, params, priority=priority)
+
     @staticmethod
     def log_params(params: Dict[str, Any]):
         """
@@ -0,0 +1,330 @@
+"""
+Background MLflow run logging
+-----------------------------
+Per-query runs are validated against utils/mlflow_schema.py when they are
+submitted, then buffered and written by a single daemon thread, so the
+request path never touches the tracking store. MLflow has no multi-run
+write call: each run is still one create_run, one log_batch (metrics +
+params) and one set_terminated call; buffering only moves those calls off
+the request path and lets the writer wake once per flush.
+
+The id returned to callers is a local log record id, stored on the run as
+the log_record_id tag; the MLflow run id only exists once the writer has
+created the run.
+
+Under pressure the queue degrades instead of blocking:
+- sample_rate: only this share of non-priority runs (answers) is kept
+- shed_at: past this fill ratio only priority runs (refusals) are accepted
+- a full queue drops the run and counts it
+Runs that fail to write are appended to a local JSONL spill file and
+replayed the next time the writer starts. A spilled record keeps the run
+id and the steps already done, so a replay finishes a half-written run
+instead of creating a second one.
+"""
+
+import os
+import json
+import time
+import uuid
+import atexit
+import random
+import logging
+import threading
+import queue
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from utils.logging import setup_logger, log_event
+from utils.helper_functions import load_yaml
+from utils.mlflow_schema import RunType, validate_run_structure
+
+# Defaults for params.yaml -> tracking
+DEFAULT_TRACKING_CONFIG = {
+    "async": True,              # false = write each run inline (old behaviour)
+    "queue_size": 10000,        # buffered runs before new ones are dropped
+    "flush_interval_sec": 2.0,  # max time a run waits in the buffer
+    "flush_batch": 200,         # max runs taken off the queue per wakeup (still written one by one)
+    "sample_rate": 1.0,         # share of non-priority runs kept
+    "shed_at": 0.8,             # queue fill ratio above which only priority runs are kept
+    "experiment": None,         # experiment name for runs outside an active run (None = default)
+}
+
+SPILL_PATH = Path("logs/mlflow_spill.jsonl")
+
+# Tag carrying the id returned to callers, since the MLflow run id only exists after the flush
+RECORD_ID_TAG = "log_record_id"
+
+def load_tracking_config(params_path: str = "params.yaml") -> dict:
+    try:
+        params = load_yaml(params_path) or {}
+    except FileNotFoundError:
+        params = {}
+    return {**DEFAULT_TRACKING_CONFIG, **(params.get("tracking") or {})}
+
+def _experiment_name(configured: Optional[str]) -> Optional[str]:
+    # Same environment variable the fluent API honours, then params.yaml
+    return os.environ.get("MLFLOW_EXPERIMENT_NAME") or configured
+
+
+class RunLogQueue:
+    """
+    Buffers validated run records and writes them to MLflow from a daemon
+    thread (one create_run / log_batch / set_terminated per run).
+    """
+
+    def __init__(self, config: Optional[dict] = None, spill_path: Path = SPILL_PATH):
+        cfg = config or load_tracking_config()
+        self.enabled = bool(cfg["async"])
+        self.capacity = int(cfg["queue_size"])
+        self.flush_interval = float(cfg["flush_interval_sec"])
+        self.flush_batch = int(cfg["flush_batch"])
+        self.sample_rate = float(cfg["sample_rate"])
+        self.shed_at = float(cfg["shed_at"])
+        self.experiment = _experiment_name(cfg.get("experiment"))
+        self.spill_path = spill_path
+        self.logger = setup_logger(name="MLflow_Queue", log_dir="logs", level=logging.INFO)
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=self.capacity)
+        self._lock = threading.Lock()
+        self._client = None
+        self._experiment_ids: Dict[str, str] = {}
+        self.counters = {"submitted": 0, "logged": 0, "sampled_out": 0, "shed": 0, "dropped": 0, "failed": 0, "spilled": 0}
+
+        self._thread = None
+        if self.enabled:
+            self._thread = threading.Thread(target=self._run, daemon=True, name="mlflow-logger")
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _count(self, key: str, n: int = 1):
+        with self._lock:
+            self.counters[key] += n
+
+    def submit(
+        self,
+        run_name: str,
+        run_type: RunType,
+        tags: Dict[str, Any],
+        metrics: Dict[str, float],
+        params: Optional[Dict[str, Any]] = None,
+        priority: bool = False
+    ) -> Optional[str]:
+        '''
+        Validates a run and queues it for writing.
+        Args:
+            run_name (str): MLflow run name.
+            run_type (RunType): Schema the tags / metrics are checked against.
+            tags (dict): Lineage tags; must include all REQUIRED_TAGS.
+            metrics (dict): Metrics allowed for run_type.
+            params (dict, optional): Run params.
+            priority (bool): Exempt from sampling and load shedding (e.g. refusals).
+        Returns:
+            str: Record id (also stored as the log_record_id tag), or None if
+            the run was sampled out or shed.
+        Raises:
+            SchemaViolationError: If tags or metrics break the schema.
+        '''
+        all_tags = {**tags, "run_type": run_type.value}
+        validate_run_structure(all_tags, metrics)
+        self._count("submitted")
+
+        if not priority and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            self._count("sampled_out")
+            return None
+        if not priority and self.enabled and self._queue.qsize() >= self.shed_at * self.capacity:
+            self._count("shed")
+            return None
+
+        import mlflow
+        active = mlflow.active_run()
+        record_id = uuid.uuid4().hex
+        record = {
+            "record_id": record_id,
+            "run_name": run_name,
+            # Runs nest under the caller's active run; otherwise the writer resolves the experiment
+            "experiment_id": active.info.experiment_id if active is not None else os.environ.get("MLFLOW_EXPERIMENT_ID"),
+            "experiment_name": self.experiment,
+            "parent_run_id": active.info.run_id if active is not None else None,
+            "tags": {k: str(v) for k, v in all_tags.items()},
+            "metrics": {k: float(v) for k, v in metrics.items()},
+            "params": {k: str(v) for k, v in (params or {}).items()},
+            "timestamp_ms": int(time.time() * 1000),
+        }
+
+        if not self.enabled:
+            self._write([record])
+            return record_id
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self._count("dropped")
+            return None
+        return record_id
+
+    def _get_client(self):
+        if self._client is None:
+            from mlflow.tracking import MlflowClient
+            self._client = MlflowClient()
+        return self._client
+
+    def _experiment_id(self, record: dict) -> str:
+        if record.get("experiment_id"):
+            return record["experiment_id"]
+        name = record.get("experiment_name")
+        if not name:
+            return "0"
+        if name not in self._experiment_ids:
+            import mlflow
+            experiment = mlflow.get_experiment_by_name(name)
+            experiment_id = experiment.experiment_id if experiment is not None else self._get_client().create_experiment(name)
+            self._experiment_ids[name] = experiment_id
+        return self._experiment_ids[name]
+
+    def _find_run(self, record: dict) -> Optional[str]:
+        # A create_run that failed client-side may still have created the run
+        runs = self._get_client().search_runs(
+            [self._experiment_id(record)],
+            filter_string=f"tags.{RECORD_ID_TAG} = '{record['record_id']}'",
+            max_results=1
+        )
+        return runs[0].info.run_id if runs else None
+
+    def _write_one(self, record: dict, resume: bool = False):
+        '''
+        Writes one run. Progress (run_id, then "batch_logged") is recorded on
+        the record, so if it is spilled a replay resumes where this stopped.
+        '''
+        from mlflow.entities import Metric, Param
+        client = self._get_client()
+        if not record.get("run_id") and resume:
+            record["run_id"] = self._find_run(record)
+        if not record.get("run_id"):
+            tags = {**record["tags"], RECORD_ID_TAG: record["record_id"]}
+            if record["parent_run_id"]:
+                tags["mlflow.parentRunId"] = record["parent_run_id"]
+            run = client.create_run(
+                experiment_id=self._experiment_id(record),
+                start_time=record["timestamp_ms"],
+                tags=tags,
+                run_name=record["run_name"]
+            )
+            record["run_id"] = run.info.run_id
+        if not record.get("batch_logged"):
+            client.log_batch(
+                record["run_id"],
+                metrics=[Metric(k, v, record["timestamp_ms"], 0) for k, v in record["metrics"].items()],
+                params=[Param(k, v) for k, v in record["params"].items()]
+            )
+            record["batch_logged"] = True
+        client.set_terminated(record["run_id"], end_time=record["timestamp_ms"])
+
+    def _write(self, records: List[dict], resume: bool = False):
+        failed = []
+        for record in records:
+            try:
+                self._write_one(record, resume=resume)
+            except Exception as e:
+                failed.append(record)
+                error = str(e)
+        self._count("logged", len(records) - len(failed))
+        if failed:
+            self._count("failed", len(failed))
+            self._spill(failed)
+            log_event(logger=self.logger, level=logging.WARNING, message="MLflow Runs Not Written", runs=len(failed), error=error)
+
+    def _spill(self, records: List[dict]):
+        try:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.spill_path.open("a", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record) + "\n")
+            self._count("spilled", len(records))
+        except OSError as e:
+            log_event(logger=self.logger, level=logging.ERROR, message="MLflow Spill Failed", runs=len(records), error=str(e))
+
+    def replay_spill(self) -> int:
+        '''
+        Re-writes runs left in the spill file by earlier failures.
+        Returns:
+            int: Number of runs replayed.
+        '''
+        if not self.spill_path.exists():
+            return 0
+        pending = self.spill_path.with_suffix(".replaying")
+        self.spill_path.replace(pending)
+        with pending.open("r", encoding="utf-8") as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        pending.unlink()
+        # Failures go back to the spill file
+        self._write(records, resume=True)
+        log_event(logger=self.logger, level=logging.INFO, message="MLflow Spill Replayed", runs=len(records))
+        return len(records)
+
+    def _drain(self, first: dict) -> List[dict]:
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        try:
+            self.replay_spill()
+        except Exception as e:
+            log_event(logger=self.logger, level=logging.WARNING, message="MLflow Spill Replay Failed", error=str(e))
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            self._write(self._drain(item))
+
+    def stats(self) -> dict:
+        with self._lock:
+            counters = dict(self.counters)
+        return {**counters, "mode": "async" if self.enabled else "sync", "queued": self._queue.qsize(), "capacity": self.capacity}
+
+    def close(self, timeout: float = 10.0):
+        '''
+        Flushes what is buffered (bounded by timeout) and stops the writer.
+        '''
+        if self._thread is None:
+            return
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(None, timeout=timeout)
+            self._thread.join(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Full:
+            # The writer is stuck (e.g. on a slow tracking server); what is queued is spilled below
+            pass
+        self._thread = None
+        leftover = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                leftover.append(item)
+        if leftover:
+            self._spill(leftover)
+
+
+_run_log_queue: Optional[RunLogQueue] = None
+_run_log_queue_lock = threading.Lock()
+
+def get_run_log_queue() -> RunLogQueue:
+    # One writer per process
+    global _run_log_queue
+    if _run_log_queue is None:
+        with _run_log_queue_lock:
+            if _run_log_queue is None:
+                _run_log_queue = RunLogQueue()
+    return _run_log_queue